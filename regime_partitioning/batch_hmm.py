@@ -0,0 +1,395 @@
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Tuple
+
+import numpy as np
+import pandas as pd
+from sklearn import cluster
+from sklearn.utils import check_random_state
+
+from .hmm_kernels import HAVE_NUMBA, _backward, _forward_scaled
+from .hmm_kernels import _posteriors, _viterbi, _xi_sum, numba
+from .hmm_kernels import _log_emissions as _log_emissions_row
+
+# -------------------------
+# Batched diagonal-Gaussian HMM (many independent sequences at once)
+# -------------------------
+# Sequences are stacked into (batch x time x feature) arrays, left-aligned and
+# padded at the end. Padded steps get an emission likelihood of 1, which leaves
+# the forward normaliser, the backward messages and the log-likelihood of the
+# real steps unchanged; they are masked out of every sufficient statistic.
+# With numba, the E-step, forward-backward and Viterbi instead run the
+# compiled per-sequence kernels of `hmm_kernels` over each row's real steps,
+# and the E-step returns the sufficient statistics without the (B, T, K)
+# posteriors.
+
+
+@dataclass
+class BatchedHMMParams:
+    startprob: np.ndarray  # (B, K)
+    transmat: np.ndarray  # (B, K, K)
+    means: np.ndarray  # (B, K, D)
+    covars: np.ndarray  # (B, K, D) diagonal variances
+    loglik: np.ndarray  # (B,)
+    n_iter: np.ndarray  # (B,) EM iterations run per sequence
+
+    def take(self, idx) -> "BatchedHMMParams":
+        return BatchedHMMParams(
+            self.startprob[idx],
+            self.transmat[idx],
+            self.means[idx],
+            self.covars[idx],
+            self.loglik[idx],
+            self.n_iter[idx],
+        )
+
+
+def stack_features(
+    frames: Mapping[str, pd.DataFrame],
+    cols=("ret", "rv_20d"),
+    standardize=True,
+) -> Tuple[np.ndarray, np.ndarray, List[str], List[pd.Index]]:
+    """Stack per-symbol feature frames into padded (B, T, D) arrays.
+
+    Rows with NaNs are dropped per symbol (as `fit_2state_hmm` does). With
+    `standardize`, each symbol is z-scored on its own rows (population std,
+    matching StandardScaler). Raises ValueError if a symbol has no rows left.
+    """
+    keys = list(frames)
+    blocks = [frames[k].loc[:, list(cols)].dropna().astype(float) for k in keys]
+    empty = [k for k, b in zip(keys, blocks) if b.empty]
+    if empty:
+        raise ValueError(f"No complete rows of {list(cols)} for {empty}")
+    lengths = np.array([len(b) for b in blocks])
+    B, T, D = len(blocks), int(lengths.max(initial=0)), len(cols)
+    X = np.zeros((B, T, D))
+    mask = np.arange(T)[None, :] < lengths[:, None]
+    for i, b in enumerate(blocks):
+        x = b.to_numpy()
+        if standardize and len(x):
+            scale = x.std(axis=0)
+            x = (x - x.mean(axis=0)) / np.where(scale > 0, scale, 1.0)
+        X[i, : len(x)] = x
+    return X, mask, keys, [b.index for b in blocks]
+
+
+def _log_emissions(X, means, covars):
+    """(B, T, K) diagonal-Gaussian log densities."""
+    diff = X[:, :, None, :] - means[:, None, :, :]
+    return -0.5 * (
+        np.log(2.0 * np.pi * covars)[:, None, :, :] + diff**2 / covars[:, None, :, :]
+    ).sum(axis=-1)
+
+
+def _forward_backward_np(log_b, mask, startprob, transmat):
+    """Scaled forward-backward over the batch.
+
+    Returns (gamma (B,T,K), xi_sum (B,K,K), loglik (B,)).
+    """
+    B, T, K = log_b.shape
+    log_b = np.where(mask[:, :, None], log_b, 0.0)
+    shift = log_b.max(axis=2, keepdims=True)
+    # Time-major copies keep every per-step slice contiguous
+    b = np.ascontiguousarray(np.exp(log_b - shift).transpose(1, 0, 2))
+    live = np.ascontiguousarray(mask.T[:, :, None], dtype=float)
+
+    alpha = np.empty((T, B, K))
+    scale = np.empty((T, B, 1))
+    a = startprob * b[0]
+    scale[0] = a.sum(axis=1, keepdims=True)
+    alpha[0] = a / scale[0]
+    for t in range(1, T):
+        a = np.matmul(alpha[t - 1, :, None, :], transmat)[:, 0] * b[t]
+        scale[t] = a.sum(axis=1, keepdims=True)
+        np.divide(a, scale[t], out=alpha[t])
+
+    # w_t = b_t * beta_t / c_t, so beta_{t-1} = A w_t and
+    # xi_{t-1}(i, j) = alpha_{t-1}(i) A_ij w_t(j)
+    wb = b / scale
+    beta = np.empty((T, B, K))
+    beta[T - 1] = 1.0
+    for t in range(T - 1, 0, -1):
+        np.multiply(wb[t], beta[t], out=wb[t])
+        beta[t - 1] = np.matmul(transmat, wb[t, :, :, None])[:, :, 0]
+    xi_sum = np.einsum("tbi,tbj->bij", alpha[:-1] * live[1:], wb[1:]) * transmat
+    gamma = alpha * beta
+
+    gamma /= gamma.sum(axis=2, keepdims=True)
+    gamma = gamma.transpose(1, 0, 2) * mask[:, :, None]
+    loglik = (np.log(scale[:, :, 0].T) * mask).sum(axis=1)
+    loglik += (shift[:, :, 0] * mask).sum(axis=1)
+    return gamma, xi_sum, loglik
+
+
+def _forward_backward_loop(log_b, lengths, startprob, transmat):
+    B, T, K = log_b.shape
+    gamma = np.zeros((B, T, K))
+    xi_sum = np.zeros((B, K, K))
+    loglik = np.zeros(B)
+    for i in range(B):
+        n = lengths[i]
+        alpha, b, scale, shift = _forward_scaled(
+            log_b[i, :n], startprob[i], transmat[i]
+        )
+        beta = _backward(b, scale, transmat[i])
+        gamma[i, :n] = _posteriors(alpha, beta)
+        if n > 1:
+            xi_sum[i] = _xi_sum(alpha, beta, b, scale, transmat[i])
+        loglik[i] = np.log(scale).sum() + shift.sum()
+    return gamma, xi_sum, loglik
+
+
+def _estep_loop(X, lengths, startprob, transmat, means, covars):
+    B, T, D = X.shape
+    K = means.shape[1]
+    start = np.zeros((B, K))
+    xi_sum = np.zeros((B, K, K))
+    post = np.zeros((B, K))
+    obs = np.zeros((B, K, D))
+    obs2 = np.zeros((B, K, D))
+    loglik = np.zeros(B)
+    for i in range(B):
+        n = lengths[i]
+        x = X[i, :n]
+        log_b = _log_emissions_row(x, means[i], covars[i])
+        alpha, b, scale, shift = _forward_scaled(log_b, startprob[i], transmat[i])
+        beta = _backward(b, scale, transmat[i])
+        gamma = _posteriors(alpha, beta)
+        if n > 1:
+            xi_sum[i] = _xi_sum(alpha, beta, b, scale, transmat[i])
+        loglik[i] = np.log(scale).sum() + shift.sum()
+        start[i] = gamma[0]
+        for t in range(n):
+            for k in range(K):
+                g = gamma[t, k]
+                post[i, k] += g
+                for d in range(D):
+                    obs[i, k, d] += g * x[t, d]
+                    obs2[i, k, d] += g * x[t, d] * x[t, d]
+    return start, xi_sum, post, obs, obs2, loglik
+
+
+def _viterbi_loop(log_b, lengths, log_startprob, log_transmat):
+    B, T, K = log_b.shape
+    path = np.empty((B, T), dtype=np.int8)
+    for i in range(B):
+        n = lengths[i]
+        _, p = _viterbi(log_b[i, :n], log_startprob[i], log_transmat[i])
+        path[i, :n] = p
+        path[i, n:] = p[n - 1]
+    return path
+
+
+if HAVE_NUMBA:
+    _forward_backward_rows = numba.njit(cache=True)(_forward_backward_loop)
+    _viterbi_rows = numba.njit(cache=True)(_viterbi_loop)
+    _estep_rows = numba.njit(cache=True)(_estep_loop)
+
+
+def _forward_backward(log_b, mask, startprob, transmat):
+    """Returns (gamma (B,T,K), xi_sum (B,K,K), loglik (B,)); gamma is 0 on
+    padded steps."""
+    if not HAVE_NUMBA:
+        return _forward_backward_np(log_b, mask, startprob, transmat)
+    return _forward_backward_rows(
+        np.ascontiguousarray(log_b),
+        mask.sum(axis=1),
+        np.ascontiguousarray(startprob),
+        np.ascontiguousarray(transmat),
+    )
+
+
+def _estep(X, mask, startprob, transmat, means, covars):
+    """Baum-Welch sufficient statistics per row: (gamma_0 (B,K), xi_sum
+    (B,K,K), sum_t gamma (B,K), sum_t gamma x and gamma x^2 (B,K,D), loglik
+    (B,))."""
+    if HAVE_NUMBA:
+        return _estep_rows(
+            np.ascontiguousarray(X),
+            mask.sum(axis=1),
+            np.ascontiguousarray(startprob),
+            np.ascontiguousarray(transmat),
+            np.ascontiguousarray(means),
+            np.ascontiguousarray(covars),
+        )
+    gamma, xi_sum, loglik = _forward_backward_np(
+        _log_emissions(X, means, covars), mask, startprob, transmat
+    )
+    return (
+        gamma[:, 0],
+        xi_sum,
+        gamma.sum(axis=1),
+        np.einsum("btk,btd->bkd", gamma, X),
+        np.einsum("btk,btd->bkd", gamma, X**2),
+        loglik,
+    )
+
+
+def _init_params(X, mask, n_states, seeds, min_covar):
+    """hmmlearn's GaussianHMM start per row: Dirichlet start/transition draws
+    and k-means means from `check_random_state(seed)`, data variance (ddof 1)
+    plus `min_covar`."""
+    B, T, D = X.shape
+    startprob = np.empty((B, n_states))
+    transmat = np.empty((B, n_states, n_states))
+    means = np.empty((B, n_states, D))
+    covars = np.empty((B, n_states, D))
+    alpha = np.full(n_states, 1.0 / n_states)
+    for i, seed in enumerate(seeds):
+        x = X[i, mask[i]]
+        rng = check_random_state(int(seed))
+        startprob[i] = rng.dirichlet(alpha)
+        transmat[i] = rng.dirichlet(alpha, size=n_states)
+        kmeans = cluster.KMeans(n_clusters=n_states, random_state=int(seed), n_init=10)
+        means[i] = kmeans.fit(x).cluster_centers_
+        covars[i] = np.var(x, axis=0, ddof=1) + min_covar
+    return startprob, transmat, means, covars
+
+
+def _em(X, mask, startprob, transmat, means, covars, max_iter, tol, covars_prior):
+    """Baum-Welch with hmmlearn's M-step (unit start/transition priors,
+    `covars_prior` on the diagonal variances) and convergence rule: a row
+    stops once its log-likelihood gains less than `tol`, after the M-step of
+    that iteration."""
+    B = X.shape[0]
+    startprob, transmat = startprob.copy(), transmat.copy()
+    means, covars = means.copy(), covars.copy()
+    prev = np.full(B, -np.inf)
+    n_iter = np.zeros(B, dtype=int)
+    # Rows still iterating; converged rows drop out of the batch
+    act = np.arange(B)
+    for _ in range(max_iter):
+        gamma0, xi_sum, post, obs, obs2, ll = _estep(
+            X[act], mask[act], startprob[act], transmat[act], means[act], covars[act]
+        )
+        n_iter[act] += 1
+
+        start = np.where(startprob[act] == 0, 0.0, gamma0)
+        startprob[act] = start / start.sum(axis=1, keepdims=True)
+        trans = np.where(transmat[act] == 0, 0.0, xi_sum)
+        rows = trans.sum(axis=2, keepdims=True)
+        transmat[act] = trans / np.where(rows == 0, 1.0, rows)
+        post = post[:, :, None]
+        mu = obs / post
+        c_n = obs2 - 2 * mu * obs + mu**2 * post
+        means[act] = mu
+        covars[act] = (covars_prior + c_n) / np.maximum(post, 1e-5)
+
+        running = ll - prev[act] >= tol
+        prev[act] = ll
+        act = act[running]
+        if len(act) == 0:
+            break
+    # Log-likelihood under the final parameters, as `score` reports it
+    loglik = _estep(X, mask, startprob, transmat, means, covars)[-1]
+    return BatchedHMMParams(startprob, transmat, means, covars, loglik, n_iter)
+
+
+def fit_batched_hmm(
+    X: np.ndarray,
+    mask: np.ndarray,
+    n_states=2,
+    n_init=10,
+    max_iter=200,
+    tol=1e-4,
+    random_state=0,
+    min_covar=1e-3,
+    covars_prior=1e-2,
+) -> BatchedHMMParams:
+    """Fit one diagonal-Gaussian HMM per sequence; restarts run as extra batch rows.
+
+    Restart `r` of every sequence is seeded with `random_state + r` and
+    starts and iterates as `GaussianHMM(covariance_type="diag",
+    random_state=random_state + r)` with the same `min_covar` and
+    `covars_prior` would, so the kept restart (highest log-likelihood)
+    matches `fit_2state_hmm` up to floating-point rounding.
+    """
+    B = X.shape[0]
+    if not mask.any(axis=1).all():
+        raise ValueError("Every sequence needs at least one observation")
+    Xr = np.repeat(X, n_init, axis=0)
+    mr = np.repeat(mask, n_init, axis=0)
+    seeds = np.tile(random_state + np.arange(n_init), B)
+    init = _init_params(Xr, mr, n_states, seeds, min_covar)
+    fitted = _em(Xr, mr, *init, max_iter=max_iter, tol=tol, covars_prior=covars_prior)
+    best = fitted.loglik.reshape(B, n_init).argmax(axis=1)
+    return fitted.take(np.arange(B) * n_init + best)
+
+
+def batched_posteriors(params: BatchedHMMParams, X, mask):
+    """Smoothed state posteriors (B, T, K) and per-sequence log-likelihoods."""
+    gamma, _, loglik = _forward_backward(
+        _log_emissions(X, params.means, params.covars),
+        mask,
+        params.startprob,
+        params.transmat,
+    )
+    return gamma, loglik
+
+
+def batched_viterbi(params: BatchedHMMParams, X, mask) -> np.ndarray:
+    """MAP state paths (B, T); padded steps carry the last real state."""
+    log_b = _log_emissions(X, params.means, params.covars)
+    B, T, K = log_b.shape
+    with np.errstate(divide="ignore"):
+        log_a = np.log(params.transmat)
+        if HAVE_NUMBA:
+            return _viterbi_rows(
+                log_b, mask.sum(axis=1), np.log(params.startprob), log_a
+            )
+        delta = np.log(params.startprob) + log_b[:, 0]
+    back = np.empty((B, T, K), dtype=np.int8)
+    back[:, 0] = np.arange(K)
+    keep = np.broadcast_to(np.arange(K), (B, K))
+    for t in range(1, T):
+        cand = delta[:, :, None] + log_a
+        arg = cand.argmax(axis=1)
+        step = np.take_along_axis(cand, arg[:, None, :], axis=1)[:, 0] + log_b[:, t]
+        live = mask[:, t, None]
+        delta = np.where(live, step, delta)
+        back[:, t] = np.where(live, arg, keep)
+    path = np.empty((B, T), dtype=np.int8)
+    path[:, T - 1] = delta.argmax(axis=1)
+    for t in range(T - 1, 0, -1):
+        path[:, t - 1] = np.take_along_axis(back[:, t], path[:, t, None], axis=1)[:, 0]
+    return path
+
+
+def label_regimes_batched(
+    frames: Mapping[str, pd.DataFrame],
+    cols=("ret", "rv_20d"),
+    n_states=2,
+    n_init=10,
+    max_iter=200,
+    random_state=0,
+) -> Tuple[BatchedHMMParams, Dict[str, pd.DataFrame]]:
+    """Batched counterpart of `fit_2state_hmm` over many symbols.
+
+    `frames` maps a key (symbol, bootstrap id, ...) to a frame holding `cols`.
+    Returns the stacked parameters (rows in `frames` order) and, per key, a
+    frame with `state`, `p_state0..`, and the risk_on/risk_off `regime` label.
+    """
+    X, mask, keys, indices = stack_features(frames, cols)
+    params = fit_batched_hmm(
+        X,
+        mask,
+        n_states=n_states,
+        n_init=n_init,
+        max_iter=max_iter,
+        random_state=random_state,
+    )
+    gamma, _ = batched_posteriors(params, X, mask)
+    paths = batched_viterbi(params, X, mask)
+
+    out = {}
+    for i, key in enumerate(keys):
+        n = len(indices[i])
+        df = frames[key].loc[indices[i], list(cols)].copy()
+        df["state"] = paths[i, :n].astype(int)
+        for k in range(n_states):
+            df[f"p_state{k}"] = gamma[i, :n, k]
+        # Same labelling rule as fit_2state_hmm: risk-on = lower rv, higher ret
+        mu = params.means[i]
+        risk_on = int((mu[0, 1] < mu[1, 1]) and (mu[0, 0] > mu[1, 0]))
+        df["regime"] = np.where(df["state"] == risk_on, "risk_on", "risk_off")
+        out[key] = df
+    return params, out
@@ -19,3 +19,8 @@ forex_minors_countries = [
     "Hong Kong",
     "Singapore",
 ]
+
+# Price source used by regime_partitioning.price_sources
+# ("trading_utils", "csv" or "synthetic"); REGIME_PRICE_SOURCE overrides it.
+PRICE_SOURCE = "trading_utils"
+PRICE_DATA_DIR = "data/prices"
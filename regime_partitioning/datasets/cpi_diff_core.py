@@ -22,15 +22,20 @@ def to_monthly(df, date_col="period", value_col=None):
     return s
 
 
-def cpi_diff_core(df_home, df_foreign, date_col="period", value_col=None):
-    """coreCPI_YoY_home − coreCPI_YoY_foreign (BASE - QUOTE), monthly index."""
-    s_h = to_monthly(df_home, date_col, value_col)
-    s_f = to_monthly(df_foreign, date_col, value_col)
+def monthly_diff(s_h, s_f):
+    """Differential of two `to_monthly` legs on their common months."""
     diff = (pd.concat([s_h.rename("home"), s_f.rename("foreign")], axis=1)
               .dropna()
               .eval("home - foreign"))
     diff.name = "cpi_diff_core"
-    return diff  # monthly Series
+    return diff
+
+
+def cpi_diff_core(df_home, df_foreign, date_col="period", value_col=None):
+    """coreCPI_YoY_home − coreCPI_YoY_foreign (BASE - QUOTE), monthly index."""
+    s_h = to_monthly(df_home, date_col, value_col)
+    s_f = to_monthly(df_foreign, date_col, value_col)
+    return monthly_diff(s_h, s_f)  # monthly Series
 
 
 def expand_to_daily_month_end(s_monthly):
@@ -0,0 +1,158 @@
+import numpy as np
+
+from ..feature_registry import FeatureBuilder, FeatureRegistry
+from ..price_sources import get_forex_data_by_pair
+from ..volatility import range_volatility
+from .cpi_diff_core import (
+    aus_cpi,
+    can_cpi,
+    che_cpi,
+    eur_cpi,
+    gbr_cpi,
+    jpn_cpi,
+    monthly_diff,
+    nzd_cpi,
+    to_monthly,
+    usa_cpi,
+)
+from .rate_diff_2y import (
+    aus_2y_yield,
+    eur_2y_yield,
+    jpy_2y_yield,
+    nz_2y_yield,
+    usd_2y_yield,
+    yield_diff,
+    yield_series,
+)
+
+# -------------------------
+# FX feature graph
+# -------------------------
+# Pair features hang off the pair's daily bars; macro differentials are
+# BASE - QUOTE of per-currency legs, so each leg is cleaned once per builder
+# however many pairs use it. A new feature (10y differential, curve slope,
+# VIX, ...) is one registered function naming its inputs.
+
+FX_PAIRS = (
+    "EURUSD",
+    "USDJPY",
+    "AUDUSD",
+    "NZDUSD",
+    "EURJPY",
+    "EURAUD",
+    "EURNZD",
+    "AUDJPY",
+    "NZDJPY",
+    "AUDNZD",
+)
+
+# Raw per-currency inputs, as loaded by the submodules
+YIELDS_2Y = {
+    "USD": usd_2y_yield,
+    "EUR": eur_2y_yield,
+    "JPY": jpy_2y_yield,
+    "AUD": aus_2y_yield,
+    "NZD": nz_2y_yield,
+}
+CORE_CPI = {
+    "USD": usa_cpi,
+    "JPY": jpn_cpi,
+    "GBP": gbr_cpi,
+    "CAD": can_cpi,
+    "CHF": che_cpi,
+    "EUR": eur_cpi,  # synthetic
+    "AUD": aus_cpi,  # synthetic
+    "NZD": nzd_cpi,  # synthetic
+}
+
+FX_FEATURES = FeatureRegistry()
+
+
+def _leg(table, ctx, what):
+    try:
+        return table[ctx.key]
+    except KeyError:
+        raise KeyError(f"No {what} data for {ctx.key}") from None
+
+
+@FX_FEATURES.register("bars")
+def _bars(ctx):
+    """Daily OHLC bars of the pair, sorted by date."""
+    df = get_forex_data_by_pair(
+        symbol=ctx.key,
+        start_date=ctx.start_date,
+        end_date=ctx.end_date,
+        granularity="D",
+    )
+    if "close" not in df.columns:
+        raise ValueError(f"'close' column not found in data for {ctx.key}")
+    return df.sort_index()
+
+
+@FX_FEATURES.register("ret", inputs=["bars"])
+def _ret(ctx, bars):
+    """Daily log returns."""
+    return np.log(bars["close"] / bars["close"].shift(1))
+
+
+@FX_FEATURES.register("rv_20d", inputs=["ret"])
+def _rv_20d(ctx, ret):
+    """20-day realized volatility, annualized."""
+    return ret.rolling(20).std() * np.sqrt(252)
+
+
+@FX_FEATURES.register("range_vol", inputs=["bars"])
+def _range_vol(ctx, bars):
+    """Range-based volatility columns (`volatility.range_volatility`)."""
+    return range_volatility(bars)
+
+
+def range_vol_feature(**kwargs) -> str:
+    """Name of the range_vol node for `range_volatility` keyword arguments
+    (e.g. windows=(5, 20)), registered on first use; "range_vol" for the
+    defaults."""
+    if not kwargs:
+        return "range_vol"
+    args = {
+        k: tuple(v) if isinstance(v, (list, tuple)) else v
+        for k, v in sorted(kwargs.items())
+    }
+    name = "range_vol(" + ", ".join(f"{k}={v!r}" for k, v in args.items()) + ")"
+    if name not in FX_FEATURES:
+
+        def compute(ctx, bars):
+            return range_volatility(bars, **args)
+
+        compute.__doc__ = _range_vol.__doc__
+        FX_FEATURES.register(name, inputs=["bars"])(compute)
+    return name
+
+
+@FX_FEATURES.register("yield_2y", scope="currency")
+def _yield_2y(ctx):
+    return yield_series(_leg(YIELDS_2Y, ctx, "2y yield"))
+
+
+@FX_FEATURES.register(
+    "rate_diff_2y", inputs=[("yield_2y", "base"), ("yield_2y", "quote")]
+)
+def _rate_diff_2y(ctx, home, foreign):
+    """2y yield differential (BASE - QUOTE)."""
+    return yield_diff(home, foreign)
+
+
+@FX_FEATURES.register("core_cpi", scope="currency", freq="M")
+def _core_cpi(ctx):
+    return to_monthly(_leg(CORE_CPI, ctx, "core CPI"))
+
+
+@FX_FEATURES.register(
+    "cpi_diff_core", inputs=[("core_cpi", "base"), ("core_cpi", "quote")], freq="M"
+)
+def _cpi_diff_core(ctx, home, foreign):
+    """Core CPI YoY differential (BASE - QUOTE), monthly."""
+    return monthly_diff(home, foreign)
+
+
+def fx_feature_builder(start_date="2020-01-01", end_date="2024-12-31"):
+    return FeatureBuilder(FX_FEATURES, start_date, end_date)
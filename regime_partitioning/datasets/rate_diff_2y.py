@@ -1,20 +1,26 @@
 import pandas as pd
 
 
+def yield_series(df: pd.DataFrame) -> pd.Series:
+    """Date-indexed 2Y yields of one currency from a ['date', '2y_yield'] frame."""
+    # Remove duplicates and handle missing values before setting index
+    df_clean = df.dropna(subset=['date', '2y_yield']).drop_duplicates(subset=['date']).copy()
+    return df_clean.set_index("date")["2y_yield"]
+
+
+def yield_diff(s_home: pd.Series, s_foreign: pd.Series) -> pd.Series:
+    """Differential of two `yield_series` legs: home - foreign."""
+    diff = (s_home - s_foreign).dropna()
+    diff.name = "rate_diff_2y"
+    return diff
+
+
 def rate_diff_2y(df_home: pd.DataFrame, df_foreign: pd.DataFrame) -> pd.Series:
     """
     Compute 2Y yield differential: home - foreign (BASE - QUOTE).
     Expects each DataFrame to have columns ['date', '2y_yield'].
     """
-    # Remove duplicates and handle missing values before setting index
-    df_home_clean = df_home.dropna(subset=['date', '2y_yield']).drop_duplicates(subset=['date']).copy()
-    df_foreign_clean = df_foreign.dropna(subset=['date', '2y_yield']).drop_duplicates(subset=['date']).copy()
-    
-    s_home = df_home_clean.set_index("date")["2y_yield"]
-    s_foreign = df_foreign_clean.set_index("date")["2y_yield"]
-    diff = (s_home - s_foreign).dropna()
-    diff.name = "rate_diff_2y"
-    return diff
+    return yield_diff(yield_series(df_home), yield_series(df_foreign))
 
 # Load cleaned 2Y yield data (assumed correct and standardized as ['date','2y_yield'])
 usd_2y_yield = pd.read_csv("data/yields/clean/us_2y_yields_clean.csv", parse_dates=["date"]).sort_values("date")
@@ -1,6 +1,6 @@
 import pandas as pd
 import numpy as np
-from trading_utils.get_forex_data import get_forex_data_by_pair
+from ..price_sources import get_forex_data_by_pair
 
 
 def rv_20d(symbol, start_date, end_date, ann=True):
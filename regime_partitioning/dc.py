@@ -0,0 +1,261 @@
+from dataclasses import dataclass
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+except ImportError:  # optional: the scan then runs as a plain Python loop
+    numba = None
+
+# -------------------------
+# Directional-change (DC) summaries for many thresholds in one scan
+# -------------------------
+# For a threshold theta, a trend runs between consecutive extreme points
+# (EXT). A new extreme is only known once price reverses by theta from it:
+# that bar is the DC confirmation, the causal time of the event. Per trend,
+# with P/t the price/time of its start and end extremes:
+#   TMV = |P_end - P_start| / (P_start * theta)   total move, in thresholds
+#   T   = t_end - t_start                         duration (bars or time units)
+#   R   = TMV * theta / T                         time-adjusted return
+# The scan keeps one small state per threshold and appends every event to a
+# shared buffer; events are then grouped by threshold (CSR layout).
+
+_INITIAL_CAPACITY = 1024
+_BLOCK = 4096  # prices per cache block
+
+
+def _grow(buf, size):
+    out = np.empty(max(2 * len(buf), size), dtype=buf.dtype)
+    out[: len(buf)] = buf
+    return out
+
+
+def _dc_scan_loop(prices, thetas, block):
+    n = prices.shape[0]
+    m = thetas.shape[0]
+    # Per threshold: mode (0 undetermined, 1 up, -1 down), trend start,
+    # running extreme, and (while undetermined) the running min and max
+    mode = np.zeros(m, dtype=np.int64)
+    start_pos = np.zeros(m, dtype=np.int64)
+    start_px = np.zeros(m)
+    ext_pos = np.zeros(m, dtype=np.int64)
+    ext_px = np.zeros(m)
+    lo_pos = np.zeros(m, dtype=np.int64)
+    lo_px = np.full(m, np.inf)
+    hi_pos = np.zeros(m, dtype=np.int64)
+    hi_px = np.full(m, -np.inf)
+
+    cap = _INITIAL_CAPACITY
+    ev_theta = np.empty(cap, dtype=np.int16)
+    ev_start = np.empty(cap, dtype=np.int64)
+    ev_end = np.empty(cap, dtype=np.int64)
+    ev_confirm = np.empty(cap, dtype=np.int64)
+    ev_dir = np.empty(cap, dtype=np.int8)
+    ev_p0 = np.empty(cap)
+    ev_p1 = np.empty(cap)
+    n_ev = 0
+
+    # Blocks of prices stay in cache while every threshold walks them, and
+    # each threshold's state lives in locals for the length of a block
+    for b0 in range(0, n, block):
+        b1 = min(b0 + block, n)
+        for j in range(m):
+            up_move = 1.0 + thetas[j]
+            down_move = 1.0 - thetas[j]
+            md = mode[j]
+            s_pos, s_px = start_pos[j], start_px[j]
+            e_pos, e_px = ext_pos[j], ext_px[j]
+            for t in range(b0, b1):
+                p = prices[t]
+                if not np.isfinite(p):
+                    continue
+                if md == 0:
+                    if p < lo_px[j]:
+                        lo_px[j], lo_pos[j] = p, t
+                    if p > hi_px[j]:
+                        hi_px[j], hi_pos[j] = p, t
+                    if p >= lo_px[j] * up_move:
+                        md, s_pos, s_px = 1, lo_pos[j], lo_px[j]
+                        e_pos, e_px = t, p
+                    elif p <= hi_px[j] * down_move:
+                        md, s_pos, s_px = -1, hi_pos[j], hi_px[j]
+                        e_pos, e_px = t, p
+                    continue
+                if md == 1:
+                    if p > e_px:
+                        e_pos, e_px = t, p
+                        continue
+                    if p > e_px * down_move:
+                        continue
+                else:
+                    if p < e_px:
+                        e_pos, e_px = t, p
+                        continue
+                    if p < e_px * up_move:
+                        continue
+                # Reversal by theta: the trend ending at the extreme completes
+                if n_ev == cap:
+                    ev_theta = _grow(ev_theta, n_ev + 1)
+                    ev_start = _grow(ev_start, n_ev + 1)
+                    ev_end = _grow(ev_end, n_ev + 1)
+                    ev_confirm = _grow(ev_confirm, n_ev + 1)
+                    ev_dir = _grow(ev_dir, n_ev + 1)
+                    ev_p0 = _grow(ev_p0, n_ev + 1)
+                    ev_p1 = _grow(ev_p1, n_ev + 1)
+                    cap = ev_theta.shape[0]
+                ev_theta[n_ev] = j
+                ev_start[n_ev] = s_pos
+                ev_end[n_ev] = e_pos
+                ev_confirm[n_ev] = t
+                ev_dir[n_ev] = md
+                ev_p0[n_ev] = s_px
+                ev_p1[n_ev] = e_px
+                n_ev += 1
+                # The extreme that just completed starts the opposite trend
+                md = -md
+                s_pos, s_px = e_pos, e_px
+                e_pos, e_px = t, p
+            mode[j] = md
+            start_pos[j], start_px[j] = s_pos, s_px
+            ext_pos[j], ext_px[j] = e_pos, e_px
+
+    return (
+        ev_theta[:n_ev],
+        ev_start[:n_ev],
+        ev_end[:n_ev],
+        ev_confirm[:n_ev],
+        ev_dir[:n_ev],
+        ev_p0[:n_ev],
+        ev_p1[:n_ev],
+    )
+
+
+if numba is not None:
+    _grow = numba.njit(cache=True)(_grow)
+    _dc_scan = numba.njit(cache=True)(_dc_scan_loop)
+else:
+    _dc_scan = _dc_scan_loop
+
+
+_COLUMNS = (
+    "thetas",
+    "offsets",
+    "start",
+    "end",
+    "confirm",
+    "direction",
+    "tmv",
+    "T",
+    "R",
+)
+
+
+@dataclass
+class DCEvents:
+    """Completed DC trends for several thresholds, grouped by threshold.
+
+    Events of `thetas[i]` occupy rows `offsets[i]:offsets[i + 1]` of every
+    column, in confirmation order. `start`, `end` and `confirm` are bar
+    positions (of the start extreme, end extreme and DC confirmation).
+    """
+
+    thetas: np.ndarray
+    offsets: np.ndarray
+    start: np.ndarray
+    end: np.ndarray
+    confirm: np.ndarray
+    direction: np.ndarray  # +1 upward trend, -1 downward
+    tmv: np.ndarray
+    T: np.ndarray
+    R: np.ndarray
+    index: Optional[pd.Index] = None
+
+    def __len__(self):
+        return len(self.start)
+
+    def counts(self) -> pd.Series:
+        return pd.Series(np.diff(self.offsets), index=self.thetas, name="n_events")
+
+    def _rows(self, theta):
+        match = np.flatnonzero(np.isclose(self.thetas, theta))
+        if not len(match):
+            raise ValueError(
+                f"Threshold {theta:g} was not scanned; "
+                f"available: {[float(t) for t in self.thetas]}"
+            )
+        i = int(match[0])
+        return slice(self.offsets[i], self.offsets[i + 1])
+
+    def save(self, path):
+        """Write all columns to one .npz archive."""
+        cols = {f: getattr(self, f) for f in _COLUMNS}
+        if self.index is not None:
+            cols["index"] = pd.DatetimeIndex(self.index).asi8
+        np.savez(path, **cols)
+        return path
+
+    @classmethod
+    def load(cls, path) -> "DCEvents":
+        with np.load(path) as data:
+            cols = {f: data[f] for f in _COLUMNS}
+            index = pd.DatetimeIndex(data["index"]) if "index" in data else None
+        return cls(**cols, index=index)
+
+    def events(self, theta) -> pd.DataFrame:
+        """Event table of one threshold, timestamped when `index` is known."""
+        rows = self._rows(theta)
+        out = pd.DataFrame(
+            {
+                "start": self.start[rows],
+                "end": self.end[rows],
+                "confirm": self.confirm[rows],
+                "direction": self.direction[rows],
+                "tmv": self.tmv[rows],
+                "T": self.T[rows],
+                "R": self.R[rows],
+            }
+        )
+        if self.index is not None:
+            for col in ("start", "end", "confirm"):
+                out[f"{col}_time"] = self.index[out[col].to_numpy()]
+        return out
+
+
+def summarise_dc(
+    prices,
+    thetas: Sequence[float],
+    time_unit=None,
+) -> DCEvents:
+    """DC trends of `prices` for every threshold in `thetas`, in one scan.
+
+    Thresholds are fractions (0.004 for 0.4%). `prices` may be a Series,
+    whose index timestamps the events. T is in bars, or, with `time_unit`
+    (e.g. "1s" for ticks), in that unit of the index.
+    """
+    index = prices.index if isinstance(prices, pd.Series) else None
+    values = np.ascontiguousarray(np.asarray(prices, dtype=float))
+    thetas = np.asarray(thetas, dtype=float)
+    if len(thetas) > np.iinfo(np.int16).max:
+        raise ValueError("at most 32767 thresholds per scan")
+    theta_id, start, end, confirm, direction, p0, p1 = _dc_scan(values, thetas, _BLOCK)
+
+    # Group by threshold; a stable (radix, for int16 keys) sort keeps the
+    # confirmation order within each
+    order = np.argsort(theta_id, kind="stable")
+    offsets = np.zeros(len(thetas) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(theta_id, minlength=len(thetas)), out=offsets[1:])
+    theta_id, start, end, confirm = (a[order] for a in (theta_id, start, end, confirm))
+    direction, p0, p1 = direction[order], p0[order], p1[order]
+
+    theta = thetas[theta_id]
+    tmv = np.abs(p1 - p0) / (p0 * theta)
+    if time_unit is None:
+        T = (end - start).astype(float)
+    else:
+        times = pd.DatetimeIndex(index).asi8
+        T = (times[end] - times[start]) / pd.Timedelta(time_unit).value
+    with np.errstate(divide="ignore", invalid="ignore"):
+        R = tmv * theta / T
+    return DCEvents(thetas, offsets, start, end, confirm, direction, tmv, T, R, index)
@@ -0,0 +1,289 @@
+import multiprocessing as mp
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from .dc import DCEvents, summarise_dc
+from .price_sources import get_forex_data_by_pair
+from .walkforward import _fit_block, load_walkforward_state, save_walkforward_state
+
+# -------------------------
+# Offline HMM training on DC events (intrinsic time)
+# -------------------------
+# One observation per completed DC trend instead of one per bar: the HMM is
+# fitted on R, or on (TMV, T), of the trends of each threshold. The state
+# with the higher mean R is the abnormal regime ("Regime 2"), the other the
+# normal one. Prices are scanned once per symbol for every threshold
+# (`summarise_dc`); the fits then fan out over (symbol, threshold).
+
+DC_FEATURES = {"R": ("R",), "tmv_T": ("tmv", "T")}
+DC_REGIME_LABELS = ("normal", "abnormal")
+NORMAL, ABNORMAL = 0, 1
+
+
+@dataclass
+class DCHMMFit:
+    """A 2-state HMM fitted on the DC trends of one symbol and threshold."""
+
+    symbol: str
+    theta: float
+    features: Sequence[str]  # DCEvents columns the model was fitted on
+    model: Any
+    scaler: StandardScaler
+    abnormal_state: int
+    n_events: int
+    log_likelihood: float  # per event, on the training sequence
+    fit_seconds: float
+    start: Optional[pd.Timestamp] = None  # first and last training prices
+    end: Optional[pd.Timestamp] = None
+
+    def state_means(self) -> pd.DataFrame:
+        """Fitted state means in raw feature units, one row per state."""
+        means = self.model.means_ * self.scaler.scale_ + self.scaler.mean_
+        return pd.DataFrame(means, columns=list(self.features))
+
+    def regimes(self, events: pd.DataFrame) -> np.ndarray:
+        """Viterbi regime codes (NORMAL / ABNORMAL) for an event table of the
+        same threshold (`DCEvents.events`); -1 where features are missing."""
+        X = _event_matrix(events, self.features)
+        codes = np.full(len(X), -1, dtype=np.int8)
+        valid = np.isfinite(X).all(axis=1)
+        if valid.any():
+            states = self.model.predict(self.scaler.transform(X[valid]))
+            codes[valid] = np.where(states == self.abnormal_state, ABNORMAL, NORMAL)
+        return codes
+
+
+def _event_matrix(events, features):
+    return np.column_stack([np.asarray(events[col], dtype=float) for col in features])
+
+
+def _abnormal_state(model, scaler, features, theta):
+    """State with the higher mean R (TMV * theta / T for (TMV, T) fits)."""
+    means = model.means_ * scaler.scale_ + scaler.mean_
+    cols = list(features)
+    if "R" in cols:
+        r = means[:, cols.index("R")]
+    else:
+        r = means[:, cols.index("tmv")] * theta / means[:, cols.index("T")]
+    return int(np.argmax(r))
+
+
+def _training_matrix(table, cols):
+    """Feature rows of an event table, without trends with a non-finite
+    feature (T == 0 with a time unit)."""
+    X = _event_matrix(table, cols)
+    return np.ascontiguousarray(X[np.isfinite(X).all(axis=1)])
+
+
+def _too_few_trends(n):
+    return f"{n} DC trends, need >= 2" if n < 2 else None
+
+
+def _price_span(index):
+    if index is None or not len(index):
+        return None, None
+    return index[0], index[-1]
+
+
+def _fit_matrix(X, theta, symbol, cols, fit_args, span) -> DCHMMFit:
+    n_init, max_iter, random_state, backend = fit_args
+    t0 = time.perf_counter()
+    scaler = StandardScaler().fit(X)
+    Z = np.empty_like(X)
+    model = _fit_block(X, scaler, 2, n_init, max_iter, random_state, backend, out=Z)
+    fit_seconds = time.perf_counter() - t0
+    return DCHMMFit(
+        symbol=symbol,
+        theta=float(theta),
+        features=cols,
+        model=model,
+        scaler=scaler,
+        abnormal_state=_abnormal_state(model, scaler, cols, theta),
+        n_events=len(X),
+        log_likelihood=float(model.score(Z)) / len(X),
+        fit_seconds=fit_seconds,
+        start=span[0],
+        end=span[1],
+    )
+
+
+def fit_dc_hmm(
+    events: DCEvents,
+    theta,
+    symbol="",
+    features="R",
+    n_init=10,
+    max_iter=200,
+    random_state=0,
+    backend="auto",
+) -> DCHMMFit:
+    """Fit the 2-state HMM on the trends of one threshold of `events`.
+
+    `features` is a key of `DC_FEATURES` ("R" or "tmv_T"). Trends with a
+    non-finite feature (T == 0 with a time unit) are left out.
+    """
+    cols = DC_FEATURES[features]
+    X = _training_matrix(events.events(theta), cols)
+    reason = _too_few_trends(len(X))
+    if reason:
+        raise ValueError(f"{symbol or 'series'} theta={theta:g}: {reason}")
+    fit_args = (n_init, max_iter, random_state, backend)
+    return _fit_matrix(X, theta, symbol, cols, fit_args, _price_span(events.index))
+
+
+# -------------------------
+# Persistence
+# -------------------------
+def dc_hmm_path(out_dir, symbol, theta, features="R") -> Path:
+    return Path(out_dir) / f"{symbol}_dc_{theta:g}_{features}.pkl"
+
+
+def save_dc_hmm(fit: DCHMMFit, path):
+    """Pickle `fit` atomically (same format as the walk-forward state)."""
+    return save_walkforward_state(fit, path)
+
+
+def load_dc_hmm(path) -> DCHMMFit:
+    return load_walkforward_state(path)
+
+
+# -------------------------
+# Pipeline over symbols and thresholds
+# -------------------------
+def _load_prices(symbol, start_date, end_date, granularity, price_col):
+    df = get_forex_data_by_pair(symbol, start_date, end_date, granularity)
+    return df[price_col].dropna()
+
+
+def _scan_symbol(symbol, prices, thetas, time_unit, load_args):
+    """DC events of one symbol; top-level so process pools can pickle it."""
+    if prices is None:
+        prices = _load_prices(symbol, *load_args)
+    return summarise_dc(prices, thetas, time_unit=time_unit)
+
+
+def _fit_task(symbol, table, theta, features, fit_args, span, out_dir):
+    """Fit one threshold's event table, or return the summary row of a
+    skipped threshold."""
+    cols = DC_FEATURES[features]
+    X = _training_matrix(table, cols)
+    reason = _too_few_trends(len(X))
+    if reason:
+        return {
+            "symbol": symbol,
+            "theta": float(theta),
+            "features": "_".join(cols),
+            "n_events": len(X),
+            "skip_reason": reason,
+        }
+    fit = _fit_matrix(X, theta, symbol, cols, fit_args, span)
+    if out_dir is not None:
+        save_dc_hmm(fit, dc_hmm_path(out_dir, symbol, theta, features))
+    return fit
+
+
+def _summary_row(fit: DCHMMFit) -> Dict[str, Any]:
+    means = fit.state_means()
+    normal = 1 - fit.abnormal_state
+    row = {
+        "symbol": fit.symbol,
+        "theta": fit.theta,
+        "features": "_".join(fit.features),
+        "n_events": fit.n_events,
+        "skip_reason": None,
+        "abnormal_state": fit.abnormal_state,
+        "log_likelihood": fit.log_likelihood,
+        "fit_seconds": fit.fit_seconds,
+    }
+    for col in fit.features:
+        row[f"normal_{col}"] = means.loc[normal, col]
+        row[f"abnormal_{col}"] = means.loc[fit.abnormal_state, col]
+    row["p_stay_abnormal"] = fit.model.transmat_[fit.abnormal_state, fit.abnormal_state]
+    return row
+
+
+def train_dc_hmms(
+    symbols: Iterable[str],
+    thetas: Sequence[float],
+    start_date=None,
+    end_date=None,
+    granularity="D",
+    prices: Optional[Mapping[str, pd.Series]] = None,
+    price_col="close",
+    time_unit=None,
+    features="R",
+    n_init=10,
+    max_iter=200,
+    random_state=0,
+    backend="auto",
+    n_jobs=1,
+    out_dir=None,
+):
+    """Fit one DC-event HMM per (symbol, threshold).
+
+    Prices come from `prices` (symbol -> Series) or are loaded from the
+    active price source (`price_col` of the stored bars). Each symbol is
+    scanned once for all `thetas`; the fits then run over `n_jobs`
+    spawned processes. With `out_dir`, every fit is pickled to
+    `dc_hmm_path(...)` and the summary written to `dc_hmm_summary.csv`.
+    Thresholds with fewer than two usable trends are not fitted; their
+    summary rows give the `skip_reason`.
+
+    Returns (summary DataFrame, {(symbol, theta): DCHMMFit} of fitted rows).
+    """
+    symbols = list(symbols)
+    thetas = [float(t) for t in thetas]
+    if features not in DC_FEATURES:
+        raise ValueError(f"features must be one of {sorted(DC_FEATURES)}")
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+    load_args = (start_date, end_date, granularity, price_col)
+    scans = [
+        (sym, None if prices is None else prices[sym], thetas, time_unit, load_args)
+        for sym in symbols
+    ]
+    fit_args = (n_init, max_iter, random_state, backend)
+
+    def fit_tasks(events_by_symbol):
+        # One threshold's event table per task, not the symbol's whole scan
+        return [
+            (
+                sym,
+                events.events(theta),
+                theta,
+                features,
+                fit_args,
+                _price_span(events.index),
+                out_dir,
+            )
+            for sym, events in zip(symbols, events_by_symbol)
+            for theta in thetas
+        ]
+
+    if n_jobs > 1:
+        # spawn keeps workers from inheriting the parent's price frames
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(processes=n_jobs) as pool:
+            events_by_symbol = pool.starmap(_scan_symbol, scans)
+            results = pool.starmap(_fit_task, fit_tasks(events_by_symbol))
+    else:
+        events_by_symbol = [_scan_symbol(*a) for a in scans]
+        results = [_fit_task(*a) for a in fit_tasks(events_by_symbol)]
+
+    fits = {(r.symbol, r.theta): r for r in results if isinstance(r, DCHMMFit)}
+    summary = pd.DataFrame(
+        [_summary_row(r) if isinstance(r, DCHMMFit) else r for r in results]
+    )
+    if "abnormal_state" in summary:
+        # Skipped rows leave it missing; keep it an integer column
+        summary["abnormal_state"] = summary["abnormal_state"].astype("Int64")
+    if out_dir is not None:
+        summary.to_csv(Path(out_dir) / "dc_hmm_summary.csv", index=False)
+    return summary, fits
@@ -0,0 +1,167 @@
+import numpy as np
+from sklearn import cluster
+from sklearn.utils import check_random_state
+
+from . import hmm_kernels
+
+
+class DiagGaussianHMM:
+    """Diagonal-covariance Gaussian HMM on the compiled kernels in `hmm_kernels`.
+
+    Drop-in for `hmmlearn.hmm.GaussianHMM(covariance_type="diag")` as used in
+    this repo: same constructor arguments, the same initialisation (Dirichlet
+    start/transition draws, k-means means, data covariance plus `min_covar`),
+    the same M-step priors and the same convergence rule, so fits agree with
+    hmmlearn to floating-point precision for a given `random_state`.
+    """
+
+    def __init__(
+        self,
+        n_components=2,
+        covariance_type="diag",
+        min_covar=1e-3,
+        startprob_prior=1.0,
+        transmat_prior=1.0,
+        covars_prior=1e-2,
+        covars_weight=1,
+        n_iter=10,
+        tol=1e-2,
+        random_state=None,
+        init_params="stmc",
+        params="stmc",
+        verbose=False,
+    ):
+        if covariance_type != "diag":
+            raise ValueError("DiagGaussianHMM only supports covariance_type='diag'")
+        self.n_components = n_components
+        self.covariance_type = covariance_type
+        self.min_covar = min_covar
+        self.startprob_prior = startprob_prior
+        self.transmat_prior = transmat_prior
+        self.covars_prior = covars_prior
+        self.covars_weight = covars_weight
+        self.n_iter = n_iter
+        self.tol = tol
+        self.random_state = random_state
+        self.init_params = init_params
+        self.params = params
+        self.verbose = verbose
+        self.startprob_ = None
+        self.transmat_ = None
+        self.means_ = None
+        self._covars_ = None
+
+    @property
+    def covars_(self):
+        """Full (K, D, D) matrices, as hmmlearn reports for diag models."""
+        return np.array([np.diag(cov) for cov in self._covars_])
+
+    @covars_.setter
+    def covars_(self, covars):
+        covars = np.asarray(covars, dtype=float)
+        if covars.ndim == 3:
+            covars = np.array([np.diag(cov) for cov in covars])
+        self._covars_ = covars.copy()
+
+    def _needs_init(self, code, name):
+        return code in self.init_params or getattr(self, name) is None
+
+    def _init(self, X):
+        K = self.n_components
+        random_state = check_random_state(self.random_state)
+        if self._needs_init("s", "startprob_"):
+            self.startprob_ = random_state.dirichlet(np.full(K, 1.0 / K))
+        if self._needs_init("t", "transmat_"):
+            self.transmat_ = random_state.dirichlet(np.full(K, 1.0 / K), size=K)
+        if self._needs_init("m", "means_"):
+            kmeans = cluster.KMeans(
+                n_clusters=K, random_state=self.random_state, n_init=10
+            )
+            self.means_ = kmeans.fit(X).cluster_centers_
+        if self._needs_init("c", "_covars_"):
+            cv = np.atleast_2d(np.cov(X.T)) + self.min_covar * np.eye(X.shape[1])
+            self._covars_ = np.tile(np.diag(cv), (K, 1))
+
+    def _log_b(self, X):
+        return hmm_kernels.log_emissions_diag(X, self.means_, self._covars_)
+
+    def _do_mstep(self, stats):
+        if "s" in self.params:
+            startprob = np.maximum(self.startprob_prior - 1 + stats["start"], 0)
+            startprob = np.where(self.startprob_ == 0, 0, startprob)
+            self.startprob_ = startprob / startprob.sum()
+        if "t" in self.params:
+            transmat = np.maximum(self.transmat_prior - 1 + stats["trans"], 0)
+            transmat = np.where(self.transmat_ == 0, 0, transmat)
+            row = transmat.sum(axis=1, keepdims=True)
+            self.transmat_ = transmat / np.where(row == 0, 1, row)
+        denom = stats["post"][:, None]
+        if "m" in self.params:
+            self.means_ = stats["obs"] / denom
+        if "c" in self.params:
+            c_n = (
+                stats["obs**2"]
+                - 2 * self.means_ * stats["obs"]
+                + self.means_**2 * denom
+            )
+            c_d = max(self.covars_weight - 1, 0) + denom
+            self._covars_ = (self.covars_prior + c_n) / np.maximum(c_d, 1e-5)
+
+    def fit(self, X):
+        X = np.ascontiguousarray(X, dtype=float)
+        self._init(X)
+        self.history_ = []
+        for _ in range(self.n_iter):
+            stats, _, logprob = hmm_kernels.sufficient_statistics(
+                X, self._log_b(X), self.startprob_, self.transmat_
+            )
+            self._do_mstep(stats)
+            self.history_.append(logprob)
+            if len(self.history_) >= 2 and logprob - self.history_[-2] < self.tol:
+                break
+        return self
+
+    def score(self, X):
+        X = np.asarray(X, dtype=float)
+        _, logprob = hmm_kernels.forward(
+            self._log_b(X), self.startprob_, self.transmat_
+        )
+        return logprob
+
+    def score_samples(self, X):
+        X = np.asarray(X, dtype=float)
+        gamma, _, logprob = hmm_kernels.forward_backward(
+            self._log_b(X), self.startprob_, self.transmat_
+        )
+        return logprob, gamma
+
+    def predict_proba(self, X):
+        return self.score_samples(X)[1]
+
+    def decode(self, X):
+        X = np.asarray(X, dtype=float)
+        return hmm_kernels.viterbi(self._log_b(X), self.startprob_, self.transmat_)
+
+    def predict(self, X):
+        return self.decode(X)[1]
+
+
+HMM_BACKENDS = ("auto", "hmmlearn", "fast")
+
+
+def make_hmm(backend="auto", **kwargs):
+    """Build a diag GaussianHMM on the requested backend.
+
+    "fast" uses `DiagGaussianHMM`; "hmmlearn" uses `hmmlearn.hmm.GaussianHMM`;
+    "auto" picks "fast" when numba is installed (the NumPy fallback kernels
+    are slower than hmmlearn's C loops) and "hmmlearn" otherwise.
+    """
+    if backend == "auto":
+        backend = "fast" if hmm_kernels.HAVE_NUMBA else "hmmlearn"
+    if backend == "fast":
+        return DiagGaussianHMM(**kwargs)
+    if backend == "hmmlearn":
+        from hmmlearn.hmm import GaussianHMM
+
+        return GaussianHMM(**kwargs)
+    raise ValueError(f"Unknown HMM backend {backend!r}. Available: {HMM_BACKENDS}")
@@ -0,0 +1,189 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+# -------------------------
+# Declarative features evaluated as a dependency graph
+# -------------------------
+# A feature is computed per key of its scope: per FX pair ("EURUSD"), per
+# currency ("EUR"), or once (global). It declares its inputs as
+# (feature, scope ref) pairs, where the ref picks the input's key from the
+# requesting key: "pair", "base" / "quote" (the pair's legs), "self" (same
+# key) or "global". A build resolves the requested (feature, key) nodes and
+# everything upstream into one graph, evaluates it in dependency order and
+# memoises every node, so a currency leg shared by several pairs (or a
+# feature shared by several requests) is computed once per builder.
+
+SCOPES = ("pair", "currency", "global")
+FREQS = ("D", "M")  # daily; monthly, forward-filled to days on assembly
+
+
+@dataclass(frozen=True)
+class Feature:
+    name: str
+    compute: Callable  # compute(ctx, *input values) -> Series or DataFrame
+    inputs: Tuple[Tuple[str, str], ...] = ()
+    scope: str = "pair"
+    freq: str = "D"
+    doc: str = ""
+
+
+@dataclass(frozen=True)
+class NodeContext:
+    """What a feature's compute function sees besides its inputs."""
+
+    key: Optional[str]  # pair symbol, currency code, or None for global
+    start_date: Any
+    end_date: Any
+
+
+def pair_legs(symbol) -> Tuple[str, str]:
+    """(base, quote) currency codes of a 6-letter pair symbol."""
+    if len(symbol) != 6:
+        raise ValueError(f"Expected a 6-letter FX pair, got {symbol!r}")
+    return symbol[:3], symbol[3:]
+
+
+def _input_key(ref, key):
+    if ref == "global":
+        return None
+    if ref in ("self", "pair"):
+        return key
+    if ref in ("base", "quote"):
+        base, quote = pair_legs(key)
+        return base if ref == "base" else quote
+    raise ValueError(f"Unknown input reference {ref!r}")
+
+
+class FeatureRegistry:
+    def __init__(self):
+        self._features: Dict[str, Feature] = {}
+
+    def __contains__(self, name):
+        return name in self._features
+
+    def __getitem__(self, name) -> Feature:
+        try:
+            return self._features[name]
+        except KeyError:
+            raise KeyError(
+                f"Unknown feature {name!r}. Registered: {sorted(self._features)}"
+            ) from None
+
+    def names(self, scope=None) -> List[str]:
+        return [f.name for f in self._features.values() if scope in (None, f.scope)]
+
+    def register(self, name, inputs=(), scope="pair", freq="D"):
+        """Decorator registering `compute(ctx, *inputs)` as feature `name`.
+
+        `inputs` are (feature, ref) pairs; a bare name means (name, "self").
+        """
+        if scope not in SCOPES:
+            raise ValueError(f"scope must be one of {SCOPES}")
+        if freq not in FREQS:
+            raise ValueError(f"freq must be one of {FREQS}")
+        refs = tuple((i, "self") if isinstance(i, str) else tuple(i) for i in inputs)
+
+        def decorator(compute):
+            if name in self._features:
+                raise ValueError(f"Feature {name!r} is already registered")
+            self._features[name] = Feature(
+                name, compute, refs, scope, freq, (compute.__doc__ or "").strip()
+            )
+            return compute
+
+        return decorator
+
+    def resolve(self, nodes: Iterable[Tuple[str, Optional[str]]]):
+        """Requested (feature, key) nodes plus their upstream, in evaluation
+        order (inputs first); each node appears once."""
+        order, done, active = [], set(), set()
+
+        def visit(node):
+            if node in done:
+                return
+            if node in active:
+                raise ValueError(f"Dependency cycle through {node}")
+            active.add(node)
+            name, key = node
+            for dep, ref in self[name].inputs:
+                visit((dep, _input_key(ref, key)))
+            active.discard(node)
+            done.add(node)
+            order.append(node)
+
+        for node in nodes:
+            visit(node)
+        return order
+
+
+class FeatureBuilder:
+    """Evaluates registry nodes for one date range, caching every node.
+
+    Reuse one builder across requests (or use `frames`) so shared nodes,
+    e.g. the USD leg of every USD pair, are computed once.
+    """
+
+    def __init__(self, registry: FeatureRegistry, start_date=None, end_date=None):
+        self.registry = registry
+        self.start_date = start_date
+        self.end_date = end_date
+        self.cache: Dict[Tuple[str, Optional[str]], Any] = {}
+        self.n_computed = 0
+
+    def _evaluate(self, nodes):
+        for node in self.registry.resolve(nodes):
+            if node in self.cache:
+                continue
+            name, key = node
+            feature = self.registry[name]
+            args = [
+                self.cache[(dep, _input_key(ref, key))] for dep, ref in feature.inputs
+            ]
+            ctx = NodeContext(key, self.start_date, self.end_date)
+            self.cache[node] = feature.compute(ctx, *args)
+            self.n_computed += 1
+
+    def value(self, name, key=None):
+        """Value of one node (computed with its upstream on first use)."""
+        self._evaluate([(name, key)])
+        return self.cache[(name, key)]
+
+    def frame(self, symbol, features: Sequence[str], index="bars") -> pd.DataFrame:
+        """Pair features of `symbol` left-joined on the index of feature
+        `index`; monthly features are forward-filled to days first."""
+        return self.frames([symbol], features, index)[symbol]
+
+    def frames(
+        self, symbols: Sequence[str], features: Sequence[str], index="bars"
+    ) -> Dict[str, pd.DataFrame]:
+        """`frame` for every symbol; the whole request is one graph."""
+        for name in features:
+            if self.registry[name].scope != "pair":
+                raise ValueError(f"{name!r} is not a pair feature")
+        self._evaluate([(f, s) for s in symbols for f in (index, *features)])
+        out = {}
+        for symbol in symbols:
+            rows = self.cache[(index, symbol)].index
+            parts = []
+            for name in features:
+                value = self.cache[(name, symbol)]
+                if self.registry[name].freq == "M":
+                    value = _month_end_to_daily(value)
+                if isinstance(value, pd.Series):
+                    value = value.rename(name).to_frame()
+                parts.append(value.reindex(rows))
+            out[symbol] = (
+                pd.concat(parts, axis=1) if parts else pd.DataFrame(index=rows)
+            )
+        return out
+
+
+def _month_end_to_daily(value):
+    """Month-end observations forward-filled over calendar days
+    (as `datasets.cpi_diff_core.expand_to_daily_month_end`)."""
+    if len(value) == 0:
+        return value
+    days = pd.date_range(value.index.min(), value.index.max(), freq="D")
+    return value.reindex(days).ffill()
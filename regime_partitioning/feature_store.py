@@ -0,0 +1,120 @@
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+
+# Columns shared with workers by default (see datasets/__init__.py)
+FEATURE_COLS = ("ret", "rv_20d", "rate_diff_2y", "cpi_diff_core")
+
+_MANIFEST = "manifest.json"
+
+
+def write_feature_store(
+    root,
+    frames: Mapping[str, pd.DataFrame],
+    cols: Iterable[str] = FEATURE_COLS,
+) -> Path:
+    """Persist per-symbol feature frames as raw .npy files for memory mapping.
+
+    Layout: `{root}/{symbol}/index.npy` (int64 ns timestamps) and
+    `{root}/{symbol}/values.npy` (float64, rows x cols, C order), plus a
+    `manifest.json` listing symbols, row counts and column order.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    cols = list(cols)
+    manifest = {"cols": cols, "symbols": {}}
+    for symbol, df in frames.items():
+        sym_dir = root / symbol
+        sym_dir.mkdir(exist_ok=True)
+        present = [c for c in cols if c in df.columns]
+        values = np.full((len(df), len(cols)), np.nan)
+        for j, c in enumerate(cols):
+            if c in present:
+                values[:, j] = df[c].to_numpy(dtype=float)
+        index = pd.DatetimeIndex(df.index).as_unit("ns").asi8
+        np.save(sym_dir / "index.npy", index)
+        np.save(sym_dir / "values.npy", np.ascontiguousarray(values))
+        manifest["symbols"][symbol] = {"n": int(len(df)), "cols": present}
+    tmp = root / (_MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2))
+    os.replace(tmp, root / _MANIFEST)
+    return root
+
+
+class FeatureStore:
+    """Read-only, zero-copy views over a store written by `write_feature_store`.
+
+    Arrays are opened with `np.load(mmap_mode="r")`, so every process that
+    attaches shares the same page-cache pages instead of holding its own copy.
+    """
+
+    def __init__(self, root):
+        self.root = Path(root)
+        manifest = json.loads((self.root / _MANIFEST).read_text())
+        self.cols = list(manifest["cols"])
+        self._meta = manifest["symbols"]
+        self._arrays: Dict[str, tuple] = {}
+
+    @property
+    def symbols(self):
+        return list(self._meta)
+
+    def __contains__(self, symbol):
+        return symbol in self._meta
+
+    def _load(self, symbol):
+        if symbol not in self._meta:
+            raise KeyError(f"Symbol {symbol} not in feature store {self.root}")
+        arrays = self._arrays.get(symbol)
+        if arrays is None:
+            sym_dir = self.root / symbol
+            arrays = (
+                np.load(sym_dir / "index.npy", mmap_mode="r"),
+                np.load(sym_dir / "values.npy", mmap_mode="r"),
+            )
+            self._arrays[symbol] = arrays
+        return arrays
+
+    def index(self, symbol) -> pd.DatetimeIndex:
+        idx, _ = self._load(symbol)
+        return pd.DatetimeIndex(idx.view("datetime64[ns]"), name="datetime")
+
+    def values(self, symbol) -> np.ndarray:
+        """(rows x cols) read-only memmap in `self.cols` order."""
+        return self._load(symbol)[1]
+
+    def column(self, symbol, col) -> np.ndarray:
+        return self.values(symbol)[:, self.cols.index(col)]
+
+    def frame(self, symbol, cols: Optional[Iterable[str]] = None) -> pd.DataFrame:
+        """DataFrame backed by the memmap (no copy when all columns are kept)."""
+        values = self.values(symbol)
+        df = pd.DataFrame(
+            values, index=self.index(symbol), columns=self.cols, copy=False
+        )
+        present = self._meta[symbol]["cols"]
+        if cols is None:
+            return df if present == self.cols else df[present]
+        return df[list(cols)]
+
+
+# Per-process store handle, installed by `attach_feature_store` in pool workers
+_attached_store: Optional[FeatureStore] = None
+
+
+def attach_feature_store(root) -> FeatureStore:
+    """Pool initializer: open the store once per worker process."""
+    global _attached_store
+    _attached_store = FeatureStore(root)
+    return _attached_store
+
+
+def get_attached_store() -> FeatureStore:
+    if _attached_store is None:
+        raise RuntimeError("No feature store attached in this process")
+    return _attached_store
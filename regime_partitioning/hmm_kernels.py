@@ -0,0 +1,319 @@
+import numpy as np
+
+try:
+    import numba
+except ImportError:  # optional: the NumPy implementations below are used instead
+    numba = None
+
+HAVE_NUMBA = numba is not None
+
+
+# -------------------------
+# Kernels for small-K, diagonal-Gaussian HMMs
+# -------------------------
+# Emissions enter as b = exp(log_b - rowmax(log_b)); forward/backward run in
+# the scaled (not log) domain, so log p(X) = sum(log scale) + sum(rowmax).
+# Every kernel has a scalar-loop version (compiled with numba when available)
+# and a NumPy version that vectorises over states only.
+
+
+# NumPy implementations (vectorised over states, loop over time) --------------
+
+
+def _log_emissions_np(X, means, covars):
+    diff = X[:, None, :] - means[None, :, :]
+    return -0.5 * (
+        np.log(2.0 * np.pi * covars)[None, :, :] + diff**2 / covars[None, :, :]
+    ).sum(axis=-1)
+
+
+def _forward_np(log_b, startprob, transmat):
+    T, K = log_b.shape
+    shift = log_b.max(axis=1)
+    b = np.exp(log_b - shift[:, None])
+    alpha = np.empty((T, K))
+    scale = np.empty(T)
+    a = startprob * b[0]
+    scale[0] = a.sum()
+    alpha[0] = a / scale[0]
+    for t in range(1, T):
+        a = (alpha[t - 1] @ transmat) * b[t]
+        scale[t] = a.sum()
+        alpha[t] = a / scale[t]
+    return alpha, b, scale, shift
+
+
+def _backward_np(b, scale, transmat):
+    T, K = b.shape
+    beta = np.empty((T, K))
+    beta[T - 1] = 1.0
+    for t in range(T - 2, -1, -1):
+        beta[t] = transmat @ (b[t + 1] * beta[t + 1]) / scale[t + 1]
+    return beta
+
+
+def _posteriors_np(alpha, beta):
+    gamma = alpha * beta
+    gamma /= gamma.sum(axis=1, keepdims=True)
+    return gamma
+
+
+def _xi_sum_np(alpha, beta, b, scale, transmat):
+    w = b[1:] * beta[1:] / scale[1:, None]
+    return (alpha[:-1].T @ w) * transmat
+
+
+def _predict_np(alpha, transmat):
+    return alpha @ transmat
+
+
+def _viterbi_np(log_b, log_startprob, log_transmat):
+    T, K = log_b.shape
+    back = np.empty((T, K), dtype=np.int64)
+    delta = log_startprob + log_b[0]
+    for t in range(1, T):
+        cand = delta[:, None] + log_transmat
+        back[t] = cand.argmax(axis=0)
+        delta = cand[back[t], np.arange(K)] + log_b[t]
+    path = np.empty(T, dtype=np.int64)
+    path[T - 1] = delta.argmax()
+    for t in range(T - 1, 0, -1):
+        path[t - 1] = back[t, path[t]]
+    return delta.max(), path
+
+
+# Scalar-loop implementations (numba targets) ---------------------------------
+
+
+def _log_emissions_loop(X, means, covars):
+    T, D = X.shape
+    K = means.shape[0]
+    log_b = np.empty((T, K))
+    const = np.empty(K)
+    for k in range(K):
+        c = 0.0
+        for d in range(D):
+            c += np.log(2.0 * np.pi * covars[k, d])
+        const[k] = c
+    for t in range(T):
+        for k in range(K):
+            acc = const[k]
+            for d in range(D):
+                diff = X[t, d] - means[k, d]
+                acc += diff * diff / covars[k, d]
+            log_b[t, k] = -0.5 * acc
+    return log_b
+
+
+def _forward_loop(log_b, startprob, transmat):
+    T, K = log_b.shape
+    alpha = np.empty((T, K))
+    b = np.empty((T, K))
+    scale = np.empty(T)
+    shift = np.empty(T)
+    for t in range(T):
+        m = log_b[t, 0]
+        for j in range(1, K):
+            if log_b[t, j] > m:
+                m = log_b[t, j]
+        shift[t] = m
+        for j in range(K):
+            b[t, j] = np.exp(log_b[t, j] - m)
+    s = 0.0
+    for j in range(K):
+        alpha[0, j] = startprob[j] * b[0, j]
+        s += alpha[0, j]
+    scale[0] = s
+    for j in range(K):
+        alpha[0, j] /= s
+    for t in range(1, T):
+        s = 0.0
+        for j in range(K):
+            acc = 0.0
+            for i in range(K):
+                acc += alpha[t - 1, i] * transmat[i, j]
+            alpha[t, j] = acc * b[t, j]
+            s += alpha[t, j]
+        scale[t] = s
+        for j in range(K):
+            alpha[t, j] /= s
+    return alpha, b, scale, shift
+
+
+def _backward_loop(b, scale, transmat):
+    T, K = b.shape
+    beta = np.empty((T, K))
+    for j in range(K):
+        beta[T - 1, j] = 1.0
+    w = np.empty(K)
+    for t in range(T - 2, -1, -1):
+        for j in range(K):
+            w[j] = b[t + 1, j] * beta[t + 1, j] / scale[t + 1]
+        for i in range(K):
+            acc = 0.0
+            for j in range(K):
+                acc += transmat[i, j] * w[j]
+            beta[t, i] = acc
+    return beta
+
+
+def _posteriors_loop(alpha, beta):
+    T, K = alpha.shape
+    gamma = np.empty((T, K))
+    for t in range(T):
+        s = 0.0
+        for j in range(K):
+            gamma[t, j] = alpha[t, j] * beta[t, j]
+            s += gamma[t, j]
+        for j in range(K):
+            gamma[t, j] /= s
+    return gamma
+
+
+def _xi_sum_loop(alpha, beta, b, scale, transmat):
+    T, K = b.shape
+    xi = np.zeros((K, K))
+    for t in range(T - 1):
+        c = scale[t + 1]
+        for i in range(K):
+            a = alpha[t, i]
+            for j in range(K):
+                xi[i, j] += a * transmat[i, j] * b[t + 1, j] * beta[t + 1, j] / c
+    return xi
+
+
+def _predict_loop(alpha, transmat):
+    # Same accumulation order as the recursion in _forward_loop
+    K = alpha.shape[0]
+    prior = np.empty(K)
+    for j in range(K):
+        acc = 0.0
+        for i in range(K):
+            acc += alpha[i] * transmat[i, j]
+        prior[j] = acc
+    return prior
+
+
+def _viterbi_loop(log_b, log_startprob, log_transmat):
+    T, K = log_b.shape
+    back = np.empty((T, K), dtype=np.int64)
+    delta = np.empty(K)
+    new = np.empty(K)
+    for j in range(K):
+        delta[j] = log_startprob[j] + log_b[0, j]
+    for t in range(1, T):
+        for j in range(K):
+            best_i = 0
+            best = delta[0] + log_transmat[0, j]
+            for i in range(1, K):
+                v = delta[i] + log_transmat[i, j]
+                if v > best:
+                    best = v
+                    best_i = i
+            back[t, j] = best_i
+            new[j] = best + log_b[t, j]
+        for j in range(K):
+            delta[j] = new[j]
+    path = np.empty(T, dtype=np.int64)
+    best_j = 0
+    for j in range(1, K):
+        if delta[j] > delta[best_j]:
+            best_j = j
+    path[T - 1] = best_j
+    for t in range(T - 1, 0, -1):
+        path[t - 1] = back[t, path[t]]
+    return delta[best_j], path
+
+
+if HAVE_NUMBA:
+    _log_emissions = numba.njit(cache=True)(_log_emissions_loop)
+    _forward_scaled = numba.njit(cache=True)(_forward_loop)
+    _backward = numba.njit(cache=True)(_backward_loop)
+    _posteriors = numba.njit(cache=True)(_posteriors_loop)
+    _xi_sum = numba.njit(cache=True)(_xi_sum_loop)
+    _viterbi = numba.njit(cache=True)(_viterbi_loop)
+    _predict = numba.njit(cache=True)(_predict_loop)
+else:
+    _log_emissions = _log_emissions_np
+    _forward_scaled = _forward_np
+    _backward = _backward_np
+    _posteriors = _posteriors_np
+    _xi_sum = _xi_sum_np
+    _viterbi = _viterbi_np
+    _predict = _predict_np
+
+
+# Public entry points -------------------------------------------------------
+
+
+def log_emissions_diag(X, means, covars):
+    """(T, K) log N(x_t | mu_k, diag(var_k))."""
+    return _log_emissions(
+        np.ascontiguousarray(X, dtype=float),
+        np.ascontiguousarray(means, dtype=float),
+        np.ascontiguousarray(covars, dtype=float),
+    )
+
+
+def forward(log_b, startprob, transmat):
+    """Normalised forward messages (T, K) and log p(X)."""
+    alpha, _, scale, shift = _forward_scaled(log_b, startprob, transmat)
+    return alpha, np.log(scale).sum() + shift.sum()
+
+
+def filtered(log_b, startprob, transmat):
+    """Normalised forward messages p(z_t | x_1..t), without the likelihood."""
+    return _forward_scaled(log_b, startprob, transmat)[0]
+
+
+def predict(alpha, transmat):
+    """One-step state prediction p(z_t+1 | x_1..t) from filtered probabilities."""
+    return _predict(alpha, transmat)
+
+
+def filter_step(alpha_prev, log_b_row, startprob, transmat):
+    """One forward-filter update: p(z_t | x_1..t) from p(z_t-1 | x_1..t-1).
+
+    `alpha_prev` is None at the first observation. Bit-identical to the
+    matching row of `forward` over the whole sequence.
+    """
+    prior = startprob if alpha_prev is None else predict(alpha_prev, transmat)
+    alpha, _, _, _ = _forward_scaled(log_b_row[None, :], prior, transmat)
+    return alpha[0]
+
+
+def forward_backward(log_b, startprob, transmat, with_xi=True):
+    """Smoothed posteriors (T, K), expected transition counts (K, K), log p(X)."""
+    alpha, b, scale, shift = _forward_scaled(log_b, startprob, transmat)
+    beta = _backward(b, scale, transmat)
+    gamma = _posteriors(alpha, beta)
+    if with_xi and len(b) > 1:
+        xi = _xi_sum(alpha, beta, b, scale, transmat)
+    else:
+        xi = np.zeros_like(transmat)
+    return gamma, xi, np.log(scale).sum() + shift.sum()
+
+
+def sufficient_statistics(X, log_b, startprob, transmat):
+    """Baum-Welch E-step for diagonal emissions (hmmlearn stats layout)."""
+    gamma, xi, loglik = forward_backward(log_b, startprob, transmat)
+    stats = {
+        "nobs": 1,
+        "start": gamma[0].copy(),
+        "trans": xi,
+        "post": gamma.sum(axis=0),
+        "obs": gamma.T @ X,
+        "obs**2": gamma.T @ X**2,
+    }
+    return stats, gamma, loglik
+
+
+def viterbi(log_b, startprob, transmat):
+    """MAP state path and its log-probability."""
+    with np.errstate(divide="ignore"):
+        log_startprob = np.log(startprob)
+        log_transmat = np.log(transmat)
+    logprob, path = _viterbi(
+        np.ascontiguousarray(log_b), log_startprob, np.ascontiguousarray(log_transmat)
+    )
+    return float(logprob), path
@@ -0,0 +1,207 @@
+import multiprocessing as mp
+from typing import Callable, Optional
+
+import numpy as np
+import pandas as pd
+from scipy import stats as sps
+
+from .segments import _encode
+
+# -------------------------
+# Monte Carlo permutation test (MCPT) per regime
+# -------------------------
+# The strategy is a vectorized function of log-price paths: given an
+# (n_paths, n_bars) array it returns the strategy's return on every bar,
+# same shape. It runs once on the real path and on batches of permuted
+# paths, whose bar returns are shuffled within each regime (labels stay in
+# place, so a regime keeps its own return distribution but loses any
+# serial structure). Per regime, PF = gains / losses of the strategy's
+# returns on the regime's bars, and the p-value is
+# (1 + #{permuted PF >= real PF}) / (1 + n_permutations).
+#
+# Permutation chunks draw from `SeedSequence(seed).spawn(...)` in order, so
+# results depend on the seed only, not on n_jobs. Chunks run in waves of
+# n_jobs; workers hold one chunk of paths at a time and send back PFs only.
+# With early stopping, the run ends after the first chunk (in seed order)
+# at which every regime's p-value is on one side of alpha with `confidence`
+# (Clopper-Pearson interval); later chunks of that wave are dropped.
+
+ALL = "all"  # row pooling every labelled bar
+
+
+def momentum_returns(paths, lookback=20):
+    """Example strategy: long/short the sign of the `lookback`-bar return,
+    held over the next bar. Use functools.partial to set `lookback`."""
+    paths = np.atleast_2d(paths)
+    out = np.zeros_like(paths)
+    signal = np.sign(paths[:, lookback:-1] - paths[:, : -lookback - 1])
+    out[:, lookback + 1 :] = signal * np.diff(paths[:, lookback:], axis=1)
+    return out
+
+
+def _regime_matrix(codes, k):
+    """(n, k + 1) one-hot of the bars' regimes, plus an all-regimes column."""
+    onehot = np.zeros((len(codes), k + 1))
+    labelled = codes >= 0
+    onehot[np.flatnonzero(labelled), codes[labelled]] = 1.0
+    onehot[:, k] = labelled
+    return onehot
+
+
+def _profit_factors(strat_ret, onehot):
+    """(n_paths, k + 1) PF of each path over each regime's bars."""
+    r = np.nan_to_num(np.atleast_2d(strat_ret))
+    gains = np.maximum(r, 0.0) @ onehot
+    losses = np.maximum(-r, 0.0) @ onehot
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return gains / losses
+
+
+class _Permuter:
+    """Builds batches of within-regime permuted log-price paths."""
+
+    def __init__(self, log_close, codes, strategy):
+        self.p0 = log_close[0]
+        self.ret = np.diff(log_close, prepend=log_close[0])
+        # Grouping key: regime, then a uniform draw breaks ties at random
+        self.key = (codes - codes.min()).astype(float)
+        self.base = np.argsort(codes, kind="stable")
+        self.onehot = _regime_matrix(codes, int(codes.max()) + 1)
+        self.strategy = strategy
+
+    def chunk(self, seed, size):
+        rng = np.random.default_rng(seed)
+        order = np.argsort(self.key + rng.random((size, len(self.key))), axis=1)
+        perm = np.empty_like(order)
+        perm[:, self.base] = order
+        paths = np.cumsum(self.ret[perm], axis=1)
+        paths += self.p0
+        return _profit_factors(self.strategy(paths), self.onehot)
+
+
+_WORKER: Optional[_Permuter] = None
+
+
+def _init_worker(log_close, codes, strategy):
+    global _WORKER
+    _WORKER = _Permuter(log_close, codes, strategy)
+
+
+def _worker_chunk(seed, size):
+    return _WORKER.chunk(seed, size)
+
+
+def _p_interval(exceed, n, confidence):
+    """Clopper-Pearson interval of the exceedance probability."""
+    a = (1 - confidence) / 2
+    with np.errstate(invalid="ignore"):
+        lo = np.where(exceed > 0, sps.beta.ppf(a, exceed, n - exceed + 1), 0.0)
+        hi = np.where(exceed < n, sps.beta.ppf(1 - a, exceed + 1, n - exceed), 1.0)
+    return lo, hi
+
+
+def run_mcpt(
+    df: pd.DataFrame,
+    strategy: Callable[[np.ndarray], np.ndarray],
+    label_col="final_regime",
+    price_col="close",
+    n_permutations=1000,
+    chunk_size=100,
+    n_jobs=1,
+    seed=0,
+    alpha=0.05,
+    early_stop=True,
+    min_permutations=200,
+    confidence=0.99,
+) -> pd.DataFrame:
+    """Permutation test of `strategy` on each regime of a labelled export.
+
+    `df` holds `price_col` and `label_col` per bar (sorted by time).
+    `strategy` maps (n_paths, n_bars) log-price paths to per-bar strategy
+    returns and must be picklable (a top-level function or a
+    functools.partial) when n_jobs > 1. Permutations run in chunks of
+    `chunk_size` over `n_jobs` spawned processes; with `early_stop`, after
+    at least `min_permutations`, once every p-value is resolved against
+    `alpha`.
+
+    Returns one row per regime plus an "all" row: n_bars, pf (real),
+    perm_pf_median, p_value with its `confidence` interval (ci_low,
+    ci_high), n_permutations and resolved.
+    """
+    if n_permutations < 1:
+        raise ValueError("n_permutations must be at least 1")
+    df = df[df[price_col].notna()]
+    log_close = np.log(df[price_col].to_numpy(dtype=float))
+    codes, labels = _encode(df[label_col])
+    if len(log_close) < 2 or not labels:
+        raise ValueError("Need at least two priced bars with a regime label")
+    permuter = _Permuter(log_close, codes, strategy)
+    k = len(labels)
+    real_pf = _profit_factors(strategy(log_close[None, :]), permuter.onehot)[0]
+
+    n_chunks = -(-n_permutations // chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    sizes = [min(chunk_size, n_permutations - i * chunk_size) for i in range(n_chunks)]
+    exceed = np.zeros(k + 1, dtype=np.int64)
+    pf_chunks = []
+    done = 0
+    wave = max(n_jobs, 1)
+
+    def tally(pfs):
+        nonlocal exceed, done
+        # A NaN permuted PF (no trades) never beats the real one
+        exceed += (pfs >= real_pf).sum(axis=0)
+        done += len(pfs)
+        pf_chunks.append(pfs)
+
+    def resolved():
+        lo, hi = _p_interval(exceed, done, confidence)
+        return ((hi < alpha) | (lo > alpha)) | np.isnan(real_pf)
+
+    pool = None
+    if n_jobs > 1:
+        # spawn keeps workers from inheriting the parent's frames
+        ctx = mp.get_context("spawn")
+        pool = ctx.Pool(
+            processes=n_jobs,
+            initializer=_init_worker,
+            initargs=(log_close, codes, strategy),
+        )
+    try:
+        for start in range(0, n_chunks, wave):
+            tasks = list(zip(seeds[start : start + wave], sizes[start : start + wave]))
+            if pool is None:
+                results = [permuter.chunk(*t) for t in tasks]
+            else:
+                results = pool.starmap(_worker_chunk, tasks)
+            stop = False
+            for pfs in results:
+                tally(pfs)
+                stop = early_stop and done >= min_permutations and resolved().all()
+                if stop:
+                    break
+            if stop:
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    pfs = np.concatenate(pf_chunks)
+    ci_low, ci_high = _p_interval(exceed, done, confidence)
+    with np.errstate(invalid="ignore"):
+        perm_median = np.nanmedian(np.where(np.isinf(pfs), np.nan, pfs), axis=0)
+    n_bars = np.append(np.bincount(codes[codes >= 0], minlength=k), (codes >= 0).sum())
+    return pd.DataFrame(
+        {
+            "label": list(labels) + [ALL],
+            "n_bars": n_bars,
+            "pf": real_pf,
+            "perm_pf_median": perm_median,
+            "p_value": np.where(np.isnan(real_pf), np.nan, (exceed + 1) / (done + 1)),
+            "ci_low": ci_low,
+            "ci_high": ci_high,
+            "n_permutations": done,
+            "resolved": resolved(),
+        }
+    )
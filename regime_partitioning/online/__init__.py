@@ -0,0 +1,13 @@
+from .indicator import build_regime_indicator
+from .ingest import (
+    BarQueue,
+    RegimeEvent,
+    RegimeIngestor,
+    ReplaySource,
+    SocketSource,
+    WebSocketSource,
+    serve_bars,
+)
+from .replay import ReplayResult, iter_close_chunks, replay_indicator, replay_many
+from .streaming import IndicatorState, RegimeStreamingDetector, reg_columns
+from .windows import Window, WindowRule, WindowState
@@ -0,0 +1,55 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# -------------------------
+# Per-bar HMM inputs from closes
+# -------------------------
+# Same definitions as the dataset builders: ret = log(close / prev close),
+# rv_20d = rolling sample std of ret * sqrt(252). The batch and the per-bar
+# paths take the std over the same ordered window of returns, so they agree
+# bit for bit; a window holding a NaN return yields NaN (as rolling(20) does).
+
+RV_WINDOW = 20
+ANNUALIZATION = np.sqrt(252)
+
+# Windows per std call in the batch path; bounds the (chunk x window) temporary
+_CHUNK = 1 << 18
+
+
+def empty_returns(window=RV_WINDOW):
+    """Return buffer of a series with no bars yet."""
+    return np.full(window, np.nan)
+
+
+def bar_features(close, prev_close=np.nan, rets=None):
+    """(n, 2) array of [ret, rv] for `close`.
+
+    `prev_close` and `rets` (the last `window` returns before the first bar)
+    continue a series from an earlier chunk; defaults start a new one.
+    Returns (features, last close, updated return buffer).
+    """
+    close = np.asarray(close, dtype=float)
+    rets = empty_returns() if rets is None else rets
+    window = len(rets)
+    n = len(close)
+    out = np.empty((n, 2))
+    if n == 0:
+        return out, prev_close, rets
+    with np.errstate(divide="ignore", invalid="ignore"):
+        np.log(close / np.concatenate(([prev_close], close[:-1])), out=out[:, 0])
+    ext = np.concatenate((rets, out[:, 0]))
+    for s in range(0, n, _CHUNK):
+        e = min(s + _CHUNK, n)
+        # Windows ending at bars s..e-1 start at ext positions s+1..e
+        view = sliding_window_view(ext[s + 1 : e + window], window)
+        out[s:e, 1] = view.std(axis=1, ddof=1) * ANNUALIZATION
+    return out, close[-1], ext[-window:].copy()
+
+
+def step_features(close, prev_close, rets):
+    """Per-bar counterpart of `bar_features`; shifts `rets` in place."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret = np.log(np.array([close / prev_close]))[0]
+    rets[:-1] = rets[1:]
+    rets[-1] = ret
+    return ret, rets.std(ddof=1) * ANNUALIZATION
@@ -0,0 +1,65 @@
+import numpy as np
+
+from .. import hmm_kernels
+from ..walkforward import REGIME_LABELS, RISK_OFF, RISK_ON, _risk_on_state
+
+
+class HMMTracker:
+    """Forward-filter scorer for a fitted diagonal GaussianHMM and its scaler.
+
+    Works with either HMM backend (`fast_hmm.make_hmm`). `target_state` is
+    the state windows track; it defaults to the risk_off state of a 2-state
+    model (the higher-rv state otherwise), the "abnormal" regime.
+    """
+
+    def __init__(self, model, scaler, target_state=None):
+        self.startprob = np.asarray(model.startprob_, dtype=float)
+        self.transmat = np.ascontiguousarray(model.transmat_, dtype=float)
+        self.means = np.ascontiguousarray(model.means_, dtype=float)
+        self.covars = np.array([np.diag(cov) for cov in model.covars_])
+        self.mean = np.asarray(scaler.mean_, dtype=float)
+        self.scale = np.asarray(scaler.scale_, dtype=float)
+        self.n_states = len(self.startprob)
+        if self.n_states == 2:
+            # Labelled as in the exports (walkforward._risk_on_state)
+            risk_on_state = _risk_on_state(model)
+            if target_state is None:
+                target_state = 1 - risk_on_state
+            risk_on = target_state == risk_on_state
+            self.label = REGIME_LABELS[RISK_ON if risk_on else RISK_OFF]
+        else:
+            if target_state is None:
+                target_state = int(np.argmax(self.means[:, 1]))
+            self.label = f"state_{target_state}"
+        self.target_state = target_state
+
+    def log_emissions(self, X):
+        return hmm_kernels.log_emissions_diag(
+            (X - self.mean) / self.scale, self.means, self.covars
+        )
+
+    def filter(self, X, alpha=None):
+        """Filtered posteriors (n, K) for the rows of `X`, NaN where a row has
+        missing features; `alpha` continues from an earlier chunk.
+
+        Returns (posteriors, last filtered alpha).
+        """
+        post = np.full((len(X), self.n_states), np.nan)
+        valid = np.flatnonzero(np.isfinite(X).all(axis=1))
+        if len(valid) == 0:
+            return post, alpha
+        prior = (
+            self.startprob
+            if alpha is None
+            else hmm_kernels.predict(alpha, self.transmat)
+        )
+        filtered = hmm_kernels.filtered(
+            self.log_emissions(X[valid]), prior, self.transmat
+        )
+        post[valid] = filtered
+        return post, filtered[-1].copy()
+
+    def step(self, x, alpha=None):
+        """Filtered posterior after one more observation `x` (length D)."""
+        log_b = self.log_emissions(np.asarray(x, dtype=float)[None, :])[0]
+        return hmm_kernels.filter_step(alpha, log_b, self.startprob, self.transmat)
@@ -0,0 +1,76 @@
+import copy
+
+import numpy as np
+import pandas as pd
+
+from .features import bar_features
+from .hmm_tracker import HMMTracker
+from .streaming import IndicatorState, reg_columns
+from .windows import WindowRule, debounce_windows
+
+_CHUNK = 1 << 16
+
+
+def build_regime_indicator(
+    close: pd.Series,
+    hmm_model,
+    scaler,
+    theta_open=0.80,
+    theta_close=0.50,
+    k=2,
+    k_out=2,
+    L_min=2,
+    target_state=None,
+    state: IndicatorState = None,
+    return_state=False,
+):
+    """Causal regime indicator over a close series, one row per bar.
+
+    Columns (see docs/dc-stream-notes.md): `reg_state` (MAP of the filtered
+    posterior, -1 during feature warm-up), `reg_p0..`, `reg_open` /
+    `reg_close` (1 on the bar that confirms a window of `target_state`),
+    `reg_window_id`, `reg_age` (bars since the last open, -1 before any)
+    and `reg_conf`. Posteriors come from one forward recursion over the
+    series; the debounce runs on run lengths of the threshold masks.
+
+    `state` continues from an earlier chunk or from a
+    `RegimeStreamingDetector`; with `return_state`, returns (frame, state).
+    """
+    rule = WindowRule(theta_open, theta_close, k, k_out, L_min)
+    tracker = HMMTracker(hmm_model, scaler, target_state)
+    st = copy.deepcopy(state) if state is not None else IndicatorState()
+
+    values = close.to_numpy(dtype=float)
+    K = tracker.n_states
+    # Probability columns and reg_conf share one block, filled in place
+    probs = np.empty((K + 1, len(values)))
+    post = probs[:K].T
+    # Features and filtering run per chunk, carrying state, so temporaries
+    # stay cache-sized
+    for s in range(0, len(values), _CHUNK):
+        X, st.prev_close, st.rets = bar_features(
+            values[s : s + _CHUNK], st.prev_close, st.rets
+        )
+        post[s : s + _CHUNK], st.alpha = tracker.filter(X, st.alpha)
+    opened, closed, window_id, age, st.windows = debounce_windows(
+        post[:, tracker.target_state], rule, close.index, st.windows
+    )
+    if len(close):
+        st.last_index = close.index[-1]
+
+    np.max(post, axis=1, out=probs[K])
+    cols = reg_columns(K)
+    prob_cols = [*cols[1 : K + 1], "reg_conf"]
+    out = pd.DataFrame(probs.T, index=close.index, columns=prob_cols)
+    # insert() adds blocks without consolidating (copying) the float block
+    state_col = np.where(np.isnan(probs[K]), -1, post.argmax(axis=1))
+    out.insert(0, "reg_state", state_col.astype(np.int8))
+    flags = {
+        "reg_open": opened,
+        "reg_close": closed,
+        "reg_window_id": window_id,
+        "reg_age": age,
+    }
+    for col, values in flags.items():
+        out.insert(cols.index(col), col, values)
+    return (out, st) if return_state else out
@@ -0,0 +1,425 @@
+import asyncio
+import inspect
+import json
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Callable, Dict, Mapping, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from .streaming import RegimeStreamingDetector
+from .windows import Window
+
+# -------------------------
+# Live bar ingestion
+# -------------------------
+# source -> per-symbol bounded queue -> RegimeStreamingDetector -> subscribers
+# A bar is a dict {'symbol', 't', 'close', ...}; ticks are bars with only a
+# close. Each bar is stamped on arrival; latency is measured from there to
+# the end of its detector update (every bar) and to the publication of the
+# regime event it triggered (opens/closes only), i.e. just before the
+# subscribers are called. Subscriber runtime is timed separately.
+#
+# Queue policies when a symbol's queue is full:
+# - block:       the producer waits (backpressure reaches the source);
+# - drop_oldest: the oldest queued bar is discarded;
+# - drop_newest: the incoming bar is discarded;
+# - coalesce:    the incoming bar is merged into the newest queued one.
+# Dropping or coalescing means the next return spans several bars.
+
+QUEUE_POLICIES = ("block", "drop_oldest", "drop_newest", "coalesce")
+
+
+# -------------------------
+# Sources
+# -------------------------
+def parse_json_bar(message) -> dict:
+    """One JSON object per message, with `t` parsed to a Timestamp."""
+    bar = json.loads(message)
+    bar["t"] = pd.Timestamp(bar["t"])
+    return bar
+
+
+class BarSource:
+    """Async iterable of bars."""
+
+    def __aiter__(self):
+        return self.bars()
+
+    async def bars(self):
+        raise NotImplementedError
+        yield
+
+
+class WebSocketSource(BarSource):
+    """Bars from a websocket feed; needs the optional `websockets` package.
+
+    `subscribe` (a dict or a string) is sent once after connecting; `parse`
+    maps each message to a bar, or to None for messages to skip.
+    """
+
+    def __init__(self, url, subscribe=None, parse: Callable = parse_json_bar):
+        self.url = url
+        self.subscribe = subscribe
+        self.parse = parse
+
+    async def bars(self):
+        # Imported lazily so the other sources work without it installed
+        import websockets
+
+        async with websockets.connect(self.url) as ws:
+            if self.subscribe is not None:
+                msg = self.subscribe
+                await ws.send(msg if isinstance(msg, str) else json.dumps(msg))
+            async for message in ws:
+                bar = self.parse(message)
+                if bar is not None:
+                    yield bar
+
+
+class SocketSource(BarSource):
+    """Newline-delimited bars over TCP; a local stand-in for a live feed
+    (see `serve_bars`)."""
+
+    def __init__(self, host="127.0.0.1", port=8765, parse: Callable = parse_json_bar):
+        self.host = host
+        self.port = port
+        self.parse = parse
+
+    async def bars(self):
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            while line := await reader.readline():
+                bar = self.parse(line)
+                if bar is not None:
+                    yield bar
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+
+class ReplaySource(BarSource):
+    """Stored bars of several symbols replayed in time order.
+
+    `speed` scales the gaps between bar times (60 plays an hour of bars in
+    a minute); None replays as fast as the consumers allow.
+    """
+
+    def __init__(
+        self,
+        frames: Mapping[str, pd.DataFrame],
+        speed: Optional[float] = None,
+        columns: Sequence[str] = ("close",),
+    ):
+        if speed is not None and speed <= 0:
+            raise ValueError("speed must be positive (or None)")
+        self.speed = speed
+        self.columns = list(columns)
+        symbols = list(frames)
+        # Merge once into flat arrays ordered by time (stable across symbols)
+        times = np.concatenate(
+            [pd.DatetimeIndex(frames[s].index).asi8 for s in symbols]
+        )
+        codes = np.repeat(np.arange(len(symbols)), [len(frames[s]) for s in symbols])
+        values = np.concatenate(
+            [frames[s][self.columns].to_numpy(dtype=float) for s in symbols]
+        )
+        order = np.argsort(times, kind="stable")
+        self.symbols = symbols
+        self.times, self.codes, self.values = times[order], codes[order], values[order]
+
+    @classmethod
+    def from_price_source(
+        cls, symbols, start_date, end_date, granularity="D", speed=None
+    ) -> "ReplaySource":
+        from ..price_sources import get_forex_data_by_pair
+
+        frames = {
+            s: get_forex_data_by_pair(s, start_date, end_date, granularity)
+            for s in symbols
+        }
+        return cls(frames, speed)
+
+    async def bars(self):
+        loop = asyncio.get_running_loop()
+        wall0 = loop.time()
+        t0 = self.times[0] if len(self.times) else 0
+        for i in range(len(self.times)):
+            if self.speed is not None:
+                due = (self.times[i] - t0) / 1e9 / self.speed
+                delay = due - (loop.time() - wall0)
+                await asyncio.sleep(max(delay, 0.0))
+            else:
+                # Yield to the consumers, as a network read would
+                await asyncio.sleep(0)
+            bar = {
+                "symbol": self.symbols[self.codes[i]],
+                "t": pd.Timestamp(self.times[i]),
+            }
+            bar.update(zip(self.columns, self.values[i].tolist()))
+            yield bar
+
+
+async def serve_bars(source: BarSource, host="127.0.0.1", port=0):
+    """TCP server streaming `source` as newline-delimited JSON to each client.
+
+    Returns the started asyncio server; its bound port is
+    `server.sockets[0].getsockname()[1]`.
+    """
+
+    async def handle(reader, writer):
+        try:
+            async for bar in source:
+                bar = dict(bar, t=pd.Timestamp(bar["t"]).isoformat())
+                writer.write(json.dumps(bar).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    return await asyncio.start_server(handle, host, port)
+
+
+# -------------------------
+# Bounded queues
+# -------------------------
+def _coalesce(old, new):
+    """Merge bar `new` into the queued `old`: OHLC over both, summed volume."""
+    bar = dict(new)
+    if "open" in old:
+        bar["open"] = old["open"]
+    if "high" in old and "high" in new:
+        bar["high"] = max(old["high"], new["high"])
+    if "low" in old and "low" in new:
+        bar["low"] = min(old["low"], new["low"])
+    if "volume" in old and "volume" in new:
+        bar["volume"] = old["volume"] + new["volume"]
+    return bar
+
+
+class BarQueue:
+    """Bounded FIFO of (arrival time, bar) with an explicit overflow policy."""
+
+    def __init__(self, maxsize=1024, policy="block"):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"policy must be one of {QUEUE_POLICIES}")
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = deque()
+        self._not_empty = asyncio.Event()
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    async def put(self, arrival, bar):
+        if self.closed:
+            raise RuntimeError("put on a closed BarQueue")
+        self.received += 1
+        if len(self._items) >= self.maxsize:
+            if self.policy == "block":
+                while len(self._items) >= self.maxsize:
+                    self._not_full.clear()
+                    await self._not_full.wait()
+                    if self.closed:
+                        raise RuntimeError("BarQueue closed while blocked in put")
+            elif self.policy == "drop_newest":
+                self.dropped += 1
+                return
+            elif self.policy == "drop_oldest":
+                self._items.popleft()
+                self.dropped += 1
+            else:
+                # The merged bar keeps the earlier arrival, so its latency
+                # includes the time the first part spent queued
+                first, old = self._items[-1]
+                self._items[-1] = (first, _coalesce(old, bar))
+                self.coalesced += 1
+                return
+        self._items.append((arrival, bar))
+        self.high_water = max(self.high_water, len(self._items))
+        self._not_empty.set()
+
+    async def get(self):
+        """Next (arrival, bar), or None once closed and drained."""
+        while not self._items:
+            if self.closed:
+                return None
+            self._not_empty.clear()
+            await self._not_empty.wait()
+        item = self._items.popleft()
+        self._not_full.set()
+        return item
+
+    def close(self):
+        self.closed = True
+        self._not_empty.set()
+        self._not_full.set()
+
+
+# -------------------------
+# Latency
+# -------------------------
+class LatencyStats:
+    """Latency samples in seconds; quantiles over the last `capacity`."""
+
+    def __init__(self, capacity=100_000):
+        self._buf = np.empty(capacity)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self._buf[self.count % len(self._buf)] = seconds
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def summary(self, prefix="latency") -> Dict[str, float]:
+        recent = self._buf[: min(self.count, len(self._buf))]
+        p50, p99 = np.quantile(recent, [0.5, 0.99]) if self.count else (np.nan,) * 2
+        return {
+            f"{prefix}_mean": self.total / self.count if self.count else np.nan,
+            f"{prefix}_p50": p50,
+            f"{prefix}_p99": p99,
+            f"{prefix}_max": self.max if self.count else np.nan,
+        }
+
+
+# -------------------------
+# Router
+# -------------------------
+@dataclass
+class RegimeEvent:
+    symbol: str
+    kind: str  # "open" or "close"
+    window: Window
+    t: pd.Timestamp  # bar that confirmed the event
+    latency: float  # seconds from the bar's arrival to publication
+
+
+class RegimeIngestor:
+    """Route bars from a source to per-symbol detectors and publish window
+    open/close events to subscribers.
+
+    `detectors` maps symbol -> RegimeStreamingDetector, or is a factory
+    called with each new symbol. Bars of symbols without a detector are
+    counted as unrouted. Subscribers are callables (plain or async) taking
+    a `RegimeEvent`.
+    """
+
+    def __init__(
+        self,
+        detectors: Union[Mapping[str, RegimeStreamingDetector], Callable],
+        maxsize=1024,
+        policy="block",
+        clock: Callable[[], float] = time.perf_counter,
+    ):
+        if policy not in QUEUE_POLICIES:
+            raise ValueError(f"policy must be one of {QUEUE_POLICIES}")
+        self._factory = detectors if callable(detectors) else None
+        self.detectors = {} if callable(detectors) else dict(detectors)
+        self.maxsize = maxsize
+        self.policy = policy
+        self.clock = clock
+        self.queues: Dict[str, BarQueue] = {}
+        self.bar_latency: Dict[str, LatencyStats] = {}
+        self.event_latency: Dict[str, LatencyStats] = {}
+        self.callback_time: Dict[str, LatencyStats] = {}
+        self.n_events: Dict[str, int] = {}
+        self.unrouted = 0
+        self._subscribers = []
+        self._consumers = []
+
+    def subscribe(self, callback) -> Callable[[], None]:
+        """Register `callback`; returns a function that unregisters it."""
+        self._subscribers.append(callback)
+        return lambda: self._subscribers.remove(callback)
+
+    def _queue_for(self, symbol) -> Optional[BarQueue]:
+        queue = self.queues.get(symbol)
+        if queue is not None:
+            return queue
+        if symbol not in self.detectors:
+            if self._factory is None:
+                return None
+            self.detectors[symbol] = self._factory(symbol)
+        queue = self.queues[symbol] = BarQueue(self.maxsize, self.policy)
+        self.bar_latency[symbol] = LatencyStats()
+        self.event_latency[symbol] = LatencyStats()
+        self.callback_time[symbol] = LatencyStats()
+        self.n_events[symbol] = 0
+        self._consumers.append(asyncio.create_task(self._consume(symbol, queue)))
+        return queue
+
+    async def _consume(self, symbol, queue):
+        detector = self.detectors[symbol]
+        bar_latency = self.bar_latency[symbol]
+        try:
+            while (item := await queue.get()) is not None:
+                arrival, bar = item
+                windows = detector.update(bar["t"], bar["close"])
+                bar_latency.add(self.clock() - arrival)
+                for window in windows:
+                    await self._publish(symbol, bar["t"], window, arrival)
+        except BaseException:
+            # Stop the producer too; run() re-raises this from gather()
+            queue.close()
+            raise
+
+    async def _publish(self, symbol, t, window, arrival):
+        kind = "open" if window.end is None else "close"
+        published = self.clock()
+        event = RegimeEvent(symbol, kind, window, t, published - arrival)
+        self.event_latency[symbol].add(event.latency)
+        self.n_events[symbol] += 1
+        for callback in list(self._subscribers):
+            result = callback(event)
+            if inspect.isawaitable(result):
+                await result
+        self.callback_time[symbol].add(self.clock() - published)
+
+    async def run(self, source: BarSource) -> pd.DataFrame:
+        """Consume `source` to the end, drain the queues; returns `stats()`."""
+        try:
+            async for bar in source:
+                arrival = self.clock()
+                queue = self._queue_for(bar["symbol"])
+                if queue is None:
+                    self.unrouted += 1
+                    continue
+                await queue.put(arrival, bar)
+        finally:
+            for queue in self.queues.values():
+                queue.close()
+            consumers, self._consumers = self._consumers, []
+            await asyncio.gather(*consumers)
+        return self.stats()
+
+    def stats(self) -> pd.DataFrame:
+        """Per-symbol counters and latencies (seconds), one row per symbol."""
+        rows = {}
+        for symbol, queue in self.queues.items():
+            rows[symbol] = {
+                "received": queue.received,
+                "processed": self.bar_latency[symbol].count,
+                "dropped": queue.dropped,
+                "coalesced": queue.coalesced,
+                "queued": len(queue),
+                "high_water": queue.high_water,
+                "n_events": self.n_events[symbol],
+                **self.bar_latency[symbol].summary("latency"),
+                **self.event_latency[symbol].summary("event_latency"),
+                **self.callback_time[symbol].summary("callback_time"),
+            }
+        return pd.DataFrame.from_dict(rows, orient="index")
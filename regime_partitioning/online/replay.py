@@ -0,0 +1,550 @@
+import copy
+import multiprocessing as mp
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, Mapping, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import numba
+except ImportError:  # optional: the replay then runs as a plain Python loop
+    numba = None
+
+from ..price_sources import CsvPriceSource, TimedPriceSource, get_price_source
+from .features import ANNUALIZATION
+from .hmm_tracker import HMMTracker
+from .streaming import IndicatorState, reg_columns
+from .windows import WindowRule, WindowState
+
+# -------------------------
+# Historical replay of the per-bar detector
+# -------------------------
+# The loop below is RegimeStreamingDetector.update compiled over a chunk of
+# closes: returns ring buffer and std, standardisation, diagonal Gaussian
+# emissions, one forward-filter step and the window state machine, in the
+# same operation order as the per-bar code (the std replicates NumPy's
+# pairwise summation), so outputs match the detector and
+# build_regime_indicator bar for bar (the plain-Python fallback, without
+# numba, may differ in the last bits of the probabilities). Outputs go to
+# buffers allocated once per chunk size; detector state is carried between
+# chunks.
+
+_CHUNK = 1 << 20
+
+# Integer state carried by the kernel (WindowState plus filter bookkeeping);
+# window/streak starts are positions in the chunk, -1 for none, or one of
+# the markers below for the start times held by the incoming state
+(
+    _IN_WINDOW,
+    _OPEN_STREAK,
+    _CLOSE_STREAK,
+    _WINDOW_ID,
+    _AGE,
+    _STREAK_START,
+    _WINDOW_START,
+    _HAS_ALPHA,
+    _RING_POS,
+) = range(9)
+_PREV_STREAK_START, _PREV_WINDOW_START = -2, -3
+
+
+def _pairwise_sum(a, lo, n):
+    # numpy's pairwise_sum for n <= 128: eight accumulators, then the tail
+    if n < 8:
+        res = 0.0
+        for i in range(n):
+            res += a[lo + i]
+        return res
+    r0, r1, r2, r3 = a[lo], a[lo + 1], a[lo + 2], a[lo + 3]
+    r4, r5, r6, r7 = a[lo + 4], a[lo + 5], a[lo + 6], a[lo + 7]
+    i = 8
+    while i < n - (n % 8):
+        r0 += a[lo + i]
+        r1 += a[lo + i + 1]
+        r2 += a[lo + i + 2]
+        r3 += a[lo + i + 3]
+        r4 += a[lo + i + 4]
+        r5 += a[lo + i + 5]
+        r6 += a[lo + i + 6]
+        r7 += a[lo + i + 7]
+        i += 8
+    res = ((r0 + r1) + (r2 + r3)) + ((r4 + r5) + (r6 + r7))
+    while i < n:
+        res += a[lo + i]
+        i += 1
+    return res
+
+
+def _replay_loop(
+    ret,
+    ring,
+    alpha,
+    ws,
+    startprob,
+    transmat,
+    means,
+    covars,
+    mean,
+    scale,
+    target,
+    open_p,
+    close_p,
+    confirm_open,
+    confirm_close,
+    min_trends,
+    ann,
+    probs,
+    conf,
+    state,
+    opened,
+    closed,
+    window_id,
+    age,
+):
+    n = ret.shape[0]
+    K, D = means.shape
+    W = ring.shape[0] // 2
+    const = np.empty(K)
+    for k in range(K):
+        c = 0.0
+        for d in range(D):
+            c += np.log(2.0 * np.pi * covars[k, d])
+        const[k] = c
+    sq = np.empty(W)
+    x = np.empty(D)
+    log_b = np.empty(K)
+    prior = np.empty(K)
+
+    in_window, wid, ag = ws[_IN_WINDOW], ws[_WINDOW_ID], ws[_AGE]
+    open_streak, close_streak = ws[_OPEN_STREAK], ws[_CLOSE_STREAK]
+    streak_start, window_start = ws[_STREAK_START], ws[_WINDOW_START]
+    has_alpha, pos = ws[_HAS_ALPHA], ws[_RING_POS]
+    for t in range(n):
+        # Features: the window is ring[pos:pos + W], oldest first
+        r = ret[t]
+        ring[pos] = r
+        ring[pos + W] = r
+        pos += 1
+        if pos == W:
+            pos = 0
+        mu = _pairwise_sum(ring, pos, W) / W
+        for i in range(W):
+            dev = ring[pos + i] - mu
+            sq[i] = dev * dev
+        x[0] = r
+        x[1] = np.sqrt(_pairwise_sum(sq, 0, W) / (W - 1)) * ann
+
+        # Forward filter
+        if np.isfinite(x[0]) and np.isfinite(x[1]):
+            for k in range(K):
+                acc = const[k]
+                for d in range(D):
+                    diff = (x[d] - mean[d]) / scale[d] - means[k, d]
+                    acc += diff * diff / covars[k, d]
+                log_b[k] = -0.5 * acc
+            if has_alpha:
+                for j in range(K):
+                    acc = 0.0
+                    for i in range(K):
+                        acc += alpha[i] * transmat[i, j]
+                    prior[j] = acc
+            else:
+                for j in range(K):
+                    prior[j] = startprob[j]
+            m = log_b[0]
+            for j in range(1, K):
+                if log_b[j] > m:
+                    m = log_b[j]
+            s = 0.0
+            for j in range(K):
+                alpha[j] = prior[j] * np.exp(log_b[j] - m)
+                s += alpha[j]
+            best = 0
+            for j in range(K):
+                alpha[j] /= s
+                probs[t, j] = alpha[j]
+                if alpha[j] > alpha[best]:
+                    best = j
+            has_alpha = 1
+            state[t] = best
+            conf[t] = alpha[best]
+            p = alpha[target]
+        else:
+            for j in range(K):
+                probs[t, j] = np.nan
+            state[t] = -1
+            conf[t] = np.nan
+            p = np.nan
+
+        # Window state machine (WindowStateMachine.on_prob)
+        opened[t] = 0
+        closed[t] = 0
+        if ag >= 0:
+            ag += 1
+        if not in_window:
+            if p >= open_p:
+                open_streak += 1
+                if open_streak == 1:
+                    streak_start = t
+            else:
+                open_streak = 0
+                streak_start = -1
+            if open_streak >= confirm_open:
+                in_window = 1
+                open_streak = 0
+                close_streak = 0
+                wid += 1
+                ag = 0
+                window_start, streak_start = streak_start, -1
+                opened[t] = 1
+        else:
+            close_streak = close_streak + 1 if p <= close_p else 0
+            if close_streak >= confirm_close and ag >= min_trends:
+                in_window = 0
+                open_streak = 0
+                close_streak = 0
+                closed[t] = 1
+        window_id[t] = wid
+        age[t] = ag
+
+    ws[_IN_WINDOW], ws[_WINDOW_ID], ws[_AGE] = in_window, wid, ag
+    ws[_OPEN_STREAK], ws[_CLOSE_STREAK] = open_streak, close_streak
+    ws[_STREAK_START], ws[_WINDOW_START] = streak_start, window_start
+    ws[_HAS_ALPHA], ws[_RING_POS] = has_alpha, pos
+
+
+if numba is not None:
+    _pairwise_sum = numba.njit(cache=True)(_pairwise_sum)
+    _replay = numba.njit(cache=True)(_replay_loop)
+else:
+    _replay = _replay_loop
+
+
+class _Buffers:
+    """Kernel outputs for up to `size` bars, reused chunk after chunk."""
+
+    # Every view is C-contiguous, so each chunk reuses one compiled kernel
+    def __init__(self, size, n_states):
+        self.probs = np.empty((size, n_states))
+        self.conf = np.empty(size)
+        self.state = np.empty(size, dtype=np.int8)
+        self.opened = np.empty(size, dtype=np.int8)
+        self.closed = np.empty(size, dtype=np.int8)
+        self.window_id = np.empty(size, dtype=np.int64)
+        self.age = np.empty(size, dtype=np.int64)
+
+    def views(self, n):
+        return (
+            self.probs[:n],
+            self.conf[:n],
+            self.state[:n],
+            self.opened[:n],
+            self.closed[:n],
+            self.window_id[:n],
+            self.age[:n],
+        )
+
+
+# -------------------------
+# Replay of one close series
+# -------------------------
+@dataclass
+class ReplayResult:
+    """Outcome of one replay; `outputs` holds the per-bar arrays when kept."""
+
+    symbol: str
+    rule: WindowRule
+    n_bars: int
+    n_opens: int
+    n_closes: int
+    seconds: float  # inside the replay loop
+    load_seconds: float  # reading prices
+    state: IndicatorState
+    index: Optional[pd.DatetimeIndex] = None
+    outputs: Optional[Dict[str, np.ndarray]] = None
+
+    @property
+    def bars_per_second(self) -> float:
+        return self.n_bars / self.seconds if self.seconds > 0 else np.nan
+
+    def frame(self) -> pd.DataFrame:
+        """The kept outputs in the `build_regime_indicator` layout."""
+        if self.outputs is None:
+            raise ValueError("replay ran with keep_outputs=False")
+        out = self.outputs
+        K = out["probs"].shape[1]
+        cols = reg_columns(K)
+        prob_cols = [*cols[1 : K + 1], "reg_conf"]
+        block = np.column_stack([out["probs"], out["conf"]])
+        df = pd.DataFrame(block, index=self.index, columns=prob_cols)
+        df.insert(0, "reg_state", out["state"])
+        for col in ("reg_open", "reg_close", "reg_window_id", "reg_age"):
+            df.insert(cols.index(col), col, out[col[4:]])
+        return df
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "symbol": self.symbol,
+            **asdict(self.rule),
+            "n_bars": self.n_bars,
+            "n_opens": self.n_opens,
+            "n_closes": self.n_closes,
+            "seconds": self.seconds,
+            "load_seconds": self.load_seconds,
+            "bars_per_second": self.bars_per_second,
+        }
+
+
+def _kernel_state(st: IndicatorState, n_states):
+    w = st.windows
+    ws = np.array(
+        [
+            w.in_window,
+            w.open_streak,
+            w.close_streak,
+            w.window_id,
+            w.age,
+            -1 if w.streak_start is None else _PREV_STREAK_START,
+            -1 if w.window_start is None else _PREV_WINDOW_START,
+            st.alpha is not None,
+            0,
+        ],
+        dtype=np.int64,
+    )
+    ring = np.concatenate((st.rets, st.rets))
+    alpha = np.zeros(n_states) if st.alpha is None else st.alpha.astype(float)
+    return ws, ring, alpha
+
+
+def _store_state(st: IndicatorState, ws, ring, alpha, index):
+    w = st.windows
+    previous = {_PREV_STREAK_START: w.streak_start, _PREV_WINDOW_START: w.window_start}
+
+    def stamp(pos):
+        return None if pos == -1 else previous[pos] if pos < 0 else index[pos]
+
+    st.windows = WindowState(
+        in_window=bool(ws[_IN_WINDOW]),
+        open_streak=int(ws[_OPEN_STREAK]),
+        close_streak=int(ws[_CLOSE_STREAK]),
+        window_id=int(ws[_WINDOW_ID]),
+        age=int(ws[_AGE]),
+        streak_start=stamp(ws[_STREAK_START]),
+        window_start=stamp(ws[_WINDOW_START]),
+    )
+    W = len(st.rets)
+    pos = int(ws[_RING_POS])
+    st.rets = ring[pos : pos + W].copy()
+    st.alpha = alpha.copy() if ws[_HAS_ALPHA] else None
+    # Starts now live in the state as timestamps; the next chunk keeps them
+    ws[_STREAK_START] = -1 if st.windows.streak_start is None else _PREV_STREAK_START
+    ws[_WINDOW_START] = -1 if st.windows.window_start is None else _PREV_WINDOW_START
+
+
+def replay_indicator(
+    chunks: Union[pd.Series, Iterable[pd.Series]],
+    hmm_model,
+    scaler,
+    rule: WindowRule = None,
+    target_state=None,
+    state: IndicatorState = None,
+    keep_outputs=True,
+    symbol="",
+    chunk_size=_CHUNK,
+) -> ReplayResult:
+    """Replay closes through the per-bar detector logic.
+
+    `chunks` is a close Series (split into `chunk_size` pieces) or an
+    iterable of consecutive close Series, e.g. `iter_close_chunks`. Without
+    `keep_outputs` only counters and the final state are kept, and the
+    output buffers are reused for every chunk. Time spent producing chunks
+    is reported apart from the loop itself.
+    """
+    rule = rule if rule is not None else WindowRule()
+    tracker = HMMTracker(hmm_model, scaler, target_state)
+    K = tracker.n_states
+    st = copy.deepcopy(state) if state is not None else IndicatorState()
+    if isinstance(chunks, pd.Series):
+        series = chunks
+        chunks = (
+            series.iloc[s : s + chunk_size] for s in range(0, len(series), chunk_size)
+        )
+    ws, ring, alpha = _kernel_state(st, K)
+    params = (
+        tracker.startprob,
+        tracker.transmat,
+        tracker.means,
+        tracker.covars,
+        tracker.mean,
+        tracker.scale,
+        tracker.target_state,
+        float(rule.open_p),
+        float(rule.close_p),
+        int(rule.confirm_open),
+        int(rule.confirm_close),
+        int(rule.min_trends),
+        float(ANNUALIZATION),
+    )
+    # Compile (or load the cached kernel) before any timing starts
+    _replay(
+        np.empty(0),
+        ring.copy(),
+        alpha.copy(),
+        ws.copy(),
+        *params,
+        *_Buffers(0, K).views(0)
+    )
+    buffers = None
+    kept, index_parts = [], []
+    n_bars = n_opens = n_closes = 0
+    seconds = load_seconds = 0.0
+    iterator = iter(chunks)
+    while True:
+        t0 = time.perf_counter()
+        close = next(iterator, None)
+        load_seconds += time.perf_counter() - t0
+        if close is None:
+            break
+        n = len(close)
+        if n == 0:
+            continue
+        t0 = time.perf_counter()
+        values = close.to_numpy(dtype=float)
+        prev = np.concatenate(([st.prev_close], values[:-1]))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ret = np.log(values / prev)
+        if keep_outputs or buffers is None or buffers.conf.shape[0] < n:
+            buffers = _Buffers(max(n, 0 if keep_outputs else chunk_size), K)
+        views = buffers.views(n)
+        _replay(ret, ring, alpha, ws, *params, *views)
+        st.prev_close = values[-1]
+        st.last_index = close.index[-1]
+        _store_state(st, ws, ring, alpha, close.index)
+        seconds += time.perf_counter() - t0
+
+        n_bars += n
+        n_opens += int(views[3].sum())
+        n_closes += int(views[4].sum())
+        if keep_outputs:
+            kept.append(views)
+            index_parts.append(close.index)
+
+    index = outputs = None
+    if keep_outputs:
+        names = ("probs", "conf", "state", "open", "close", "window_id", "age")
+        outputs = {
+            name: (
+                np.concatenate([part[i] for part in kept])
+                if kept
+                else np.empty((0, K) if name == "probs" else 0)
+            )
+            for i, name in enumerate(names)
+        }
+        index = index_parts[0].append(index_parts[1:]) if index_parts else None
+    return ReplayResult(
+        symbol=symbol,
+        rule=rule,
+        n_bars=n_bars,
+        n_opens=n_opens,
+        n_closes=n_closes,
+        seconds=seconds,
+        load_seconds=load_seconds,
+        state=st,
+        index=index,
+        outputs=outputs,
+    )
+
+
+# -------------------------
+# Stored prices and parallel replays
+# -------------------------
+def iter_close_chunks(
+    symbol,
+    start_date=None,
+    end_date=None,
+    granularity="D",
+    chunk_size=_CHUNK,
+    price_col="close",
+    source=None,
+):
+    """Consecutive close Series of at most `chunk_size` bars.
+
+    A CSV source is streamed with `read_csv(chunksize=...)`; other sources
+    are fetched once and sliced.
+    """
+    source = source or get_price_source()
+    inner = source.inner if isinstance(source, TimedPriceSource) else source
+    if isinstance(inner, CsvPriceSource):
+        path = inner.path_for(symbol, granularity)
+        reader = pd.read_csv(
+            path,
+            usecols=["datetime", price_col],
+            parse_dates=["datetime"],
+            index_col="datetime",
+            chunksize=chunk_size,
+        )
+        with reader:
+            for part in reader:
+                close = part[price_col].sort_index().loc[start_date:end_date]
+                if len(close):
+                    yield close
+        return
+    close = source.get_forex_data_by_pair(symbol, start_date, end_date, granularity)
+    close = close[price_col]
+    for s in range(0, len(close), chunk_size):
+        yield close.iloc[s : s + chunk_size]
+
+
+def _replay_task(symbol, model, scaler, rule, target_state, load_args, keep_outputs):
+    """One (symbol, rule) replay; top-level so process pools can pickle it."""
+    chunks = iter_close_chunks(symbol, *load_args)
+    return replay_indicator(
+        chunks,
+        model,
+        scaler,
+        rule,
+        target_state,
+        keep_outputs=keep_outputs,
+        symbol=symbol,
+        chunk_size=load_args[3],
+    )
+
+
+def replay_many(
+    symbols: Iterable[str],
+    models: Union[Tuple[Any, Any], Mapping[str, Tuple[Any, Any]]],
+    rules: Sequence[WindowRule] = (WindowRule(),),
+    start_date=None,
+    end_date=None,
+    granularity="D",
+    target_state=None,
+    chunk_size=_CHUNK,
+    price_col="close",
+    n_jobs=1,
+    keep_outputs=False,
+):
+    """Replay every (symbol, rule) pair from stored prices.
+
+    `models` is one (hmm_model, scaler) pair for all symbols or a mapping
+    symbol -> pair. Pairs fan out over `n_jobs` spawned processes, each
+    reading its own prices. Returns (summary DataFrame with throughput per
+    replay, list of ReplayResult).
+    """
+    load_args = (start_date, end_date, granularity, chunk_size, price_col)
+    tasks = []
+    for symbol in symbols:
+        model, scaler = models[symbol] if isinstance(models, Mapping) else models
+        for rule in rules:
+            tasks.append(
+                (symbol, model, scaler, rule, target_state, load_args, keep_outputs)
+            )
+    if n_jobs > 1:
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(processes=n_jobs) as pool:
+            results = pool.starmap(_replay_task, tasks)
+    else:
+        results = [_replay_task(*a) for a in tasks]
+    summary = pd.DataFrame([r.summary() for r in results])
+    return summary, results
@@ -0,0 +1,91 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from .features import RV_WINDOW, empty_returns, step_features
+from .hmm_tracker import HMMTracker
+from .windows import Window, WindowRule, WindowState, WindowStateMachine
+
+
+def reg_columns(n_states=2):
+    """Indicator columns, in the order rows are emitted."""
+    probs = [f"reg_p{k}" for k in range(n_states)]
+    return [
+        "reg_state",
+        *probs,
+        "reg_open",
+        "reg_close",
+        "reg_window_id",
+        "reg_age",
+        "reg_conf",
+    ]
+
+
+@dataclass
+class IndicatorState:
+    """Everything needed to continue the indicator after the last bar seen."""
+
+    prev_close: float = np.nan
+    rets: np.ndarray = field(default_factory=lambda: empty_returns(RV_WINDOW))
+    alpha: Optional[np.ndarray] = None  # last filtered posterior
+    windows: WindowState = field(default_factory=WindowState)
+    last_index: Optional[pd.Timestamp] = None
+
+
+class RegimeStreamingDetector:
+    """Per-bar regime indicator: features, HMM forward filter, debounced windows.
+
+    Bar for bar identical to `build_regime_indicator` over the same closes
+    and model; a state returned by the batch builder continues here (and
+    `self.state` continues in the batch builder).
+    """
+
+    def __init__(
+        self,
+        hmm_model,
+        scaler,
+        rule: WindowRule = None,
+        target_state=None,
+        state: IndicatorState = None,
+    ):
+        self.tracker = HMMTracker(hmm_model, scaler, target_state)
+        self.rule = rule if rule is not None else WindowRule()
+        self.state = state if state is not None else IndicatorState()
+        self.windows = WindowStateMachine(
+            self.rule, self.tracker.label, self.state.windows
+        )
+        self.columns = reg_columns(self.tracker.n_states)
+        self.row = None  # reg_* values of the last bar, in `self.columns` order
+
+    def on_bar(self, bar: dict) -> List[Window]:
+        """Consume {'t', 'close', ...}; returns windows opened/closed at this bar."""
+        return self.update(bar["t"], bar["close"])
+
+    def update(self, t, close) -> List[Window]:
+        st = self.state
+        ret, rv = step_features(close, st.prev_close, st.rets)
+        st.prev_close = close
+        st.last_index = t
+        x = np.array([ret, rv])
+        if np.isfinite(x).all():
+            st.alpha = self.tracker.step(x, st.alpha)
+            post = st.alpha
+        else:
+            post = np.full(self.tracker.n_states, np.nan)
+        events = self.windows.on_prob(t, post[self.tracker.target_state])
+        ws = st.windows
+        opened = int(bool(events) and events[0].end is None)
+        closed = int(bool(events) and events[0].end is not None)
+        state = int(np.argmax(post)) if np.isfinite(post).all() else -1
+        self.row = (
+            state,
+            *post,
+            opened,
+            closed,
+            ws.window_id,
+            ws.age,
+            post.max(),
+        )
+        return events
@@ -0,0 +1,198 @@
+from dataclasses import dataclass, replace
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..segments import run_lengths
+
+# -------------------------
+# Debounced regime windows
+# -------------------------
+# With p = p(target state) at each step:
+# - open when p >= open_p for `confirm_open` consecutive steps (the window
+#   starts at the first of them, and is confirmed on the last);
+# - close when p <= close_p for `confirm_close` consecutive steps and the
+#   window has lasted `min_trends` steps since its confirmation.
+# Steps without a probability (NaN) break both streaks. Steps are bars for
+# the bar indicator, or DC events when fed per completed trend.
+
+
+@dataclass
+class WindowRule:
+    open_p: float = 0.80
+    close_p: float = 0.50
+    confirm_open: int = 2  # k
+    confirm_close: int = 2  # k'
+    min_trends: int = 2  # L_min
+
+    def __post_init__(self):
+        if not self.close_p < self.open_p:
+            raise ValueError("close_p must be below open_p")
+        if self.confirm_open < 1 or self.confirm_close < 1:
+            raise ValueError("confirm_open and confirm_close must be >= 1")
+
+
+@dataclass
+class Window:
+    start: pd.Timestamp
+    end: Optional[pd.Timestamp]
+    label: str
+    window_id: int
+
+
+@dataclass
+class WindowState:
+    """Debounce bookkeeping carried between steps (or batch chunks)."""
+
+    in_window: bool = False
+    open_streak: int = 0
+    close_streak: int = 0
+    window_id: int = 0  # windows opened so far
+    age: int = -1  # steps since the last open; -1 before the first
+    streak_start: Optional[pd.Timestamp] = None  # of the open streak running
+    window_start: Optional[pd.Timestamp] = None
+
+
+class WindowStateMachine:
+    def __init__(self, rule: WindowRule, label: str, state: WindowState = None):
+        self.rule = rule
+        self.label = label
+        self.state = state if state is not None else WindowState()
+
+    def on_prob(self, t: pd.Timestamp, p: float) -> List[Window]:
+        """Advance one step; returns the window opened or closed at `t`, if any."""
+        st, rule = self.state, self.rule
+        if st.age >= 0:
+            st.age += 1
+        if not st.in_window:
+            if p >= rule.open_p:
+                st.open_streak += 1
+                if st.open_streak == 1:
+                    st.streak_start = t
+            else:
+                st.open_streak = 0
+                st.streak_start = None
+            if st.open_streak >= rule.confirm_open:
+                st.in_window = True
+                st.open_streak = st.close_streak = 0
+                st.window_id += 1
+                st.age = 0
+                st.window_start, st.streak_start = st.streak_start, None
+                return [Window(st.window_start, None, self.label, st.window_id)]
+            return []
+        st.close_streak = st.close_streak + 1 if p <= rule.close_p else 0
+        if st.close_streak >= rule.confirm_close and st.age >= rule.min_trends:
+            st.in_window = False
+            st.open_streak = st.close_streak = 0
+            return [Window(st.window_start, t, self.label, st.window_id)]
+        return []
+
+
+def _runs(mask, carry=0):
+    """(start, end) of the runs of True in `mask`, end exclusive. A leading
+    run continues `carry` earlier steps, so its start may be negative."""
+    starts, lengths = run_lengths(mask)
+    keep = mask[starts]
+    starts, ends = starts[keep], (starts + lengths)[keep]
+    if len(starts) and starts[0] == 0:
+        starts[0] -= carry
+    return starts, ends
+
+
+class _Confirmations:
+    """First step at or after a position whose streak reaches `k`."""
+
+    def __init__(self, mask, k, carry=0):
+        starts, ends = _runs(mask, carry)
+        self.last_start = starts[-1] if len(starts) else None
+        first = starts + k - 1
+        ok = first < ends
+        self.starts, self.first, self.ends = starts[ok], first[ok], ends[ok]
+
+    def next(self, pos):
+        """(confirmation step, first step of its streak), or None."""
+        i = np.searchsorted(self.ends, pos, side="right")
+        if i == len(self.ends):
+            return None
+        return max(pos, self.first[i]), self.starts[i]
+
+
+def debounce_windows(p, rule: WindowRule, index=None, state: WindowState = None):
+    """Batch counterpart of `WindowStateMachine` over a probability array.
+
+    Works on the runs of the threshold masks: each open or close is one
+    binary search over runs, so there is no loop per step. Returns
+    (opened, closed, window_id, age, final WindowState); `index` (times of
+    `p`) is only needed for the window start times kept in the state.
+    """
+    st = state if state is not None else WindowState()
+    p = np.asarray(p, dtype=float)
+    n = len(p)
+    with np.errstate(invalid="ignore"):
+        hi = p >= rule.open_p
+        lo = p <= rule.close_p
+    # A run in progress carries over only while its streak is being counted
+    open_runs = _Confirmations(
+        hi, rule.confirm_open, 0 if st.in_window else st.open_streak
+    )
+    close_runs = _Confirmations(
+        lo, rule.confirm_close, st.close_streak if st.in_window else 0
+    )
+
+    opens, closes = [], []
+    in_window, pos = st.in_window, 0
+    last_open = -st.age - 1 if st.in_window else None
+    window_start = None  # position of the first step of the last open's streak
+    while True:
+        if in_window:
+            hit = close_runs.next(max(last_open + max(rule.min_trends, 1), pos))
+            if hit is None:
+                break
+            closes.append(hit[0])
+        else:
+            hit = open_runs.next(pos)
+            if hit is None:
+                break
+            last_open, window_start = hit
+            opens.append(last_open)
+        pos = hit[0] + 1
+        in_window = not in_window
+
+    opened = np.zeros(n, dtype=np.int8)
+    closed = np.zeros(n, dtype=np.int8)
+    opened[opens] = 1
+    closed[closes] = 1
+    # Window ids and ages are piecewise between opens
+    bounds = np.concatenate(([0], opens, [n])).astype(np.int64)
+    seg_len = np.diff(bounds)
+    window_id = np.repeat(st.window_id + np.arange(len(opens) + 1), seg_len)
+    first_open = -st.age - 1 if st.age >= 0 else None
+    origins = np.array([n if first_open is None else first_open] + opens)
+    age = np.arange(n, dtype=np.int64) - np.repeat(origins, seg_len)
+    if first_open is None:
+        age[: seg_len[0]] = -1
+
+    out = WindowState(
+        in_window=in_window,
+        window_id=st.window_id + len(opens),
+        age=int(age[-1]) if n else st.age,
+        window_start=st.window_start,
+    )
+    if n == 0:
+        return opened, closed, window_id, age, replace(st)
+    if opens and index is not None:
+        out.window_start = index[window_start] if window_start >= 0 else st.streak_start
+    # Streak still running at the last step
+    runs, mask = (close_runs, lo) if in_window else (open_runs, hi)
+    if mask[-1]:
+        run_start = runs.last_start
+        if in_window:
+            out.close_streak = int(n - run_start)
+        else:
+            out.open_streak = int(n - run_start)
+            if index is not None:
+                out.streak_start = (
+                    index[run_start] if run_start >= 0 else st.streak_start
+                )
+    return opened, closed, window_id, age, out
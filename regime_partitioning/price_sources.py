@@ -0,0 +1,247 @@
+import os
+import time
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from .constants import PRICE_DATA_DIR, PRICE_SOURCE
+
+
+# Granularity -> pandas frequency used by the synthetic source
+_GRANULARITY_FREQ = {
+    "D": "B",
+    "H4": "4h",
+    "H1": "h",
+    "M15": "15min",
+    "M5": "5min",
+    "M1": "min",
+}
+
+# Bars per year used to scale the synthetic volatility per granularity
+_BARS_PER_YEAR = {
+    "D": 252,
+    "H4": 252 * 6,
+    "H1": 252 * 24,
+    "M15": 252 * 24 * 4,
+    "M5": 252 * 24 * 12,
+    "M1": 252 * 24 * 60,
+}
+
+
+class PriceSource:
+    """Interface for OHLCV providers; mirrors trading_utils.get_forex_data_by_pair."""
+
+    name = "base"
+
+    def get_forex_data_by_pair(
+        self, symbol, start_date, end_date, granularity="D"
+    ) -> pd.DataFrame:
+        """Return OHLC(V) bars indexed by datetime, inclusive of both dates."""
+        raise NotImplementedError
+
+
+class TradingUtilsPriceSource(PriceSource):
+    """Live source: the external data service / FirstRate tree via trading_utils."""
+
+    name = "trading_utils"
+
+    def get_forex_data_by_pair(self, symbol, start_date, end_date, granularity="D"):
+        # Imported lazily so offline sources work without trading_utils installed
+        from trading_utils.get_forex_data import get_forex_data_by_pair
+
+        return get_forex_data_by_pair(
+            symbol=symbol,
+            start_date=start_date,
+            end_date=end_date,
+            granularity=granularity,
+        )
+
+
+class CsvPriceSource(PriceSource):
+    """File-backed source reading `{root}/{symbol}_{granularity}.csv`.
+
+    Files carry a `datetime` column plus open/high/low/close[/volume]; use
+    `snapshot_prices` to populate the directory from another source.
+    """
+
+    name = "csv"
+
+    def __init__(self, root=PRICE_DATA_DIR):
+        self.root = Path(root)
+
+    def path_for(self, symbol, granularity="D") -> Path:
+        return self.root / f"{symbol}_{granularity}.csv"
+
+    def get_forex_data_by_pair(self, symbol, start_date, end_date, granularity="D"):
+        path = self.path_for(symbol, granularity)
+        if not path.exists():
+            raise FileNotFoundError(f"Price file not found for {symbol}: {path}")
+        df = pd.read_csv(path, parse_dates=["datetime"])
+        df = df.set_index("datetime").sort_index()
+        return df.loc[start_date:end_date]
+
+    def write(self, symbol, df: pd.DataFrame, granularity="D") -> Path:
+        path = self.path_for(symbol, granularity)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        df.sort_index().to_csv(path, index_label="datetime")
+        return path
+
+
+class SyntheticPriceSource(PriceSource):
+    """Deterministic in-memory OHLCV generator (seeded geometric random walk).
+
+    Each (symbol, granularity) path is generated from a fixed `epoch`, so a
+    given timestamp always maps to the same bar regardless of the requested
+    range. Paths are cached per process.
+    """
+
+    name = "synthetic"
+
+    def __init__(self, seed=0, annual_vol=0.08, epoch="2000-01-03"):
+        self.seed = int(seed)
+        self.annual_vol = float(annual_vol)
+        self.epoch = pd.Timestamp(epoch)
+        self._cache: Dict[tuple, pd.DataFrame] = {}
+
+    def _symbol_seed(self, symbol, granularity):
+        # crc32 rather than hash(): str hashing is salted per interpreter
+        return zlib.crc32(f"{symbol}:{granularity}".encode()) ^ self.seed
+
+    def _generate(self, symbol, granularity, end) -> pd.DataFrame:
+        freq = _GRANULARITY_FREQ.get(granularity)
+        if freq is None:
+            raise ValueError(
+                f"Unsupported granularity for synthetic source: {granularity}"
+            )
+        index = pd.date_range(self.epoch, end, freq=freq, name="datetime")
+        n = len(index)
+        seed = self._symbol_seed(symbol, granularity)
+        # One generator per stream so every prefix of the path is stable
+        ret_rng, wick_rng, vol_rng = (
+            np.random.default_rng([seed, stream]) for stream in range(3)
+        )
+        sigma = self.annual_vol / np.sqrt(_BARS_PER_YEAR[granularity])
+        rets = ret_rng.standard_normal(n) * sigma
+        wick = np.abs(wick_rng.standard_normal((n, 2))) * (0.5 * sigma)
+        volume = vol_rng.integers(1_000, 10_000, size=n)
+
+        base = 100.0 if "JPY" in symbol else 1.0
+        close = base * np.exp(np.cumsum(rets))
+        open_ = np.empty(n)
+        open_[0] = base
+        open_[1:] = close[:-1]
+        high = np.maximum(open_, close) * np.exp(wick[:, 0])
+        low = np.minimum(open_, close) * np.exp(-wick[:, 1])
+        return pd.DataFrame(
+            {"open": open_, "high": high, "low": low, "close": close, "volume": volume},
+            index=index,
+        )
+
+    def get_forex_data_by_pair(self, symbol, start_date, end_date, granularity="D"):
+        end = pd.Timestamp(end_date)
+        key = (symbol, granularity)
+        df = self._cache.get(key)
+        # Regenerate only when the cached path does not reach `end` yet
+        step = pd.tseries.frequencies.to_offset(_GRANULARITY_FREQ.get(granularity, "B"))
+        if df is None or df.empty or df.index[-1] + step <= end:
+            df = self._generate(symbol, granularity, end)
+            self._cache[key] = df
+        return df.loc[start_date:end_date].copy()
+
+
+class TimedPriceSource(PriceSource):
+    """Wrap a source and accumulate wall-clock time spent inside it."""
+
+    def __init__(self, inner: PriceSource):
+        self.inner = inner
+        self.name = f"timed:{inner.name}"
+        self.n_calls = 0
+        self.total_seconds = 0.0
+        self.last_seconds = 0.0
+
+    def get_forex_data_by_pair(self, symbol, start_date, end_date, granularity="D"):
+        t0 = time.perf_counter()
+        try:
+            return self.inner.get_forex_data_by_pair(
+                symbol, start_date, end_date, granularity=granularity
+            )
+        finally:
+            self.last_seconds = time.perf_counter() - t0
+            self.total_seconds += self.last_seconds
+            self.n_calls += 1
+
+    def reset(self):
+        self.n_calls = 0
+        self.total_seconds = 0.0
+        self.last_seconds = 0.0
+
+
+PRICE_SOURCES = {
+    TradingUtilsPriceSource.name: TradingUtilsPriceSource,
+    CsvPriceSource.name: CsvPriceSource,
+    SyntheticPriceSource.name: SyntheticPriceSource,
+}
+
+_active_source: Optional[PriceSource] = None
+
+
+def make_price_source(name: Optional[str] = None, timed=False, **kwargs) -> PriceSource:
+    """Build a source by name ("trading_utils", "csv", "synthetic").
+
+    Defaults come from the REGIME_PRICE_SOURCE / REGIME_PRICE_DIR environment
+    variables, falling back to `constants.PRICE_SOURCE`.
+    """
+    name = name or os.environ.get("REGIME_PRICE_SOURCE", PRICE_SOURCE)
+    if name not in PRICE_SOURCES:
+        raise ValueError(
+            f"Unknown price source {name!r}. Available: {sorted(PRICE_SOURCES)}"
+        )
+    if name == CsvPriceSource.name and "root" not in kwargs:
+        kwargs["root"] = os.environ.get("REGIME_PRICE_DIR", PRICE_DATA_DIR)
+    source = PRICE_SOURCES[name](**kwargs)
+    return TimedPriceSource(source) if timed else source
+
+
+def set_price_source(source) -> PriceSource:
+    """Install the process-wide source (a PriceSource instance or a name)."""
+    global _active_source
+    if isinstance(source, str):
+        source = make_price_source(source)
+    _active_source = source
+    return source
+
+
+def get_price_source() -> PriceSource:
+    global _active_source
+    if _active_source is None:
+        timed = os.environ.get("REGIME_PRICE_SOURCE_TIMING", "") not in ("", "0")
+        _active_source = make_price_source(timed=timed)
+    return _active_source
+
+
+def get_forex_data_by_pair(symbol, start_date, end_date, granularity="D"):
+    """Drop-in replacement for trading_utils.get_forex_data_by_pair."""
+    return get_price_source().get_forex_data_by_pair(
+        symbol, start_date, end_date, granularity=granularity
+    )
+
+
+def snapshot_prices(
+    symbols: Iterable[str],
+    start_date,
+    end_date,
+    dest_dir=PRICE_DATA_DIR,
+    granularity="D",
+    source: Optional[PriceSource] = None,
+):
+    """Copy bars from `source` (default: active source) into a CSV source tree."""
+    source = source or get_price_source()
+    sink = CsvPriceSource(dest_dir)
+    paths = {}
+    for symbol in symbols:
+        df = source.get_forex_data_by_pair(symbol, start_date, end_date, granularity)
+        paths[symbol] = sink.write(symbol, df, granularity)
+    return paths
@@ -2,25 +2,101 @@ import pandas as pd
 import numpy as np
 
 import ruptures as rpt
-from hmmlearn.hmm import GaussianHMM
+from ruptures.base import BaseCost
+from ruptures.exceptions import NotEnoughPoints
 from sklearn.preprocessing import StandardScaler
 
+from .fast_hmm import make_hmm
+
 
 # -------------------------
 # 1) PELT on rate_diff_2y and rv_20d (separately)
 # -------------------------
+class CostL2Cumsum(BaseCost):
+    """L2 segment cost from prefix sums: O(1) per segment after an O(n) fit.
+
+    Same cost as ruptures' "l2" (sum of squared deviations from the segment
+    mean), which instead recomputes a variance over the slice per call.
+    """
+
+    model = "l2_cumsum"
+
+    def __init__(self):
+        self.signal = None  # read by ruptures' parameter checks
+        self.min_size = 1
+        self._csum = None
+        self._csum2 = None
+
+    def fit(self, signal) -> "CostL2Cumsum":
+        self.signal = signal.reshape(-1, 1) if signal.ndim == 1 else signal
+        # Centre first: the cost is shift-invariant and this limits cancellation
+        x = self.signal - self.signal.mean(axis=0)
+        zero = np.zeros((1, x.shape[1]))
+        self._csum = np.vstack([zero, np.cumsum(x, axis=0)])
+        self._csum2 = np.vstack([zero, np.cumsum(x**2, axis=0)])
+        return self
+
+    def error(self, start, end) -> float:
+        if end - start < self.min_size:
+            raise NotEnoughPoints
+        s = self._csum[end] - self._csum[start]
+        s2 = self._csum2[end] - self._csum2[start]
+        return float(np.maximum(s2 - s * s / (end - start), 0.0).sum())
+
+
+def _pelt_fit(series: pd.Series, min_size: int):
+    s = series.dropna()
+    algo = rpt.Pelt(custom_cost=CostL2Cumsum(), min_size=min_size)
+    return algo.fit(s.values.astype(float)), s.index
+
+
 def pelt_changepoints(series: pd.Series, penalty: float, min_size: int = 20):
     """Return changepoint indices (end of segments) using PELT with L2 cost."""
-    x = series.dropna().values.astype(float)
-    algo = rpt.Pelt(model="l2", min_size=min_size).fit(x)
+    algo, idx = _pelt_fit(series, min_size)
     # returns segment endpoints; last endpoint = len(x)
     bkpts = algo.predict(pen=penalty)
     # convert to index positions aligned to original series
-    idx = series.dropna().index
     cps = [idx[i - 1] for i in bkpts[:-1]]  # exclude final endpoint
     return cps
 
 
+def pelt_changepoints_multi(series: pd.Series, penalties, min_size: int = 20):
+    """`pelt_changepoints` for several penalties, sharing one prefix-sum fit.
+
+    Returns {penalty: changepoints}.
+    """
+    algo, idx = _pelt_fit(series, min_size)
+    return {pen: [idx[i - 1] for i in algo.predict(pen=pen)[:-1]] for pen in penalties}
+
+
+def compute_segment_ids(index, changepoints):
+    """Segment number per timestamp; a changepoint closes its segment."""
+    cps = pd.Index(sorted(changepoints), dtype=index.dtype)
+    return pd.Series(cps.searchsorted(index, side="left"), index=index)
+
+
+def label_macro_state(series, penalty, min_size=20, n_bins=3, changepoints=None):
+    """Bucket PELT segment means into `n_bins` quantile states.
+
+    Pass precomputed `changepoints` to skip the PELT fit.
+    """
+    s = series.dropna()
+    if len(s) == 0:
+        return pd.Series(index=series.index, dtype="float64")
+    if changepoints is None:
+        changepoints = pelt_changepoints(s, penalty=penalty, min_size=min_size)
+    seg_ids = compute_segment_ids(s.index, changepoints)
+    seg_means = s.groupby(seg_ids).mean()
+    probs = np.linspace(0.0, 1.0, n_bins + 1)[1:-1]
+    bins = np.quantile(seg_means.values, probs)
+    states = np.digitize(seg_means.values, bins)
+    mapping = {seg: state for seg, state in zip(seg_means.index, states)}
+    macro_clean = seg_ids.map(mapping)
+    macro = pd.Series(index=series.index, dtype="float64")
+    macro.loc[s.index] = macro_clean.values
+    return macro
+
+
 # -------------------------
 # 2) 2-state Gaussian HMM on [ret, rv_20d]
 # -------------------------
@@ -31,28 +107,31 @@ def fit_2state_hmm(
     n_init=10,
     max_iter=200,
     random_state=0,
+    backend="auto",
 ):
-    """Fit 2-state diagonal-cov GaussianHMM on standardized features."""
+    """Fit 2-state diagonal-cov GaussianHMM on standardized features.
+
+    `backend` selects the HMM implementation (see `fast_hmm.make_hmm`).
+    """
     X = df.loc[:, cols].dropna().astype(float).values
     scaler = StandardScaler().fit(X)
     Xz = scaler.transform(X)
 
-    # hmmlearn uses full cov by default; set covariance_type='diag' for diagonal
-    hmm = GaussianHMM(
-        n_components=n_states,
-        covariance_type="diag",
-        n_iter=max_iter,
-        tol=1e-4,
-        random_state=random_state,
-        init_params="stmc",  # learn startprob, transmat, means, covars
-        params="stmc",
-        verbose=False,
-    )
-
-    # Multiple random restarts for robustness
+    # Multiple random restarts for robustness; one model per seed so the
+    # best fit is not overwritten by later restarts
     best_model, best_score = None, -np.inf
     for seed in range(n_init):
-        hmm.random_state = seed
+        hmm = make_hmm(
+            backend,
+            n_components=n_states,
+            covariance_type="diag",  # hmmlearn defaults to full covariance
+            n_iter=max_iter,
+            tol=1e-4,
+            random_state=seed,
+            init_params="stmc",  # learn startprob, transmat, means, covars
+            params="stmc",
+            verbose=False,
+        )
         hmm.fit(Xz)
         score = hmm.score(Xz)
         if score > best_score:
@@ -0,0 +1,352 @@
+import multiprocessing as mp
+from pathlib import Path
+from typing import Dict, Iterable, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import stats as sps
+
+from .segments import _decode, _encode, run_lengths
+
+# -------------------------
+# Per-segment and per-regime statistics
+# -------------------------
+# A segment is a run of bars with the same label (as in `segments`). For each
+# column, the finite values of every segment reduce to (n, mean, M2, M3, M4),
+# M_k being the k-th central sum: two `np.add.reduceat` passes over the bars
+# (sums, then powers of deviations from the segment mean), no groupby.
+# Regimes pool their segments' moments with the exact merge rules
+#   M2 = sum(M2_i + n_i d_i^2)
+#   M3 = sum(M3_i + 3 d_i M2_i + n_i d_i^3)
+#   M4 = sum(M4_i + 4 d_i M3_i + 6 d_i^2 M2_i + n_i d_i^4),  d_i = mean_i - mean
+# as `np.bincount` sums over segments, so appending bars only reduces the new
+# bars and re-pools segments. std/skew/kurt match pandas' sample estimators.
+
+# Moments kept per column, and the statistics reported from them
+STAT_COLUMNS = {
+    "ret": ("mean", "std", "skew", "kurt"),
+    "rv_20d": ("mean", "std"),  # rv_20d_std is the vol-of-vol
+    "rate_diff_2y": ("mean", "std"),
+    "cpi_diff_core": ("mean", "std"),
+}
+DRIVER_COLS = ("rate_diff_2y", "cpi_diff_core")
+
+_N, _MEAN, _M2, _M3, _M4 = range(5)
+
+
+def _segment_moments(x, starts, seg):
+    """(5, n_segments) moments of the finite values of each segment;
+    `seg` is the segment of every bar."""
+    out = np.zeros((5, len(starts)))
+    if len(starts) == 0:
+        return out
+    valid = np.isfinite(x)
+    out[_N] = np.add.reduceat(valid.astype(float), starts)
+    total = np.add.reduceat(np.where(valid, x, 0.0), starts)
+    np.divide(total, out[_N], out=out[_MEAN], where=out[_N] > 0)
+    d = np.where(valid, x - out[_MEAN][seg], 0.0)
+    d2 = d * d
+    out[_M2] = np.add.reduceat(d2, starts)
+    out[_M3] = np.add.reduceat(d2 * d, starts)
+    out[_M4] = np.add.reduceat(d2 * d2, starts)
+    return out
+
+
+def _pool(m, groups, n_groups):
+    """Merge the moment columns of `m` that share a group (exact)."""
+    n, mean, m2, m3, m4 = m
+    out = np.zeros((5, n_groups))
+    out[_N] = np.bincount(groups, n, n_groups)
+    np.divide(
+        np.bincount(groups, n * mean, n_groups),
+        out[_N],
+        out=out[_MEAN],
+        where=out[_N] > 0,
+    )
+    d = mean - out[_MEAN][groups]
+    out[_M2] = np.bincount(groups, m2 + n * d**2, n_groups)
+    out[_M3] = np.bincount(groups, m3 + 3 * d * m2 + n * d**3, n_groups)
+    out[_M4] = np.bincount(groups, m4 + 4 * d * m3 + 6 * d**2 * m2 + n * d**4, n_groups)
+    return out
+
+
+def _describe(m, stats):
+    """Sample statistics (pandas conventions) from moments; NaN where a
+    statistic needs more values than there are."""
+    n, mean, m2, m3, m4 = m
+    out = {}
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if "mean" in stats:
+            out["mean"] = np.where(n > 0, mean, np.nan)
+        if "std" in stats:
+            out["std"] = np.where(n > 1, np.sqrt(m2 / (n - 1)), np.nan)
+        if "skew" in stats:
+            g1 = np.sqrt(n) * m3 / m2**1.5
+            out["skew"] = np.where(
+                (n > 2) & (m2 > 0), g1 * np.sqrt(n * (n - 1)) / (n - 2), np.nan
+            )
+        if "kurt" in stats:
+            g2 = n * m4 / m2**2 - 3.0
+            out["kurt"] = np.where(
+                (n > 3) & (m2 > 0),
+                ((n + 1) * g2 + 6) * (n - 1) / ((n - 2) * (n - 3)),
+                np.nan,
+            )
+    return out
+
+
+def _welch(m_in, m_all):
+    """Welch t statistic and two-sided p-value of each group's mean against
+    the rest of the bars, from moments only."""
+    n1, mu1, ss1 = m_in[_N], m_in[_MEAN], m_in[_M2]
+    n, mu = m_all[_N], m_all[_MEAN]
+    # Remove the group from the total: inverse of the merge rule
+    n2 = n - n1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mu2 = (n * mu - n1 * mu1) / n2
+        ss2 = m_all[_M2] - ss1 - n1 * (mu1 - mu) ** 2 - n2 * (mu2 - mu) ** 2
+        s1 = ss1 / (n1 - 1) / n1
+        s2 = np.maximum(ss2, 0.0) / (n2 - 1) / n2
+        t = (mu1 - mu2) / np.sqrt(s1 + s2)
+        dof = (s1 + s2) ** 2 / (s1**2 / (n1 - 1) + s2**2 / (n2 - 1))
+        ok = (n1 > 1) & (n2 > 1)
+        t = np.where(ok, t, np.nan)
+        p = np.where(ok, 2 * sps.t.sf(np.abs(t), dof), np.nan)
+    return t, p
+
+
+class RegimeStats:
+    """Moments of a per-bar label series' segments, pooled per regime.
+
+    Build with `from_frame`; `extend` folds in later bars. `segments()` and
+    `regimes()` give the tables, columns `{col}_{stat}` for every column
+    and statistic of `columns` (see `STAT_COLUMNS`).
+    """
+
+    def __init__(self, table, labels, moments, columns, drivers):
+        self.table = table.reset_index(drop=True)  # start, end, regime, n_bars
+        self.labels = list(labels)
+        self.moments = moments  # column -> (5, n_segments)
+        self.columns = dict(columns)
+        self.drivers = tuple(drivers)
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        label_col="final_regime",
+        columns: Mapping[str, Sequence[str]] = STAT_COLUMNS,
+        drivers: Sequence[str] = DRIVER_COLS,
+        labels: Optional[Sequence[str]] = None,
+    ) -> "RegimeStats":
+        """Statistics of `df` (sorted by time) segmented by `label_col`;
+        missing labels form segments of regime -1, left out of `regimes()`."""
+        columns = {c: s for c, s in columns.items() if c in df.columns}
+        codes, labels = _encode(df[label_col], labels)
+        starts, lengths = run_lengths(codes)
+        seg = np.repeat(np.arange(len(starts)), lengths)
+        table = pd.DataFrame(
+            {
+                "start": df.index[starts],
+                "end": df.index[starts + lengths - 1],
+                "regime": codes[starts],
+                "n_bars": lengths,
+            }
+        )
+        moments = {
+            c: _segment_moments(df[c].to_numpy(dtype=float), starts, seg)
+            for c in columns
+        }
+        drivers = [c for c in drivers if c in columns]
+        return cls(table, labels, moments, columns, drivers)
+
+    def __len__(self):
+        return len(self.table)
+
+    def extend(self, df_new: pd.DataFrame, label_col="final_regime") -> "RegimeStats":
+        """Statistics after appending `df_new` (bars later than the last).
+
+        Only the new bars are reduced; a first run continuing the last
+        segment's label is merged into it.
+        """
+        if len(df_new) == 0:
+            return self
+        tail = RegimeStats.from_frame(
+            df_new, label_col, self.columns, self.drivers, self.labels
+        )
+        table, moments = self.table, self.moments
+        head, rest = len(table), slice(0, None)
+        if head and tail.table["regime"].iat[0] == table["regime"].iat[-1]:
+            table = table.copy()
+            table.loc[table.index[-1], "end"] = tail.table["end"].iat[0]
+            table.loc[table.index[-1], "n_bars"] += tail.table["n_bars"].iat[0]
+            moments = {
+                c: np.concatenate(
+                    [
+                        m[:, :-1],
+                        _pool(
+                            np.column_stack([m[:, -1], tail.moments[c][:, 0]]),
+                            np.zeros(2, dtype=np.int64),
+                            1,
+                        ),
+                    ],
+                    axis=1,
+                )
+                for c, m in moments.items()
+            }
+            rest = slice(1, None)
+        table = pd.concat([table, tail.table.iloc[rest]], ignore_index=True)
+        moments = {
+            c: np.concatenate([m, tail.moments[c][:, rest]], axis=1)
+            for c, m in moments.items()
+        }
+        return RegimeStats(table, tail.labels, moments, self.columns, self.drivers)
+
+    def segments(self) -> pd.DataFrame:
+        """One row per segment: start, end, regime, label, n_bars, stats."""
+        out = self.table.assign(
+            label=_decode(self.table["regime"].to_numpy(), self.labels)
+        )
+        out = out[["start", "end", "regime", "label", "n_bars"]]
+        stats = {
+            f"{c}_{name}": v
+            for c, m in self.moments.items()
+            for name, v in _describe(m, self.columns[c]).items()
+        }
+        return out.assign(**stats)
+
+    def regimes(self) -> pd.DataFrame:
+        """One row per regime: n_segments, n_bars, pooled stats, and for each
+        driver the Welch t / p-value of its mean against all other bars."""
+        codes = self.table["regime"].to_numpy()
+        keep = codes >= 0
+        k = len(self.labels)
+        groups = codes[keep]
+        out = pd.DataFrame(
+            {
+                "regime": np.arange(k),
+                "label": self.labels,
+                "n_segments": np.bincount(groups, minlength=k),
+                "n_bars": np.bincount(
+                    groups, self.table["n_bars"].to_numpy()[keep], k
+                ).astype(np.int64),
+            }
+        )
+        for c, m in self.moments.items():
+            pooled = _pool(m[:, keep], groups, k)
+            for name, v in _describe(pooled, self.columns[c]).items():
+                out[f"{c}_{name}"] = v
+            if c in self.drivers:
+                every = _pool(m[:, keep], np.zeros(len(groups), dtype=np.int64), 1)
+                out[f"{c}_t"], out[f"{c}_p"] = _welch(pooled, every)
+        return out
+
+
+def driver_separation(
+    df: pd.DataFrame, label_col="final_regime", drivers: Sequence[str] = DRIVER_COLS
+) -> pd.DataFrame:
+    """Wilcoxon rank-sum (Mann-Whitney U) p-value of each driver in each
+    regime against the other regimes' bars: one row per regime."""
+    labels = df[label_col]
+    rows = []
+    for label in pd.unique(labels.dropna()):
+        inside = (labels == label).to_numpy()
+        row = {"label": label}
+        for c in drivers:
+            x = df[c].to_numpy(dtype=float)
+            a = x[inside & np.isfinite(x)]
+            b = x[~inside & labels.notna().to_numpy() & np.isfinite(x)]
+            row[f"{c}_p"] = (
+                sps.mannwhitneyu(a, b).pvalue if len(a) and len(b) else np.nan
+            )
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+# -------------------------
+# Batch over symbols
+# -------------------------
+def export_path(export_dir, symbol) -> Path:
+    """A symbol's regime export, preferring Parquet over CSV."""
+    parquet = Path(export_dir) / f"{symbol}_regime_ohlcv.parquet"
+    if parquet.exists():
+        return parquet
+    return Path(export_dir) / f"{symbol}_regime_ohlcv.csv"
+
+
+def export_symbols(export_dir):
+    """Symbols with a regime export in `export_dir`."""
+    found = Path(export_dir).glob("*_regime_ohlcv.*")
+    return sorted({p.name.split("_regime_ohlcv")[0] for p in found})
+
+
+def _read_export(path, columns):
+    path = Path(path)
+    if path.suffix == ".parquet":
+        df = pd.read_parquet(path, columns=list(columns))
+    else:
+        df = pd.read_csv(
+            path,
+            usecols=lambda c: c == "datetime" or c in columns,
+            parse_dates=["datetime"],
+            index_col="datetime",
+        )
+    return df.sort_index()
+
+
+def _symbol_stats(symbol, frame, label_col, columns, drivers):
+    """Top-level so process pools can pickle it; `frame` may be a path."""
+    if not isinstance(frame, pd.DataFrame):
+        frame = _read_export(frame, [label_col, *columns])
+    stats = RegimeStats.from_frame(frame, label_col, columns, drivers)
+    return (
+        stats.segments().assign(symbol=symbol),
+        stats.regimes().assign(symbol=symbol),
+    )
+
+
+def regime_stats_many(
+    symbols: Optional[Iterable[str]] = None,
+    frames: Optional[Mapping[str, pd.DataFrame]] = None,
+    export_dir=None,
+    label_col="final_regime",
+    columns: Mapping[str, Sequence[str]] = STAT_COLUMNS,
+    drivers: Sequence[str] = DRIVER_COLS,
+    n_jobs=1,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Segment and regime tables for many symbols, stacked with a `symbol`
+    column first.
+
+    Frames come from `frames` (symbol -> export-like frame) or are read from
+    the regime exports in `export_dir` (all symbols found when `symbols` is
+    None), over `n_jobs` spawned processes.
+    """
+    if frames is None:
+        if export_dir is None:
+            raise ValueError("Pass frames or export_dir")
+        if symbols is None:
+            symbols = export_symbols(export_dir)
+        sources: Dict[str, object] = {
+            sym: export_path(export_dir, sym) for sym in symbols
+        }
+    else:
+        sources = {sym: frames[sym] for sym in (symbols or frames)}
+    tasks = [
+        (sym, src, label_col, dict(columns), tuple(drivers))
+        for sym, src in sources.items()
+    ]
+    if n_jobs > 1 and len(tasks) > 1:
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(processes=min(n_jobs, len(tasks))) as pool:
+            results = pool.starmap(_symbol_stats, tasks)
+    else:
+        results = [_symbol_stats(*t) for t in tasks]
+    if not results:
+        return pd.DataFrame(), pd.DataFrame()
+    segs, regs = zip(*results)
+
+    def stack(parts):
+        df = pd.concat(parts, ignore_index=True)
+        return df[["symbol", *[c for c in df.columns if c != "symbol"]]]
+
+    return stack(segs), stack(regs)
@@ -0,0 +1,163 @@
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# Run-length regime segments with binary-search lookups
+# -------------------------
+# A segment is a maximal run of bars with the same label. It is active from
+# its first bar until the next segment starts (the last one until its last
+# bar), so "regime at t" holds across weekends and other gaps between bars.
+# Lookups bisect the segment starts: O(log n_segments), independent of the
+# number of bars.
+
+SEGMENT_COLS = ("start", "end", "regime", "label", "window_id", "age")
+
+
+def run_lengths(codes):
+    """(start positions, lengths) of the runs of equal values in `codes`."""
+    codes = np.asarray(codes)
+    if len(codes) == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(codes[1:] != codes[:-1]) + 1))
+    lengths = np.diff(np.append(starts, len(codes)))
+    return starts, lengths
+
+
+class SegmentIndex:
+    """Segment table of a per-bar regime label series.
+
+    Columns: `start`/`end` (first and last bar), `regime` (integer code into
+    `labels`, -1 for missing), `label`, `window_id` (segment ordinal) and
+    `age` (bars in the segment).
+    """
+
+    def __init__(self, table: pd.DataFrame, labels: Sequence[str]):
+        self.table = table.reset_index(drop=True)
+        self.labels = list(labels)
+        self._starts = self.table["start"].to_numpy()
+        self._ends = self.table["end"].to_numpy()
+        self._codes = self.table["regime"].to_numpy()
+
+    @classmethod
+    def from_labels(cls, series: pd.Series, labels: Optional[Sequence[str]] = None):
+        """Run-length encode a label series indexed by (sorted) timestamps."""
+        codes, labels = _encode(series, labels)
+        table = _segment_table(series.index, codes, labels)
+        return cls(table, labels)
+
+    @classmethod
+    def read_csv(cls, path):
+        table = pd.read_csv(path, parse_dates=["start", "end"])
+        table["label"] = table["label"].astype(object).where(table["regime"] >= 0)
+        # Recover the code -> label map from the rows themselves
+        pairs = table.loc[table["regime"] >= 0, ["regime", "label"]]
+        pairs = pairs.drop_duplicates().sort_values("regime")
+        labels = [None] * (int(pairs["regime"].max()) + 1 if len(pairs) else 0)
+        for code, label in pairs.itertuples(index=False):
+            labels[code] = label
+        return cls(table.loc[:, list(SEGMENT_COLS)], labels)
+
+    def to_csv(self, path):
+        self.table.to_csv(path, index=False)
+        return path
+
+    def __len__(self):
+        return len(self.table)
+
+    def extend(self, series: pd.Series) -> "SegmentIndex":
+        """Segments after appending `series` (bars later than `end` of the last).
+
+        A first run continuing the last segment's label lengthens it; only
+        the new bars are encoded.
+        """
+        if len(series) == 0:
+            return self
+        codes, labels = _encode(series, self.labels)
+        tail = _segment_table(series.index, codes, labels)
+        table = self.table
+        if len(table) and tail["regime"].iat[0] == table["regime"].iat[-1]:
+            table = table.copy()
+            table.loc[table.index[-1], "end"] = tail["end"].iat[0]
+            table.loc[table.index[-1], "age"] += tail["age"].iat[0]
+            tail = tail.iloc[1:]
+        tail = tail.assign(window_id=np.arange(len(table), len(table) + len(tail)))
+        return SegmentIndex(pd.concat([table, tail], ignore_index=True), labels)
+
+    def _bisect(self, t):
+        return np.searchsorted(self._starts, pd.Timestamp(t).to_datetime64(), "right")
+
+    def locate(self, times) -> np.ndarray:
+        """Segment row active at each of `times`; -1 before the first bar or
+        after the last."""
+        times = pd.DatetimeIndex(np.atleast_1d(times)).to_numpy()
+        pos = np.searchsorted(self._starts, times, side="right") - 1
+        if len(self._ends):
+            pos[times > self._ends[-1]] = -1
+        return pos
+
+    def _position(self, t):
+        if len(self._ends) == 0:
+            return -1
+        t = pd.Timestamp(t).to_datetime64()
+        pos = np.searchsorted(self._starts, t, "right") - 1
+        return -1 if pos < 0 or t > self._ends[-1] else pos
+
+    def at(self, t) -> Optional[pd.Series]:
+        """The segment row active at `t`, or None."""
+        pos = self._position(t)
+        return None if pos < 0 else self.table.iloc[pos]
+
+    def regime_at(self, t) -> Optional[str]:
+        pos = self._position(t)
+        return None if pos < 0 else self.table["label"].iat[pos]
+
+    def between(self, start=None, end=None, regime=None) -> pd.DataFrame:
+        """Segments active at any time in [start, end], optionally of one regime
+        (a label or a code)."""
+        lo, hi = 0, len(self._starts)
+        if hi == 0:
+            return self.table.iloc[:0]
+        if end is not None:
+            hi = self._bisect(end)
+        if start is not None:
+            lo = max(self._bisect(start) - 1, 0)
+            if self._ends[-1] < pd.Timestamp(start).to_datetime64():
+                lo = hi
+        out = self.table.iloc[lo:hi]
+        if regime is not None:
+            code = self.labels.index(regime) if isinstance(regime, str) else regime
+            out = out.loc[self._codes[lo:hi] == code]
+        return out
+
+
+def _segment_table(index, codes, labels):
+    starts, lengths = run_lengths(codes)
+    seg_codes = codes[starts]
+    return pd.DataFrame(
+        {
+            "start": index[starts],
+            "end": index[starts + lengths - 1],
+            "regime": seg_codes.astype(np.int16),
+            "label": _decode(seg_codes, labels),
+            "window_id": np.arange(len(starts), dtype=np.int64),
+            "age": lengths,
+        }
+    )
+
+
+def _encode(series, labels=None):
+    """Integer codes of `series` (missing -> -1) and the label list, keeping
+    the codes of any `labels` already known."""
+    known = list(labels or [])
+    values = pd.Series(series).astype(object)
+    uniq = pd.unique(values.dropna())
+    labels = known + [v for v in uniq if v not in set(known)]
+    codes = pd.Categorical(values, categories=labels).codes.astype(np.int64)
+    return codes, labels
+
+
+def _decode(codes, labels):
+    lookup = np.asarray(list(labels) + [None], dtype=object)
+    return lookup[np.where(codes < 0, len(labels), codes)]
@@ -0,0 +1,222 @@
+import multiprocessing as mp
+from typing import Iterable, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .regime_stats import _describe, _read_export, export_path, export_symbols
+from .segments import SegmentIndex
+
+# -------------------------
+# Boundary-shift sensitivity of per-regime statistics
+# -------------------------
+# Moving the boundary between segments j and j + 1 by o bars hands the bars
+# between the old and new boundary from one regime to the other. With prefix
+# sums P of (1, d, d^2, d^3) over the bars, d = x - mean(x) (centred for
+# accuracy), the handed-over sums are P[b + o] - P[b]: every (boundary,
+# offset) updates the two regimes' totals in O(1), and all of them are one
+# array expression. Shifts are applied one boundary at a time (boundary
+# >= 0) and to all boundaries together (boundary == -1); a local shift must
+# leave both segments at least one bar. Offsets are in bars.
+
+STAT_NAMES = ("mean", "std", "skew")
+
+
+def _prefix_sums(x):
+    """(4, n + 1) prefix sums of (count, d, d^2, d^3) over finite values,
+    and the centre of d."""
+    valid = np.isfinite(x)
+    centre = float(x[valid].mean()) if valid.any() else 0.0
+    d = np.where(valid, x - centre, 0.0)
+    P = np.zeros((4, len(x) + 1))
+    np.cumsum(valid, out=P[0, 1:])
+    np.cumsum(d, out=P[1, 1:])
+    np.cumsum(d * d, out=P[2, 1:])
+    np.cumsum(d * d * d, out=P[3, 1:])
+    return P, centre
+
+
+def _stats(sums, centre):
+    """mean / std / skew / t (mean against 0) from power sums (4, ...)."""
+    n, s1, s2, s3 = sums
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m = s1 / n
+        m2 = s2 - s1 * m
+        m3 = s3 - 3 * m * s2 + 2 * s1 * m * m
+        moments = (n, np.where(n > 0, m + centre, np.nan), m2, m3, np.zeros_like(n))
+        out = _describe(moments, STAT_NAMES)
+        out["t"] = out["mean"] / (out["std"] / np.sqrt(n))
+    return out
+
+
+def boundary_shift_stats(
+    segments: SegmentIndex, values: pd.Series, max_shift=5
+) -> pd.DataFrame:
+    """Per-regime statistics of `values` (e.g. the export's `ret`) for every
+    boundary of `segments` shifted by -max_shift..max_shift bars.
+
+    One row per (boundary, offset, regime touched): boundary is the index
+    of the segment the boundary opens (-1: all boundaries shifted together),
+    plus n_bars and the `STAT_NAMES` statistics and t of the regime's mean.
+    Regimes a local shift leaves unchanged are not repeated; offset 0 of
+    boundary -1 is the baseline.
+    """
+    table = segments.table
+    x = values.to_numpy(dtype=float)
+    n = len(x)
+    P, centre = _prefix_sums(x)
+    starts = values.index.searchsorted(table["start"].to_numpy(), "left")
+    ends = np.append(starts[1:], n)
+    codes = table["regime"].to_numpy().astype(np.int64)
+    k = len(segments.labels)
+    offsets = np.arange(-max_shift, max_shift + 1)
+    regime = codes >= 0
+    onehot = np.zeros((len(codes), k))
+    onehot[np.flatnonzero(regime), codes[regime]] = 1.0
+    base = (P[:, ends] - P[:, starts]) @ onehot  # (4, k)
+
+    # All boundaries together: segment edges move by o, series ends stay
+    s = np.clip(starts[None, :] + offsets[:, None], 0, n)
+    e = np.clip(ends[None, :] + offsets[:, None], 0, n)
+    s[:, 0], e[:, -1] = 0, n
+    glob = (P[:, e] - P[:, s]) @ onehot  # (4, O, k)
+    frames = [
+        _rows(
+            np.full((len(offsets), k), -1),
+            np.broadcast_to(offsets[:, None], (len(offsets), k)),
+            np.broadcast_to(np.arange(k), (len(offsets), k)),
+            glob,
+            centre,
+        )
+    ]
+
+    # One boundary at a time: bars [b, b + o) move from right to left
+    b = starts[1:]
+    shifted = b[:, None] + offsets[None, :]  # (B, O)
+    ok = (shifted > starts[:-1, None]) & (shifted < ends[1:, None])
+    delta = P[:, np.clip(shifted, 0, n)] - P[:, b][:, :, None]
+    bidx = np.broadcast_to(np.arange(1, len(starts))[:, None], shifted.shape)
+    oidx = np.broadcast_to(offsets[None, :], shifted.shape)
+    for side, sign in ((codes[:-1], 1.0), (codes[1:], -1.0)):
+        keep = ok & (side >= 0)[:, None]
+        sums = base[:, np.maximum(side, 0)][:, :, None] + sign * delta
+        frames.append(
+            _rows(
+                bidx[keep],
+                oidx[keep],
+                np.broadcast_to(side[:, None], shifted.shape)[keep],
+                sums[:, keep],
+                centre,
+            )
+        )
+    out = pd.concat(frames, ignore_index=True)
+    out.insert(3, "label", np.asarray(segments.labels, dtype=object)[out["regime"]])
+    return out
+
+
+def _rows(boundary, offset, regime, sums, centre):
+    boundary, offset, regime = (np.ravel(a) for a in (boundary, offset, regime))
+    sums = sums.reshape(4, -1)
+    stats = _stats(sums, centre)
+    return pd.DataFrame(
+        {
+            "boundary": boundary,
+            "offset": offset,
+            "regime": regime,
+            "n_bars": sums[0].astype(np.int64),
+            **stats,
+        }
+    )
+
+
+def stability_report(shift_stats: pd.DataFrame, t_crit=1.96) -> pd.DataFrame:
+    """Per regime: baseline statistics, their range over all shifts, and the
+    share of shifts keeping the sign of the mean and whether |t| >= t_crit."""
+    base = shift_stats[(shift_stats["boundary"] == -1) & (shift_stats["offset"] == 0)]
+    base = base.set_index("regime")
+    shifted = shift_stats[shift_stats["offset"] != 0].join(
+        base[["mean", "t"]], on="regime", rsuffix="_base"
+    )
+    shifted = shifted.assign(
+        same_sign=np.sign(shifted["mean"]) == np.sign(shifted["mean_base"]),
+        same_call=(shifted["t"].abs() >= t_crit) == (shifted["t_base"].abs() >= t_crit),
+    )
+    g = shifted.groupby("regime")
+    report = base[["label", "n_bars", *STAT_NAMES, "t"]].join(
+        pd.DataFrame(
+            {
+                "n_shifts": g.size(),
+                "mean_min": g["mean"].min(),
+                "mean_max": g["mean"].max(),
+                "std_min": g["std"].min(),
+                "std_max": g["std"].max(),
+                "t_min": g["t"].min(),
+                "t_max": g["t"].max(),
+                "sign_stable": g["same_sign"].mean(),
+                "call_stable": g["same_call"].mean(),
+            }
+        )
+    )
+    return report.reset_index()
+
+
+# -------------------------
+# Batch over symbols
+# -------------------------
+def _symbol_sensitivity(symbol, frame, label_col, value_col, max_shift, t_crit):
+    """Top-level so process pools can pickle it; `frame` may be a path."""
+    if not isinstance(frame, pd.DataFrame):
+        frame = _read_export(frame, [label_col, value_col])
+    frame = frame.sort_index()
+    segments = SegmentIndex.from_labels(frame[label_col])
+    stats = boundary_shift_stats(segments, frame[value_col], max_shift)
+    return (
+        stats.assign(symbol=symbol),
+        stability_report(stats, t_crit).assign(symbol=symbol),
+    )
+
+
+def boundary_sensitivity_many(
+    symbols: Optional[Iterable[str]] = None,
+    frames: Optional[Mapping[str, pd.DataFrame]] = None,
+    export_dir=None,
+    label_col="final_regime",
+    value_col="ret",
+    max_shift=5,
+    t_crit=1.96,
+    n_jobs=1,
+) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """Shift statistics and stability reports for many symbols, stacked with
+    a `symbol` column first.
+
+    Frames come from `frames` (symbol -> export-like frame) or the regime
+    exports in `export_dir`, over `n_jobs` spawned processes. Within a
+    symbol all boundaries and offsets are evaluated in one vectorized pass.
+    """
+    if frames is None:
+        if export_dir is None:
+            raise ValueError("Pass frames or export_dir")
+        if symbols is None:
+            symbols = export_symbols(export_dir)
+        sources = {sym: export_path(export_dir, sym) for sym in symbols}
+    else:
+        sources = {sym: frames[sym] for sym in (symbols or frames)}
+    tasks = [
+        (sym, src, label_col, value_col, max_shift, t_crit)
+        for sym, src in sources.items()
+    ]
+    if n_jobs > 1 and len(tasks) > 1:
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(processes=min(n_jobs, len(tasks))) as pool:
+            results = pool.starmap(_symbol_sensitivity, tasks)
+    else:
+        results = [_symbol_sensitivity(*t) for t in tasks]
+    if not results:
+        return pd.DataFrame(), pd.DataFrame()
+    stats, reports = zip(*results)
+
+    def stack(parts):
+        df = pd.concat(parts, ignore_index=True)
+        return df[["symbol", *[c for c in df.columns if c != "symbol"]]]
+
+    return stack(stats), stack(reports)
@@ -0,0 +1,246 @@
+import itertools
+import multiprocessing as mp
+import time
+from typing import Dict, Iterable, Mapping, Optional
+
+import numpy as np
+import pandas as pd
+
+from .processing import label_macro_state, pelt_changepoints_multi
+from .walkforward import _fit_block, _refit_points, _score_spans, _training_spans
+
+# -------------------------
+# Grid search over regime-detection hyperparameters
+# -------------------------
+# Work shared across the grid:
+# - features are built (or loaded) once per symbol;
+# - PELT prefix sums are fitted once per (series, min_size) and predicted
+#   for every penalty multiplier;
+# - walk-forward models are fitted once per refit date: configurations that
+#   differ only in retrain_interval / min_train_size reuse every refit they
+#   have in common. Scalers follow the union of refit dates, so scores can
+#   differ from a standalone walkforward_hmm_2state run in the last bits.
+
+HMM_COLS = ("ret", "rv_20d")
+MACRO_COLS = ("rate_diff_2y", "cpi_diff_core")
+N_MACRO_BINS = 3
+
+
+def regime_stability(codes) -> Dict[str, float]:
+    """Run statistics of an integer label sequence; negative codes are skipped."""
+    codes = np.asarray(codes)
+    codes = codes[codes >= 0]
+    n = len(codes)
+    if n == 0:
+        return {"n_bars": 0, "n_runs": 0, "flip_rate": np.nan, "mean_duration": np.nan}
+    flips = int(np.count_nonzero(codes[1:] != codes[:-1]))
+    return {
+        "n_bars": n,
+        "n_runs": flips + 1,
+        "flip_rate": flips / max(n - 1, 1),
+        "mean_duration": n / (flips + 1),
+    }
+
+
+def _macro_grid(df_fx, pen_multipliers, min_sizes):
+    """{(pen_multiplier, min_size): (yield codes, cpi codes, n_cps, seconds)}."""
+    out = {}
+    for min_size in min_sizes:
+        per_col = []
+        for col in MACRO_COLS:
+            s = df_fx[col]
+            n = len(s.dropna())
+            pens = {m: m * np.log(n) if n > 0 else 0.0 for m in pen_multipliers}
+            t0 = time.perf_counter()
+            cps = pelt_changepoints_multi(s, list(pens.values()), min_size=min_size)
+            # One fit serves every penalty; charge each an equal share
+            share = (time.perf_counter() - t0) / len(pens)
+            labels = {}
+            for m, pen in pens.items():
+                macro = label_macro_state(
+                    s, pen, min_size, N_MACRO_BINS, changepoints=cps[pen]
+                )
+                codes = macro.fillna(-1).to_numpy(dtype=np.int64)
+                labels[m] = (codes, len(cps[pen]), share)
+            per_col.append(labels)
+        for m in pen_multipliers:
+            (y, n_y, t_y), (c, n_c, t_c) = (labels[m] for labels in per_col)
+            out[(m, min_size)] = (y, c, (n_y, n_c), t_y + t_c)
+    return out
+
+
+def _sweep_hmm_group(
+    X,
+    n_states,
+    n_init,
+    retrain_intervals,
+    min_train_sizes,
+    max_iter,
+    random_state,
+    backend,
+):
+    """Fit each distinct refit of one (symbol, n_states, n_init) group once and
+    score every (retrain_interval, min_train_size) plan from the shared models.
+
+    Returns {(retrain_interval, min_train_size): (vol codes, stats dict)}.
+    """
+    n = X.shape[0]
+    plans = {
+        (ri, m): list(_refit_points(n, m, ri))
+        for ri, m in itertools.product(retrain_intervals, min_train_sizes)
+        if n >= m
+    }
+    refits = sorted(set().union(*plans.values())) if plans else []
+    Z = np.empty_like(X)
+    fitted = {}
+    for span in _training_spans(X, refits, None):
+        t, lo, scaler = span
+        t0 = time.perf_counter()
+        model = _fit_block(
+            X[lo:t],
+            scaler,
+            n_states,
+            n_init,
+            max_iter,
+            random_state,
+            backend,
+            out=Z[lo:t],
+        )
+        fitted[t] = (span, model, time.perf_counter() - t0)
+
+    out = {}
+    for key, points in plans.items():
+        t0 = time.perf_counter()
+        spans = [fitted[t][0] for t in points]
+        models = [fitted[t][1] for t in points]
+        # Regime codes: 1 risk_on, 0 risk_off, -1 unscored
+        vol = _score_spans(X, spans, models, Z)[3].astype(np.int64)
+        out[key] = (
+            vol,
+            {
+                "n_refits": len(points),
+                "fit_seconds": sum(fitted[t][2] for t in points),
+                "score_seconds": time.perf_counter() - t0,
+            },
+        )
+    return out
+
+
+def _load_frames(symbols=None) -> Dict[str, pd.DataFrame]:
+    # Imported lazily: building the datasets fetches prices and macro series
+    from .datasets import fx_datasets
+
+    symbols = list(symbols or fx_datasets.keys())
+    return {sym: fx_datasets[sym]["df_fx"] for sym in symbols}
+
+
+def run_sweep(
+    frames: Optional[Mapping[str, pd.DataFrame]] = None,
+    n_states: Iterable[int] = (2,),
+    n_init: Iterable[int] = (10,),
+    retrain_interval: Iterable[int] = (20,),
+    min_train_size: Iterable[int] = (252,),
+    pen_multiplier: Iterable[float] = (3.0,),
+    min_size: Iterable[int] = (20,),
+    max_iter=200,
+    random_state=0,
+    backend="auto",
+    n_jobs=1,
+    results_path=None,
+) -> pd.DataFrame:
+    """Evaluate every grid configuration per symbol; one results row each.
+
+    `frames` maps symbol -> feature frame (as in `fx_datasets[sym]["df_fx"]`);
+    defaults to all datasets. HMM groups (symbol, n_states, n_init) fan out
+    over `n_jobs` processes. Stability columns are prefixed `vol_` (HMM
+    risk_on/off), `macro_` (PELT states) and `final_` (their combination,
+    over the bars the HMM scored). Timing columns are per configuration;
+    shared fits are charged to every configuration that uses them.
+
+    The risk_on/off labelling is 2-state only, so `n_states` must be (2,);
+    it stays a column of the results.
+    """
+    frames = dict(frames) if frames is not None else _load_frames()
+    grids = {
+        "n_states": list(n_states),
+        "n_init": list(n_init),
+        "retrain_interval": list(retrain_interval),
+        "min_train_size": list(min_train_size),
+        "pen_multiplier": list(pen_multiplier),
+        "min_size": list(min_size),
+    }
+    if any(k != 2 for k in grids["n_states"]):
+        raise ValueError(
+            f"Only 2-state HMMs can be labelled risk_on/off, got {grids['n_states']}"
+        )
+
+    macro, hmm_index, tasks = {}, {}, []
+    for symbol, df_fx in frames.items():
+        macro[symbol] = _macro_grid(df_fx, grids["pen_multiplier"], grids["min_size"])
+        data = df_fx.loc[:, list(HMM_COLS)].dropna()
+        hmm_index[symbol] = df_fx.index.get_indexer(data.index)
+        X = np.ascontiguousarray(data.values, dtype=float)
+        for k, r in itertools.product(grids["n_states"], grids["n_init"]):
+            tasks.append(
+                (
+                    (symbol, k, r),
+                    (
+                        X,
+                        k,
+                        r,
+                        grids["retrain_interval"],
+                        grids["min_train_size"],
+                        max_iter,
+                        random_state,
+                        backend,
+                    ),
+                )
+            )
+
+    if n_jobs > 1:
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(processes=n_jobs) as pool:
+            results = pool.starmap(_sweep_hmm_group, [a for _, a in tasks])
+    else:
+        results = [_sweep_hmm_group(*a) for _, a in tasks]
+
+    rows = []
+    for ((symbol, k, r), _), group in zip(tasks, results):
+        pos = hmm_index[symbol]
+        for (ri, m), (vol, hmm_stats) in group.items():
+            scored = vol >= 0
+            vol_stats = regime_stability(vol)
+            for (pm, ms), (y, c, n_cps, pelt_s) in macro[symbol].items():
+                # Same composition as the export's final_regime column
+                macro_code = (y[pos] + 1) * (N_MACRO_BINS + 1) + (c[pos] + 1)
+                final = np.where(scored, macro_code * 2 + vol, -1)
+                final_stats = regime_stability(final)
+                seconds = hmm_stats["fit_seconds"] + hmm_stats["score_seconds"]
+                rows.append(
+                    {
+                        "symbol": symbol,
+                        "n_states": k,
+                        "n_init": r,
+                        "retrain_interval": ri,
+                        "min_train_size": m,
+                        "pen_multiplier": pm,
+                        "min_size": ms,
+                        "n_refits": hmm_stats["n_refits"],
+                        "vol_flip_rate": vol_stats["flip_rate"],
+                        "vol_mean_duration": vol_stats["mean_duration"],
+                        "vol_risk_on_share": float(vol[scored].mean()),
+                        "macro_yield_n_cps": n_cps[0],
+                        "macro_cpi_n_cps": n_cps[1],
+                        "final_n_regimes": len(np.unique(final[scored])),
+                        "final_flip_rate": final_stats["flip_rate"],
+                        "final_mean_duration": final_stats["mean_duration"],
+                        "fit_seconds": hmm_stats["fit_seconds"],
+                        "score_seconds": hmm_stats["score_seconds"],
+                        "pelt_seconds": pelt_s,
+                        "seconds": seconds + pelt_s,
+                    }
+                )
+    table = pd.DataFrame(rows)
+    if results_path is not None:
+        table.to_csv(results_path, index=False)
+    return table
@@ -0,0 +1,150 @@
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# -------------------------
+# Range-based realized volatility
+# -------------------------
+# Per-bar variance terms, with u = ln(H/O), d = ln(L/O), c = ln(C/O):
+#   parkinson (pk):        ln(H/L)^2 / (4 ln 2)
+#   garman_klass (gk):     0.5 ln(H/L)^2 - (2 ln 2 - 1) c^2
+#   rogers_satchell (rs):  u (u - c) + d (d - c)
+#   close_to_close (cc):   sample variance of ret = ln(C_t / C_t-1)
+# A window's volatility is sqrt(periods_per_year * mean term over the
+# window); cc uses the sample variance of the window's returns. All terms
+# (and valid-bar counts) sit in one float matrix whose cumsum gives every
+# window of every estimator as a difference of two prefix sums. The pass
+# runs over cache-sized chunks (with max(windows) - 1 bars of lookback), so
+# prefix sums restart per chunk and never grow large. Like rolling(w), a
+# window with any missing bar is NaN.
+
+ESTIMATORS = {
+    "parkinson": "pk",
+    "garman_klass": "gk",
+    "rogers_satchell": "rs",
+    "close_to_close": "cc",
+}
+VOL_WINDOWS = (5, 20, 60)
+
+# Rows of the per-bar term matrix
+_PK, _GK, _RS, _RET, _RET2, _N_RANGE, _N_RET = range(7)
+_TERMS = {"pk": _PK, "gk": _GK, "rs": _RS}
+_CHUNK = 1 << 15  # bars per chunk
+
+
+def vol_feature_names(
+    windows: Sequence[int] = VOL_WINDOWS, estimators: Sequence[str] = tuple(ESTIMATORS)
+):
+    """Output columns, window-major: rv_pk_5d, rv_gk_5d, ..., rv_cc_60d."""
+    return [f"rv_{ESTIMATORS[e]}_{w}d" for w in windows for e in estimators]
+
+
+def _bar_terms(terms, open_, high, low, close, prev_close):
+    """Fill `terms` (7, n + 1) with per-bar terms after a zero column, ready
+    for an in-place cumsum along rows; missing terms are 0 and counted out."""
+    terms[:, 0] = 0.0
+    pk, gk, rs, ret, ret2, n_range, n_ret = terms[:, 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # One log per price; every term is a difference of logs
+        lc = np.log(close)
+        u = np.log(high)
+        d = np.log(low)
+        lo = np.log(open_)
+        ret[0] = lc[0] - np.log(prev_close)
+        np.subtract(lc[1:], lc[:-1], out=ret[1:])
+        np.subtract(u, d, out=pk)  # ln(H/L)
+        u -= lo
+        d -= lo
+        lc -= lo  # c = ln(C/O)
+        pk *= pk
+        np.multiply(0.5, pk, out=gk)
+        pk *= 1.0 / (4.0 * np.log(2.0))
+        gk -= (2.0 * np.log(2.0) - 1.0) * lc * lc
+        np.multiply(u, u - lc, out=rs)
+        rs += d * (d - lc)
+    ok = np.isfinite(gk) & np.isfinite(rs)
+    n_range[:] = ok
+    terms[_PK : _RS + 1, 1:][:, ~ok] = 0.0
+    ok = np.isfinite(ret)
+    n_ret[:] = ok
+    ret[~ok] = 0.0
+    np.multiply(ret, ret, out=ret2)
+
+
+def range_volatility(
+    df: pd.DataFrame,
+    windows: Sequence[int] = VOL_WINDOWS,
+    estimators: Sequence[str] = tuple(ESTIMATORS),
+    periods_per_year=252,
+    out: Optional[np.ndarray] = None,
+) -> pd.DataFrame:
+    """Volatility estimators over OHLC bars for every window, in one pass.
+
+    `df` holds open/high/low/close (close only is enough for
+    close_to_close). `out`, an (n, len(windows) * len(estimators)) float
+    array, receives the values in `vol_feature_names` order, e.g. a slice
+    of a wider feature matrix; the returned frame wraps it without a copy.
+    """
+    unknown = set(estimators) - set(ESTIMATORS)
+    if unknown:
+        raise ValueError(
+            f"Unknown estimators {sorted(unknown)}; use {list(ESTIMATORS)}"
+        )
+    close = df["close"].to_numpy(dtype=float)
+    n = len(close)
+    if set(estimators) <= {"close_to_close"}:
+        open_ = high = low = close
+    else:
+        open_, high, low = (
+            df[c].to_numpy(dtype=float) for c in ("open", "high", "low")
+        )
+    names = vol_feature_names(windows, estimators)
+    if out is None:
+        out = np.empty((n, len(names)))
+    elif out.shape != (n, len(names)):
+        raise ValueError(f"out must have shape {(n, len(names))}, got {out.shape}")
+
+    max_w = max(windows, default=1)
+    buf = np.empty((7, _CHUNK + max_w))
+    tmp = np.empty(_CHUNK)
+    for s in range(0, n, _CHUNK):
+        e = min(s + _CHUNK, n)
+        a = max(s - max_w + 1, 0)  # first bar any window of the chunk needs
+        cs = buf[:, : e - a + 1]
+        prev = close[a - 1] if a > 0 else np.nan
+        _bar_terms(cs, open_[a:e], high[a:e], low[a:e], close[a:e], prev)
+        np.cumsum(cs, axis=1, out=cs)
+        j = 0
+        for w in windows:
+            # Bar i sums columns i - a + 1 - w .. i - a of the prefix sums
+            first = min(max(s, w - 1), e)
+            out[s:first, j : j + len(estimators)] = np.nan
+            hi = slice(first - a + 1, e - a + 1)
+            lo = slice(first - a + 1 - w, e - a + 1 - w)
+            partial_range = cs[_N_RANGE, hi] - cs[_N_RANGE, lo] < w
+            partial_ret = cs[_N_RET, hi] - cs[_N_RET, lo] < w
+            # Scratch is contiguous; `out` columns are written once each
+            var = tmp[: e - first]
+            for est in estimators:
+                code = ESTIMATORS[est]
+                if code == "cc":
+                    s1 = cs[_RET, hi] - cs[_RET, lo]
+                    np.subtract(cs[_RET2, hi], cs[_RET2, lo], out=var)
+                    s1 *= s1
+                    s1 *= 1.0 / w
+                    var -= s1
+                    var *= periods_per_year / (w - 1) if w > 1 else np.nan
+                    partial = partial_ret
+                else:
+                    k = _TERMS[code]
+                    np.subtract(cs[k, hi], cs[k, lo], out=var)
+                    var *= periods_per_year / w
+                    partial = partial_range
+                # Rounding (and gk's negative term) can push a variance below 0
+                np.maximum(var, 0.0, out=var)
+                np.sqrt(var, out=var)
+                np.copyto(var, np.nan, where=partial)
+                out[first:e, j] = var
+                j += 1
+    return pd.DataFrame(out, index=df.index, columns=names, copy=False)
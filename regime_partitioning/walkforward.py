@@ -0,0 +1,564 @@
+import contextlib
+import copy
+import hashlib
+import multiprocessing as mp
+import os
+import pickle
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import StandardScaler
+
+from .fast_hmm import make_hmm
+
+
+# -------------------------
+# Running moments for walk-forward refits
+# -------------------------
+class ExpandingMoments:
+    """Running per-column mean and (population) variance of the rows seen so far.
+
+    Blocks are merged with Chan's parallel update, so advancing from the last
+    refit to the next costs O(rows added) instead of O(t).
+    """
+
+    def __init__(self, n_features):
+        self.n = 0
+        self.mean = np.zeros(n_features)
+        self.m2 = np.zeros(n_features)
+
+    def push(self, X):
+        """Add the rows of `X` (n_rows x n_features)."""
+        n_b = X.shape[0]
+        if n_b == 0:
+            return self
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        n = self.n + n_b
+        delta = mean_b - self.mean
+        self.mean += delta * (n_b / n)
+        self.m2 += m2_b + delta**2 * (self.n * n_b / n)
+        self.n = n
+        return self
+
+    @property
+    def var(self):
+        return self.m2 / self.n
+
+    @property
+    def scale(self):
+        # StandardScaler leaves constant columns unscaled
+        scale = np.sqrt(self.var)
+        scale[scale < 10 * np.finfo(scale.dtype).eps] = 1.0
+        return scale
+
+    def to_scaler(self) -> StandardScaler:
+        """A fitted StandardScaler carrying the current moments."""
+        scaler = StandardScaler()
+        scaler.n_features_in_ = self.mean.shape[0]
+        scaler.n_samples_seen_ = self.n
+        scaler.mean_ = self.mean.copy()
+        scaler.var_ = self.var
+        scaler.scale_ = self.scale
+        return scaler
+
+
+class RollingMoments(ExpandingMoments):
+    """Running moments over a sliding block: `push` rows in, `pop` rows out."""
+
+    def pop(self, X):
+        """Remove the rows of `X`, which must have been pushed earlier."""
+        n_b = X.shape[0]
+        if n_b == 0:
+            return self
+        n = self.n - n_b
+        if n <= 0:
+            self.n = 0
+            self.mean[:] = 0.0
+            self.m2[:] = 0.0
+            return self
+        mean_b = X.mean(axis=0)
+        m2_b = ((X - mean_b) ** 2).sum(axis=0)
+        mean = (self.mean * self.n - mean_b * n_b) / n
+        delta = mean_b - mean
+        self.m2 -= m2_b + delta**2 * (n * n_b / self.n)
+        np.maximum(self.m2, 0.0, out=self.m2)
+        self.mean = mean
+        self.n = n
+        return self
+
+
+class SpanMoments:
+    """Moments of the current training span X[lo:hi], advanced refit by refit."""
+
+    def __init__(self, n_features):
+        self.moments = RollingMoments(n_features)
+        self.lo = self.hi = 0
+
+    def advance(self, X_full, lo, hi, offset=0) -> StandardScaler:
+        """Move the span to X[lo:hi] and return a scaler for it. `X_full`
+        holds rows offset.. of the history; `lo`/`hi` are history rows."""
+        if lo >= self.hi:
+            # No overlap with the previous span: start over
+            self.moments = RollingMoments(X_full.shape[1])
+            self.lo = self.hi = lo
+        first = min(self.hi, self.lo) if lo > self.lo else self.hi
+        if first < offset:
+            raise ValueError(
+                f"Advancing the training span needs feature rows from {first}, "
+                f"history starts at {offset}"
+            )
+        self.moments.push(X_full[self.hi - offset : hi - offset])
+        self.moments.pop(X_full[self.lo - offset : lo - offset])
+        self.lo, self.hi = lo, hi
+        return self.moments.to_scaler()
+
+
+def _standardize_into(out, X, scaler):
+    """Write (X - mean) / scale into the preallocated `out` (no temporaries)."""
+    np.subtract(X, scaler.mean_, out=out)
+    np.divide(out, scaler.scale_, out=out)
+    return out
+
+
+# -------------------------
+# Walk-forward 2-state HMM
+# -------------------------
+# Regime codes in the output arrays; labels live in the Categorical only
+REGIME_LABELS = ("risk_off", "risk_on")
+RISK_OFF, RISK_ON = 0, 1
+
+
+def _hmm_kwargs(n_states, max_iter, random_state):
+    return dict(
+        n_components=n_states,
+        covariance_type="diag",
+        n_iter=max_iter,
+        tol=1e-4,
+        random_state=random_state,
+        verbose=False,
+    )
+
+
+def _warm_start_hmm(prev_model, prev_scaler, scaler, max_iter, random_state, backend):
+    """HMM initialised from `prev_model`, re-expressed in the new scaler's units."""
+    n_states = prev_model.means_.shape[0]
+    hmm = make_hmm(
+        backend,
+        init_params="",
+        params="stmc",
+        **_hmm_kwargs(n_states, max_iter, random_state),
+    )
+    ratio = prev_scaler.scale_ / scaler.scale_
+    # EM drives startprob to one-hot on the window's first bar; carrying it
+    # over would pin zero entries forever, so it restarts from uniform
+    hmm.startprob_ = np.full(n_states, 1.0 / n_states)
+    hmm.transmat_ = prev_model.transmat_.copy()
+    hmm.means_ = (
+        prev_model.means_ * prev_scaler.scale_ + prev_scaler.mean_ - scaler.mean_
+    ) / scaler.scale_
+    hmm.covars_ = prev_model._covars_ * ratio**2
+    return hmm
+
+
+def _fit_best_hmm(X_train_z, n_states, n_init, max_iter, random_state, backend):
+    best_model = None
+    best_score = -np.inf
+    for seed in range(n_init):
+        hmm = make_hmm(
+            backend,
+            init_params="stmc",
+            params="stmc",
+            **_hmm_kwargs(n_states, max_iter, random_state + seed),
+        )
+        hmm.fit(X_train_z)
+        score = hmm.score(X_train_z)
+        if score > best_score:
+            best_model = hmm
+            best_score = score
+    return best_model
+
+
+def _refit_points(n, min_train_size, retrain_interval):
+    """Bars at which the walk-forward refits: the first scoreable bar, then
+    every `retrain_interval` bars."""
+    return range(max(min_train_size - 1, 0), n, retrain_interval)
+
+
+def _training_spans(X_full, refits, window, tracker=None, offset=0):
+    """Yield (t, lo, scaler) per refit; moments advance incrementally.
+
+    Run sequentially in the caller so serial and parallel modes standardise
+    with bit-identical scalers. Pass `tracker` to continue from a saved span;
+    `X_full` then may hold history rows offset.. only.
+    """
+    if tracker is None:
+        tracker = SpanMoments(X_full.shape[1])
+    for t in refits:
+        lo = 0 if window is None else max(0, t - window)
+        if lo < offset:
+            raise ValueError(
+                f"Refit at row {t} trains on feature rows from {lo}, "
+                f"history starts at {offset} (see required_history)"
+            )
+        yield t, lo, tracker.advance(X_full, lo, t, offset)
+
+
+def _fit_block(
+    X_train, scaler, n_states, n_init, max_iter, random_state, backend, out=None
+):
+    """Fit one refit block; top-level so process pools can pickle it."""
+    if out is None:
+        out = np.empty_like(X_train)
+    X_train_z = _standardize_into(out, X_train, scaler)
+    return _fit_best_hmm(X_train_z, n_states, n_init, max_iter, random_state, backend)
+
+
+def _risk_on_state(model):
+    # Risk-on = lower rv, higher ret (means are in standardised space)
+    mu = model.means_
+    return int((mu[0, 1] < mu[1, 1]) and (mu[0, 0] > mu[1, 0]))
+
+
+def _score_block(model, scaler, X_full, Z, t0, t1, state, p0, p1, regime):
+    """Score bars t0..t1-1 one at a time with a fixed model."""
+    risk_on_state = _risk_on_state(model)
+    for t in range(t0, t1):
+        # Row t lies past the training span, so its slot in Z is free
+        x_t_z = _standardize_into(Z[t : t + 1], X_full[t : t + 1], scaler)
+        post = model.predict_proba(x_t_z)[0]
+        z_t = int(np.argmax(post))
+        state[t] = z_t
+        p0[t] = post[0]
+        p1[t] = post[1]
+        regime[t] = RISK_ON if z_t == risk_on_state else RISK_OFF
+
+
+def _score_spans(X_full, spans, models, Z=None):
+    """Score every bar from the first refit on; each span's model covers the
+    bars up to the next refit. Returns (state, p_state0, p_state1, regime code)
+    arrays (see `_empty_scores`)."""
+    n = X_full.shape[0]
+    if Z is None:
+        Z = np.empty_like(X_full)
+    state, p0, p1, regime = _empty_scores(n)
+    ends = [t for t, _, _ in spans[1:]] + [n]
+    for (t, _, scaler), t_end, model in zip(spans, ends, models):
+        _score_block(model, scaler, X_full, Z, t, t_end, state, p0, p1, regime)
+    return state, p0, p1, regime
+
+
+def _walkforward_frame(index, state, p0, p1, regime):
+    """Typed output: nullable Int8 state, float32 posteriors, Categorical regime.
+
+    Unscored bars hold code -1, which becomes <NA> / NaN.
+    """
+    return pd.DataFrame(
+        {
+            "state": pd.arrays.IntegerArray(state, state < 0),
+            "p_state0": p0,
+            "p_state1": p1,
+            "regime": pd.Categorical.from_codes(regime, categories=REGIME_LABELS),
+        },
+        index=index,
+    )
+
+
+@dataclass
+class WalkForwardState:
+    """Where a walk-forward run stopped, enough to score later bars only.
+
+    Bars are scored one at a time with no filter recursion, so no posterior
+    needs carrying: the live model, its scaler and the training-span moments
+    fully determine every later bar.
+    """
+
+    params: Dict[str, Any]  # walk-forward arguments the state is valid for
+    position: int  # rows of the (dropna) feature frame consumed
+    last_index: Any  # index label of row position - 1
+    tracker: SpanMoments
+    last_fit_at: Optional[int] = None
+    last_lo: Optional[int] = None
+    model: Any = None
+    scaler: Optional[StandardScaler] = None
+
+    @property
+    def risk_on_state(self) -> Optional[int]:
+        return None if self.model is None else _risk_on_state(self.model)
+
+
+def save_walkforward_state(state, path):
+    """Pickle `state` atomically (write to a temp file, then rename)."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    return path
+
+
+def load_walkforward_state(path) -> WalkForwardState:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def required_history(state: WalkForwardState, n_rows) -> Optional[int]:
+    """First row of the feature history a resumed run up to `n_rows` rows
+    needs besides the new ones, or None when no refit falls due among them
+    (then the rows past `state.position` are enough)."""
+    p = state.params
+    refits = _refit_points(n_rows, p["min_train_size"], p["retrain_interval"])
+    t = next((t for t in refits if t >= state.position), None)
+    if t is None:
+        return None
+    lo = 0 if p["window"] is None else max(0, t - p["window"])
+    tracker = state.tracker
+    # The span moments move from [tracker.lo, tracker.hi) to [lo, t)
+    return lo if lo >= tracker.hi else min(lo, tracker.lo, tracker.hi)
+
+
+def walkforward_hmm_2state(
+    df,
+    cols=("ret", "rv_20d"),
+    n_states=2,
+    n_init=10,
+    max_iter=200,
+    min_train_size=252,
+    retrain_interval=20,
+    random_state=0,
+    backend="auto",
+    window=None,
+    warm_start=False,
+    n_jobs=1,
+    state: Optional[WalkForwardState] = None,
+    return_state=False,
+    checkpoint_path=None,
+    checkpoint_every=25,
+):
+    """Out-of-sample HMM regimes: refit every `retrain_interval` bars.
+
+    Each refit trains on X[:t] (expanding) or, with `window`, on the last
+    `window` bars X[t-window:t]. Scaler moments are kept incrementally as
+    bars enter and leave the training span, and the standardised span is
+    written into one buffer allocated up front.
+
+    With `warm_start`, every refit after the first runs a single EM fit
+    started from the previous model (means/covars mapped into the new
+    scaler's units) instead of `n_init` random restarts. EM statistics
+    depend on the current parameters and cannot be carried over, so a
+    fixed `window` plus `warm_start` is what keeps refit cost constant.
+
+    With `n_jobs > 1`, the refit dates are fixed up front and every refit
+    block is fitted in a process pool; bars are then scored sequentially.
+    Results are bit-identical to `n_jobs=1`. Not combinable with
+    `warm_start`, whose refits depend on one another.
+
+    `state` (from a previous call with `return_state=True`) resumes a run:
+    `df` must extend the history that produced it, and only rows past
+    `state.position` are scored and returned. Output matches a full run
+    over the whole history on those rows. `df` may also start later: with
+    only the new rows when no refit falls due among them, else from the row
+    `required_history` names. With `return_state`, returns (frame, state).
+
+    With `checkpoint_path`, the fitted models and the rows scored so far are
+    written there every `checkpoint_every` refits. A later call with the
+    same arguments and data resumes from it instead of refitting; the file
+    is removed once the run completes.
+    """
+    if window is not None and window < n_states:
+        raise ValueError(f"window must be at least n_states, got {window}")
+    if warm_start and n_jobs > 1:
+        raise ValueError("warm_start refits are sequential; use n_jobs=1")
+    params = dict(
+        cols=tuple(cols),
+        n_states=n_states,
+        n_init=n_init,
+        max_iter=max_iter,
+        min_train_size=min_train_size,
+        retrain_interval=retrain_interval,
+        random_state=random_state,
+        window=window,
+        warm_start=warm_start,
+    )
+    data = df.loc[:, cols].dropna()
+    X_full = np.ascontiguousarray(data.values, dtype=float)
+    n = X_full.shape[0]
+    offset = 0  # history row of data's first row
+    if state is None:
+        state = WalkForwardState(params, 0, None, SpanMoments(X_full.shape[1]))
+    else:
+        offset = _check_resume(state, params, data)
+        state = copy.deepcopy(state)
+    # Refit schedule in history rows; arrays and `start` in rows of `data`
+    start = state.position - offset
+    refits = [
+        t
+        for t in _refit_points(offset + n, min_train_size, retrain_interval)
+        if t >= state.position
+    ]
+    history_spans = list(_training_spans(X_full, refits, window, state.tracker, offset))
+    if state.model is not None:
+        # Bars before the first new refit stay with the saved model
+        history_spans.insert(0, (state.last_fit_at, state.last_lo, state.scaler))
+    spans = [(t - offset, lo - offset, scaler) for t, lo, scaler in history_spans]
+    models = [] if state.model is None else [state.model]
+    Z = np.empty_like(X_full)
+    ends = [t for t, _, _ in spans[1:]] + [n]
+    scored = _empty_scores(n)
+
+    n_done = 0
+    digest = hashlib.sha1(X_full.tobytes()).hexdigest() if checkpoint_path else None
+    ckpt = _load_checkpoint(checkpoint_path, params, data, digest, start)
+    if ckpt is not None:
+        models = ckpt["models"]
+        n_done = len(models)
+        for arr, saved in zip(scored, ckpt["scored"]):
+            arr[start : start + len(saved)] = saved
+
+    fit_args = (n_states, n_init, max_iter, random_state, backend)
+    parallel = n_jobs > 1 and len(models) < len(spans)
+    pool_ctx = (
+        mp.get_context("spawn").Pool(
+            processes=n_jobs, initializer=_init_worker, initargs=(X_full,)
+        )
+        if parallel
+        else contextlib.nullcontext()
+    )
+    with pool_ctx as pool:
+        fitted = _fit_models(
+            X_full, Z, spans, models, fit_args, warm_start, pool if parallel else None
+        )
+        for i in range(n_done, len(spans)):
+            if i == len(models):
+                models.append(next(fitted))
+            t, _, scaler = spans[i]
+            _score_block(models[i], scaler, X_full, Z, max(t, start), ends[i], *scored)
+            if (
+                checkpoint_path is not None
+                and (i + 1) % checkpoint_every == 0
+                and ends[i] < n
+            ):
+                _save_checkpoint(
+                    checkpoint_path,
+                    params,
+                    data,
+                    digest,
+                    start,
+                    models,
+                    scored,
+                    ends[i],
+                )
+    if checkpoint_path is not None and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    out = _walkforward_frame(data.index[start:], *(a[start:] for a in scored))
+    if not return_state:
+        return out
+    if spans:
+        state.last_fit_at, state.last_lo, state.scaler = history_spans[-1]
+        state.model = models[-1]
+    state.position = offset + n
+    state.last_index = data.index[-1] if n else state.last_index
+    return out, state
+
+
+def _empty_scores(n):
+    """(state, p_state0, p_state1, regime code) arrays; -1 / NaN = unscored."""
+    return (
+        np.full(n, -1, dtype=np.int8),
+        np.full(n, np.nan, dtype=np.float32),
+        np.full(n, np.nan, dtype=np.float32),
+        np.full(n, -1, dtype=np.int8),
+    )
+
+
+_WORKER_X: Optional[np.ndarray] = None
+
+
+def _init_worker(X_full):
+    # The feature matrix is shipped once per worker; tasks carry row bounds
+    global _WORKER_X
+    _WORKER_X = X_full
+
+
+def _fit_span_args(args):
+    lo, t, scaler, *fit_args = args
+    return _fit_block(_WORKER_X[lo:t], scaler, *fit_args)
+
+
+def _fit_models(X_full, Z, spans, models, fit_args, warm_start, pool=None):
+    """Yield models for spans[len(models):] in order, inline or from `pool`
+    (whose workers hold X_full, see `_init_worker`)."""
+    todo = spans[len(models) :]
+    if pool is not None:
+        yield from pool.imap(
+            _fit_span_args, [(lo, t, scaler) + fit_args for t, lo, scaler in todo]
+        )
+        return
+    n_states, n_init, max_iter, random_state, backend = fit_args
+    prev_model = models[-1] if models else None
+    prev_scaler = spans[len(models) - 1][2] if models else None
+    for t, lo, scaler in todo:
+        if warm_start and prev_model is not None:
+            X_train_z = _standardize_into(Z[lo:t], X_full[lo:t], scaler)
+            model = _warm_start_hmm(
+                prev_model, prev_scaler, scaler, max_iter, random_state, backend
+            ).fit(X_train_z)
+        else:
+            model = _fit_block(X_full[lo:t], scaler, *fit_args, out=Z[lo:t])
+        yield model
+        prev_model, prev_scaler = model, scaler
+
+
+def _save_checkpoint(path, params, data, digest, start, models, scored, position):
+    """Persist fitted models and the rows scored so far (atomic replace).
+
+    `digest` is the SHA-1 of the feature matrix, so a resume on edited data
+    (same length and last date) starts over.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    payload = {
+        "params": params,
+        "n_rows": len(data),
+        "last_index": data.index[-1],
+        "digest": digest,
+        "start": start,
+        "models": list(models),
+        "scored": tuple(a[start:position].copy() for a in scored),
+    }
+    return save_walkforward_state(payload, path)
+
+
+def _load_checkpoint(path, params, data, digest, start):
+    """Checkpoint payload if `path` holds one for this exact run, else None."""
+    if path is None or not os.path.exists(path):
+        return None
+    ckpt = load_walkforward_state(path)
+    same_run = (
+        ckpt["params"] == params
+        and ckpt["n_rows"] == len(data)
+        and ckpt["last_index"] == data.index[-1]
+        and ckpt.get("digest") == digest
+        and ckpt["start"] == start
+    )
+    return ckpt if same_run else None
+
+
+def _check_resume(state, params, data):
+    """History row of `data`'s first row: `data` either contains the state's
+    last row or starts after it."""
+    if state.params != params:
+        raise ValueError(
+            f"Walk-forward state was built with {state.params}, not {params}"
+        )
+    if not state.position:
+        return 0
+    if len(data) and data.index[0] > state.last_index:
+        return state.position
+    pos = data.index.searchsorted(state.last_index)
+    if pos >= len(data) or data.index[pos] != state.last_index or pos >= state.position:
+        raise ValueError(
+            "Feature history does not extend the history the state was built on"
+        )
+    return state.position - 1 - pos
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from regime_partitioning import hmm_kernels
+from regime_partitioning.fast_hmm import DiagGaussianHMM, make_hmm
+
+hmm = pytest.importorskip("hmmlearn.hmm")
+
+FIT_KWARGS = dict(
+    n_components=2, covariance_type="diag", n_iter=200, tol=1e-4, min_covar=1e-3
+)
+
+
+def _two_regime_series(n=1500, seed=0):
+    """Standardised (ret, rv) pairs from a persistent two-state chain."""
+    rng = np.random.default_rng(seed)
+    states = np.cumsum(rng.random(n) < 0.02) % 2
+    ret = rng.normal(0.0005 - 0.001 * states, 0.005 + 0.01 * states)
+    rv = 0.1 + 0.1 * states + rng.normal(0, 0.02, n)
+    X = np.column_stack([ret, rv])
+    return (X - X.mean(axis=0)) / X.std(axis=0)
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_fit_matches_hmmlearn(seed):
+    X = _two_regime_series(seed=seed)
+    ref = hmm.GaussianHMM(random_state=seed, **FIT_KWARGS).fit(X)
+    fast = DiagGaussianHMM(random_state=seed, **FIT_KWARGS).fit(X)
+
+    np.testing.assert_allclose(fast.startprob_, ref.startprob_, atol=1e-8)
+    np.testing.assert_allclose(fast.transmat_, ref.transmat_, rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(fast.means_, ref.means_, rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(fast.covars_, ref.covars_, rtol=1e-6, atol=1e-8)
+    assert fast.score(X) == pytest.approx(ref.score(X), rel=1e-9)
+    np.testing.assert_allclose(fast.predict_proba(X), ref.predict_proba(X), atol=1e-7)
+    np.testing.assert_array_equal(fast.predict(X), ref.predict(X))
+
+
+def test_kernels_match_hmmlearn_for_fixed_parameters():
+    X = _two_regime_series(n=800, seed=3)
+    ref = hmm.GaussianHMM(n_components=2, covariance_type="diag", init_params="")
+    ref.startprob_ = np.array([0.6, 0.4])
+    ref.transmat_ = np.array([[0.95, 0.05], [0.1, 0.9]])
+    ref.means_ = np.array([[0.3, -0.5], [-0.4, 1.2]])
+    covars = np.array([[0.8, 0.4], [1.5, 0.9]])
+    ref.covars_ = covars
+
+    log_b = hmm_kernels.log_emissions_diag(X, ref.means_, covars)
+    gamma, _, loglik = hmm_kernels.forward_backward(
+        log_b, ref.startprob_, ref.transmat_
+    )
+    ref_loglik, ref_gamma = ref.score_samples(X)
+    assert loglik == pytest.approx(ref_loglik, rel=1e-12)
+    np.testing.assert_allclose(gamma, ref_gamma, atol=1e-12)
+
+    logprob, path = hmm_kernels.viterbi(log_b, ref.startprob_, ref.transmat_)
+    ref_logprob, ref_path = ref.decode(X, algorithm="viterbi")
+    assert logprob == pytest.approx(ref_logprob, rel=1e-12)
+    np.testing.assert_array_equal(path, ref_path)
+
+
+def test_numpy_fallback_matches_loop_kernels():
+    X = _two_regime_series(n=200, seed=4)
+    means = np.array([[0.3, -0.5], [-0.4, 1.2]])
+    covars = np.array([[0.8, 0.4], [1.5, 0.9]])
+    startprob = np.array([0.5, 0.5])
+    transmat = np.array([[0.9, 0.1], [0.2, 0.8]])
+    log_b = hmm_kernels._log_emissions_np(X, means, covars)
+    np.testing.assert_allclose(
+        log_b, hmm_kernels._log_emissions_loop(X, means, covars), atol=1e-12
+    )
+    for a, b in zip(
+        hmm_kernels._forward_np(log_b, startprob, transmat),
+        hmm_kernels._forward_loop(log_b, startprob, transmat),
+    ):
+        np.testing.assert_allclose(a, b, rtol=1e-12)
+
+
+def test_make_hmm_backends():
+    assert isinstance(make_hmm("fast", n_components=2), DiagGaussianHMM)
+    assert isinstance(make_hmm("hmmlearn", n_components=2), hmm.GaussianHMM)
+    with pytest.raises(ValueError):
+        make_hmm("cuda")
@@ -1,149 +1,146 @@
+import json
+import multiprocessing as mp
 import os
 import sys
 from pathlib import Path
 import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals
 
 TRADING_UTILS_ROOT = Path("/home/matrillo/apps/jupyter-notebooks")
 if str(TRADING_UTILS_ROOT) not in sys.path:
     sys.path.insert(0, str(TRADING_UTILS_ROOT))
 
-from regime_partitioning.datasets import fx_datasets
-from regime_partitioning.processing import pelt_changepoints
-from trading_utils.get_forex_data import get_forex_data_by_pair
-from hmmlearn.hmm import GaussianHMM
-from sklearn.preprocessing import StandardScaler
-
-
-def compute_segment_ids(index, changepoints):
-    cps = sorted(changepoints)
-    segment_ids = []
-    current_segment = 0
-    cp_idx = 0
-    n_cps = len(cps)
-    current_cp = cps[cp_idx] if cp_idx < n_cps else None
-    for ts in index:
-        while current_cp is not None and ts > current_cp:
-            current_segment += 1
-            cp_idx += 1
-            current_cp = cps[cp_idx] if cp_idx < n_cps else None
-        segment_ids.append(current_segment)
-    return pd.Series(segment_ids, index=index)
-
-
-def label_macro_state(series, penalty, min_size=20, n_bins=3):
-    s = series.dropna()
-    if len(s) == 0:
-        return pd.Series(index=series.index, dtype="float64")
-    cps = pelt_changepoints(s, penalty=penalty, min_size=min_size)
-    seg_ids = compute_segment_ids(s.index, cps)
-    seg_means = s.groupby(seg_ids).mean()
-    probs = np.linspace(0.0, 1.0, n_bins + 1)[1:-1]
-    bins = np.quantile(seg_means.values, probs)
-    states = np.digitize(seg_means.values, bins)
-    mapping = {seg: state for seg, state in zip(seg_means.index, states)}
-    macro_clean = seg_ids.map(mapping)
-    macro = pd.Series(index=series.index, dtype="float64")
-    macro.loc[s.index] = macro_clean.values
-    return macro
-
-
-def walkforward_hmm_2state(
-    df,
-    cols=("ret", "rv_20d"),
-    n_states=2,
-    n_init=10,
-    max_iter=200,
-    min_train_size=252,
-    retrain_interval=20,
-    random_state=0,
-):
-    data = df.loc[:, cols].dropna()
-    if len(data) < min_train_size:
-        return pd.DataFrame(
-            index=data.index,
-            columns=["state", "p_state0", "p_state1", "regime"],
-        )
-    X_full = data.values.astype(float)
-    n = X_full.shape[0]
-    state = np.full(n, np.nan)
-    p0 = np.full(n, np.nan)
-    p1 = np.full(n, np.nan)
-    regime = np.array([""] * n, dtype=object)
-    current_model = None
-    current_scaler = None
-    last_fit_at = None
-    risk_on_state = None
-    for t in range(n):
-        if t + 1 < min_train_size:
-            continue
-        need_refit = (
-            current_model is None
-            or last_fit_at is None
-            or (t - last_fit_at) >= retrain_interval
+from regime_partitioning.feature_store import (
+    FEATURE_COLS,
+    attach_feature_store,
+    get_attached_store,
+    write_feature_store,
+)
+from regime_partitioning.processing import compute_segment_ids, label_macro_state
+from regime_partitioning.segments import SegmentIndex
+from regime_partitioning.price_sources import get_forex_data_by_pair
+from regime_partitioning.walkforward import (
+    load_walkforward_state,
+    required_history,
+    save_walkforward_state,
+    walkforward_hmm_2state,
+)
+
+# Walk-forward checkpoints and the export_all progress file live here
+CHECKPOINT_DIR = ".checkpoints"
+WALKFORWARD_COLS = ("ret", "rv_20d")
+# Calendar days of bars an update fetches before its first new bar, enough
+# to warm up the rolling features (rv_20d)
+TAIL_WARMUP_DAYS = 60
+
+
+def _load_fx_datasets():
+    # Imported lazily: building the datasets fetches prices and parses every
+    # macro CSV, which pool workers must not repeat.
+    from regime_partitioning.datasets import fx_datasets
+
+    return fx_datasets
+
+
+def _load_fx_tail(symbol, start_date, end_date):
+    """One symbol's dataset rows over [start_date, end_date], built through
+    the feature graph without touching the other pairs."""
+    from regime_partitioning.datasets import DATASET_FEATURES, fx_feature_builder
+
+    builder = fx_feature_builder(start_date, end_date)
+    return builder.frame(symbol, DATASET_FEATURES).dropna()
+
+
+def _update_tail(symbol, export_dir, end_date=None):
+    """Feature rows newer than a symbol's export, built from TAIL_WARMUP_DAYS
+    before its last bar up to `end_date` (default today); None without a
+    saved state."""
+    state_path = _state_path(symbol, export_dir)
+    if not os.path.exists(state_path):
+        return None
+    last_ts = load_walkforward_state(state_path)["last_timestamp"]
+    df_fx = _load_fx_tail(
+        symbol,
+        (last_ts - pd.Timedelta(days=TAIL_WARMUP_DAYS)).strftime("%Y-%m-%d"),
+        end_date or pd.Timestamp.today().strftime("%Y-%m-%d"),
+    )
+    return df_fx.loc[df_fx.index > last_ts]
+
+
+def _export_features(out_path, export_format, cols):
+    """Walk-forward feature rows (all of `cols` present) of an export."""
+    if export_format == "parquet":
+        df = pd.read_parquet(out_path, columns=list(cols))
+    else:
+        df = pd.read_csv(
+            out_path,
+            usecols=["datetime", *cols],
+            parse_dates=["datetime"],
+            index_col="datetime",
         )
-        if need_refit:
-            X_train = X_full[:t].astype(float)
-            scaler = StandardScaler().fit(X_train)
-            X_train_z = scaler.transform(X_train)
-            best_model = None
-            best_score = -np.inf
-            for seed in range(n_init):
-                hmm = GaussianHMM(
-                    n_components=n_states,
-                    covariance_type="diag",
-                    n_iter=max_iter,
-                    tol=1e-4,
-                    random_state=random_state + seed,
-                    init_params="stmc",
-                    params="stmc",
-                    verbose=False,
-                )
-                hmm.fit(X_train_z)
-                score = hmm.score(X_train_z)
-                if score > best_score:
-                    best_model = hmm
-                    best_score = score
-            mu = best_model.means_
-            risk_on = int((mu[0, 1] < mu[1, 1]) and (mu[0, 0] > mu[1, 0]))
-            risk_on_state = risk_on
-            current_model = best_model
-            current_scaler = scaler
-            last_fit_at = t
-        x_t = X_full[t : t + 1]
-        x_t_z = current_scaler.transform(x_t)
-        post = current_model.predict_proba(x_t_z)[0]
-        z_t = int(np.argmax(post))
-        state[t] = z_t
-        p0[t] = post[0]
-        p1[t] = post[1]
-        if risk_on_state is not None and z_t == risk_on_state:
-            regime[t] = "risk_on"
-        else:
-            regime[t] = "risk_off"
-    out = pd.DataFrame(
-        {
-            "state": state,
-            "p_state0": p0,
-            "p_state1": p1,
-            "regime": regime,
-        },
-        index=data.index,
+    return df.dropna()
+
+
+def _coded_labels(values, fmt):
+    """Categorical of `fmt.format(v)` over integer codes (missing -> -1)."""
+    codes = pd.Series(values).fillna(-1).to_numpy(dtype=np.int64)
+    uniq, inverse = np.unique(codes, return_inverse=True)
+    return pd.Categorical.from_codes(inverse, [fmt.format(v) for v in uniq])
+
+
+def _combine_labels(a, b, sep):
+    """Categorical "a{sep}b" built from category pairs, not per row."""
+    codes = a.codes.astype(np.int64) * len(b.categories) + b.codes
+    labels = [f"{x}{sep}{y}" for x in a.categories for y in b.categories]
+    return pd.Categorical.from_codes(codes, labels).remove_unused_categories()
+
+
+def _compose_regime_columns(df_reg):
+    for col in ("macro_yield_state", "macro_cpi_state"):
+        df_reg[col] = df_reg[col].astype("Int8")
+    macro = _combine_labels(
+        _coded_labels(df_reg["macro_yield_state"], "y{}"),
+        _coded_labels(df_reg["macro_cpi_state"], "c{}"),
+        "_",
     )
-    out.replace("", np.nan, inplace=True)
-    return out
+    vol = pd.Categorical(df_reg["regime"]).add_categories("unknown").fillna("unknown")
+    df_reg["macro_state"] = macro
+    df_reg["vol_state"] = vol
+    df_reg["final_regime"] = _combine_labels(macro, vol, "|")
+    return df_reg
+
+
+def _state_path(symbol, export_dir):
+    return os.path.join(export_dir, f"{symbol}_regime_state.pkl")
+
+
+def _segments_path(symbol, export_dir):
+    return os.path.join(export_dir, f"{symbol}_regime_segments.csv")
 
 
-def build_regime_dataset_for_symbol(symbol, export_dir):
-    ds = fx_datasets[symbol]
-    df_fx = ds["df_fx"].copy()
+def _checkpoint_path(symbol, export_dir):
+    return os.path.join(export_dir, CHECKPOINT_DIR, f"{symbol}_walkforward.pkl")
+
+
+def build_regime_dataset_for_symbol(
+    symbol, export_dir, df_fx=None, export_format="csv"
+):
+    if df_fx is None:
+        df_fx = _load_fx_datasets()[symbol]["df_fx"]
+    df_fx = df_fx.copy()
     s_yield = df_fx["rate_diff_2y"].dropna()
     s_cpi = df_fx["cpi_diff_core"].dropna()
     pen_yield = 3.0 * np.log(len(s_yield)) if len(s_yield) > 0 else 0.0
     pen_cpi = 3.0 * np.log(len(s_cpi)) if len(s_cpi) > 0 else 0.0
     macro_yield_state = label_macro_state(df_fx["rate_diff_2y"], penalty=pen_yield)
     macro_cpi_state = label_macro_state(df_fx["cpi_diff_core"], penalty=pen_cpi)
-    hmm_out = walkforward_hmm_2state(df_fx, cols=("ret", "rv_20d"))
+    hmm_out, wf_state = walkforward_hmm_2state(
+        df_fx,
+        cols=WALKFORWARD_COLS,
+        return_state=True,
+        checkpoint_path=_checkpoint_path(symbol, export_dir),
+    )
     df_reg = df_fx.join(
         [
             macro_yield_state.rename("macro_yield_state"),
@@ -152,11 +149,7 @@ def build_regime_dataset_for_symbol(symbol, export_dir):
         ],
         how="left",
     )
-    macro_yield_cat = df_reg["macro_yield_state"].fillna(-1).astype(int).astype(str)
-    macro_cpi_cat = df_reg["macro_cpi_state"].fillna(-1).astype(int).astype(str)
-    df_reg["macro_state"] = "y" + macro_yield_cat + "_c" + macro_cpi_cat
-    df_reg["vol_state"] = df_reg["regime"].fillna("unknown")
-    df_reg["final_regime"] = df_reg["macro_state"] + "|" + df_reg["vol_state"]
+    df_reg = _compose_regime_columns(df_reg)
     start_date = df_reg.index.min().strftime("%Y-%m-%d")
     end_date = df_reg.index.max().strftime("%Y-%m-%d")
     df_px = get_forex_data_by_pair(
@@ -168,16 +161,240 @@ def build_regime_dataset_for_symbol(symbol, export_dir):
     df_px = df_px.sort_index()
     df_full = df_px.join(df_reg, how="left")
     os.makedirs(export_dir, exist_ok=True)
-    out_path = os.path.join(export_dir, f"{symbol}_regime_ohlcv.csv")
-    df_full.to_csv(out_path, index_label="datetime")
+    out_path = write_regime_export(df_full, symbol, export_dir, export_format)
+    SegmentIndex.from_labels(df_full["final_regime"]).to_csv(
+        _segments_path(symbol, export_dir)
+    )
+    save_walkforward_state(
+        {
+            "walkforward": wf_state,
+            "last_timestamp": df_full.index.max(),
+            # Macro states of the last segment, carried onto appended bars
+            "macro_yield_state": macro_yield_state.dropna().iloc[-1:].tolist(),
+            "macro_cpi_state": macro_cpi_state.dropna().iloc[-1:].tolist(),
+            "export_format": export_format,
+        },
+        _state_path(symbol, export_dir),
+    )
+    return out_path
+
+
+def update_regime_dataset_for_symbol(
+    symbol, export_dir, df_fx=None, export_format="csv", end_date=None
+):
+    """Append bars newer than the last export instead of rebuilding it.
+
+    Resumes the walk-forward from the state saved next to the export, so
+    only new bars are scored (plus any refit falling due among them). Only
+    the rows of `df_fx` after the last export are used; without it, only this
+    symbol's features from shortly before the last export up to `end_date`
+    (default today) are built. Earlier feature rows are read back from the
+    export only when a refit needs them. Falls back to a full build (of
+    `df_fx`, which must then hold the whole history) when no state exists.
+
+    Limitation: PELT macro states are not re-run; appended bars inherit the
+    macro state of the last segment until the next full build, which may
+    place a changepoint among them and re-bin segment means.
+    """
+    state_path = _state_path(symbol, export_dir)
+    if not os.path.exists(state_path):
+        return build_regime_dataset_for_symbol(
+            symbol, export_dir, df_fx=df_fx, export_format=export_format
+        )
+    saved = load_walkforward_state(state_path)
+    if saved["export_format"] != export_format:
+        raise ValueError(
+            f"{symbol} export is {saved['export_format']}, not {export_format}"
+        )
+    last_ts = saved["last_timestamp"]
+    out_path = os.path.join(export_dir, f"{symbol}_regime_ohlcv.{export_format}")
+    if df_fx is None:
+        df_fx = _update_tail(symbol, export_dir, end_date)
+    df_fx = df_fx.loc[df_fx.index > last_ts]
+    if df_fx.empty:
+        return out_path
+    df_wf = df_fx
+    wf = saved["walkforward"]
+    need = required_history(
+        wf, wf.position + len(df_fx.dropna(subset=WALKFORWARD_COLS))
+    )
+    if need is not None:
+        history = _export_features(out_path, export_format, WALKFORWARD_COLS)
+        if len(history) != wf.position:
+            raise ValueError(
+                f"{symbol} export holds {len(history)} feature rows, "
+                f"walk-forward state {wf.position}; rebuild it"
+            )
+        df_wf = pd.concat([history.iloc[need:], df_fx.loc[:, WALKFORWARD_COLS]])
+    hmm_new, wf_state = walkforward_hmm_2state(
+        df_wf,
+        cols=WALKFORWARD_COLS,
+        state=saved["walkforward"],
+        return_state=True,
+        checkpoint_path=_checkpoint_path(symbol, export_dir),
+    )
+    df_reg = df_fx.loc[df_fx.index > last_ts].copy()
+    for col, key in (
+        ("rate_diff_2y", "macro_yield_state"),
+        ("cpi_diff_core", "macro_cpi_state"),
+    ):
+        last = saved[key][0] if saved[key] else np.nan
+        df_reg[key] = pd.Series(last, index=df_reg.index).where(df_reg[col].notna())
+    df_reg = _compose_regime_columns(df_reg.join(hmm_new, how="left"))
+    if df_reg.empty:
+        return out_path
+    df_px = get_forex_data_by_pair(
+        symbol=symbol,
+        start_date=(last_ts + pd.Timedelta(days=1)).strftime("%Y-%m-%d"),
+        end_date=df_reg.index.max().strftime("%Y-%m-%d"),
+        granularity="D",
+    )
+    df_new = df_px.sort_index().join(df_reg, how="left")
+    df_new = df_new.loc[df_new.index > last_ts]
+    append_regime_export(df_new, out_path, export_format)
+    segments_path = _segments_path(symbol, export_dir)
+    if os.path.exists(segments_path):
+        segments = SegmentIndex.read_csv(segments_path)
+        segments.extend(df_new["final_regime"]).to_csv(segments_path)
+    saved.update(walkforward=wf_state, last_timestamp=df_new.index.max())
+    save_walkforward_state(saved, state_path)
+    return out_path
+
+
+def append_regime_export(df_new, out_path, export_format="csv"):
+    """Append rows to an export; CSV appends in place, Parquet is rewritten."""
+    if export_format == "csv":
+        columns = pd.read_csv(out_path, nrows=0).columns[1:]
+        df_new.reindex(columns=columns).to_csv(out_path, mode="a", header=False)
+    elif export_format == "parquet":
+        # Parquet files are immutable; rewrite with the new row group appended
+        df_old = pd.read_parquet(out_path)
+        df_new = df_new.rename_axis("datetime").reindex(columns=df_old.columns)
+        df_all = pd.concat([df_old, df_new])
+        # concat falls back to object when label categories differ; merge them
+        for col in df_old.columns:
+            if isinstance(df_old[col].dtype, pd.CategoricalDtype):
+                df_all[col] = union_categoricals(
+                    [df_old[col].values, pd.Categorical(df_new[col])]
+                )
+        df_all.to_parquet(out_path)
+    else:
+        raise ValueError(f"Unknown export_format: {export_format}")
+    return out_path
+
+
+def write_regime_export(df_full, symbol, export_dir, export_format="csv"):
+    """Write an export as CSV or as Parquet (columnar; enables date/column pushdown)."""
+    if export_format == "csv":
+        out_path = os.path.join(export_dir, f"{symbol}_regime_ohlcv.csv")
+        df_full.to_csv(out_path, index_label="datetime")
+    elif export_format == "parquet":
+        out_path = os.path.join(export_dir, f"{symbol}_regime_ohlcv.parquet")
+        df_full.rename_axis("datetime").to_parquet(out_path)
+    else:
+        raise ValueError(f"Unknown export_format: {export_format}")
     return out_path
 
 
+def _build_from_store(symbol, export_dir, export_format="csv", update=False):
+    df_fx = get_attached_store().frame(symbol)
+    build = (
+        update_regime_dataset_for_symbol if update else build_regime_dataset_for_symbol
+    )
+    return symbol, build(symbol, export_dir, df_fx=df_fx, export_format=export_format)
+
+
+def _load_completed(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _mark_completed(path, completed, symbol, out_path):
+    completed[symbol] = out_path
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(completed, f, indent=2)
+    os.replace(tmp, path)
+
+
+def export_all(
+    export_dir,
+    symbols=None,
+    n_workers=1,
+    export_format="csv",
+    update=False,
+    resume=False,
+):
+    """Export every symbol; with n_workers > 1 workers share a memory-mapped store.
+
+    `symbols` defaults to every pair of `FX_PAIRS`. With `update`, existing
+    exports are extended with new bars only: just their recent features are
+    built (and shared with workers), and the full datasets only for symbols
+    without an export yet. Finished symbols are recorded under
+    `{export_dir}/.checkpoints`; with `resume`, a rerun after a crash skips
+    them, and symbols cut off mid walk-forward continue from their last
+    walk-forward checkpoint either way.
+    """
+    from regime_partitioning.datasets import FX_PAIRS
+
+    symbols = list(symbols or FX_PAIRS)
+    os.makedirs(os.path.join(export_dir, CHECKPOINT_DIR), exist_ok=True)
+    done_path = os.path.join(export_dir, CHECKPOINT_DIR, "export_all.json")
+    completed = _load_completed(done_path) if resume else {}
+    todo = [sym for sym in symbols if sym not in completed]
+    build = (
+        update_regime_dataset_for_symbol if update else build_regime_dataset_for_symbol
+    )
+    if n_workers <= 1:
+        for sym in todo:
+            out_path = build(sym, export_dir, export_format=export_format)
+            _mark_completed(done_path, completed, sym, out_path)
+    elif todo:
+        store_dir = os.path.join(export_dir, ".feature_store")
+        frames = {}
+        for sym in todo:
+            tail = _update_tail(sym, export_dir) if update else None
+            frames[sym] = (
+                tail if tail is not None else _load_fx_datasets()[sym]["df_fx"]
+            )
+        write_feature_store(store_dir, frames, cols=FEATURE_COLS)
+        # spawn keeps workers from inheriting the parent's dataset frames
+        ctx = mp.get_context("spawn")
+        with ctx.Pool(
+            processes=n_workers,
+            initializer=attach_feature_store,
+            initargs=(store_dir,),
+        ) as pool:
+            for sym, out_path in pool.imap_unordered(
+                _build_from_store_args,
+                [(sym, export_dir, export_format, update) for sym in todo],
+            ):
+                _mark_completed(done_path, completed, sym, out_path)
+    if os.path.exists(done_path):
+        os.remove(done_path)
+    return [completed[sym] for sym in symbols]
+
+
+def _build_from_store_args(args):
+    return _build_from_store(*args)
+
+
 def main():
     project_root = os.path.dirname(os.path.abspath(__file__))
     export_dir = os.path.join(project_root, "exports", "forex")
-    for symbol in fx_datasets.keys():
-        build_regime_dataset_for_symbol(symbol, export_dir)
+    n_workers = int(os.environ.get("REGIME_EXPORT_WORKERS", "1"))
+    export_format = os.environ.get("REGIME_EXPORT_FORMAT", "csv")
+    update = os.environ.get("REGIME_EXPORT_MODE", "full") == "update"
+    resume = os.environ.get("REGIME_EXPORT_RESUME", "") not in ("", "0")
+    export_all(
+        export_dir,
+        n_workers=n_workers,
+        export_format=export_format,
+        update=update,
+        resume=resume,
+    )
 
 
 if __name__ == "__main__":
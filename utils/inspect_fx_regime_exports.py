@@ -1,16 +1,20 @@
 from pathlib import Path
-from typing import Dict, List, Optional
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import numpy as np
 import matplotlib.dates as mdates
 import matplotlib.pyplot as plt
 from matplotlib import colors as mcolors
+from matplotlib.collections import LineCollection, PolyCollection
 from matplotlib.patches import Patch
 import pandas as pd
 from bokeh.io import output_notebook, show
-from bokeh.models import BoxAnnotation, DatetimeTickFormatter
+from bokeh.models import ColumnDataSource, DatetimeTickFormatter
 from bokeh.plotting import figure
 
+from regime_partitioning.segments import SegmentIndex
+
 
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 EXPORT_DIR = PROJECT_ROOT / "exports" / "forex"
@@ -23,23 +27,129 @@ INSPECT_SYMBOLS: List[str] = [
 ]
 
 
-def load_regime_csv(symbol: str) -> pd.DataFrame:
-    """Load a regime-labelled OHLCV CSV for a given symbol."""
-    path = EXPORT_DIR / f"{symbol}_regime_ohlcv.csv"
-    if not path.exists():
-        raise FileNotFoundError(f"CSV not found for symbol {symbol}: {path}")
+# Plot functions only need these columns from an export
+PLOT_COLUMNS: List[str] = [
+    "open",
+    "high",
+    "low",
+    "close",
+    "macro_state",
+    "vol_state",
+    "final_regime",
+]
+
+# path -> (mtime_ns, size, frame); entries are dropped when the file changes
+_FRAME_CACHE: Dict[Path, Tuple[int, int, pd.DataFrame]] = {}
+_SEGMENT_CACHE: Dict[Path, Tuple[int, int, SegmentIndex]] = {}
 
+
+def _export_path(symbol: str) -> Path:
+    """Prefer the columnar export when both formats exist."""
+    parquet = EXPORT_DIR / f"{symbol}_regime_ohlcv.parquet"
+    if parquet.exists():
+        return parquet
+    return EXPORT_DIR / f"{symbol}_regime_ohlcv.csv"
+
+
+def _read_cached_csv(path: Path) -> pd.DataFrame:
+    stat = path.stat()
+    cached = _FRAME_CACHE.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
     df = pd.read_csv(path, parse_dates=["datetime"])
     df = df.set_index("datetime").sort_index()
+    _FRAME_CACHE[path] = (stat.st_mtime_ns, stat.st_size, df)
+    return df
+
+
+def load_regime_frame(
+    symbol: str,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    columns: Optional[List[str]] = None,
+) -> pd.DataFrame:
+    """Load a date window of a regime export, reading as little as possible.
+
+    Parquet exports push the date range and column selection down to the
+    reader, skipping requested columns the file lacks; CSV exports are parsed
+    once per file version (mtime/size) and sliced from the cache.
+    """
+    path = _export_path(symbol)
+    if not path.exists():
+        raise FileNotFoundError(f"No regime export for symbol {symbol}: {path}")
+
+    if path.suffix == ".parquet":
+        filters = []
+        if start_date is not None:
+            filters.append(("datetime", ">=", pd.Timestamp(start_date)))
+        if end_date is not None:
+            # Pad by a day so date-only bounds keep intraday bars; the exact
+            # label-based slice below trims the excess.
+            filters.append(
+                ("datetime", "<", pd.Timestamp(end_date) + pd.Timedelta(days=1))
+            )
+        if columns is not None:
+            import pyarrow.parquet as pq
+
+            names = set(pq.read_schema(path).names)
+            columns = [c for c in columns if c in names]
+        df = pd.read_parquet(path, columns=columns, filters=filters or None)
+        df = df.sort_index()
+    else:
+        df = _read_cached_csv(path)
+        if columns is not None:
+            df = df[[c for c in columns if c in df.columns]]
+
+    if start_date is not None or end_date is not None:
+        df = df.loc[start_date:end_date]
     return df
 
 
-REGIME_DF: Dict[str, pd.DataFrame] = {}
-for sym in INSPECT_SYMBOLS:
-    try:
-        REGIME_DF[sym] = load_regime_csv(sym)
-    except FileNotFoundError as e:
-        print(e)
+def load_regime_csv(symbol: str) -> pd.DataFrame:
+    """Load a regime-labelled OHLCV export for a given symbol."""
+    return load_regime_frame(symbol)
+
+
+def load_regime_segments(symbol: str) -> SegmentIndex:
+    """Load the final_regime segment table written next to an export.
+
+    Answers "regime at t" (`.regime_at`, `.at`) and "segments of a regime
+    between two dates" (`.between`) by binary search over segment starts.
+    """
+    path = EXPORT_DIR / f"{symbol}_regime_segments.csv"
+    if not path.exists():
+        raise FileNotFoundError(f"Segments not found for symbol {symbol}: {path}")
+    stat = path.stat()
+    cached = _SEGMENT_CACHE.get(path)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+    segments = SegmentIndex.read_csv(path)
+    _SEGMENT_CACHE[path] = (stat.st_mtime_ns, stat.st_size, segments)
+    return segments
+
+
+class _LazyRegimeFrames(Mapping):
+    """Read-only mapping over INSPECT_SYMBOLS that loads exports on first access."""
+
+    def __init__(self, symbols: List[str]):
+        self._symbols = symbols
+
+    def __contains__(self, symbol) -> bool:
+        return symbol in self._symbols and _export_path(symbol).exists()
+
+    def __getitem__(self, symbol: str) -> pd.DataFrame:
+        if symbol not in self:
+            raise KeyError(symbol)
+        return load_regime_frame(symbol)
+
+    def __iter__(self) -> Iterator[str]:
+        return (sym for sym in self._symbols if sym in self)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+REGIME_DF: Mapping[str, pd.DataFrame] = _LazyRegimeFrames(INSPECT_SYMBOLS)
 
 
 def _get_regime_palette(regimes: List[str]) -> Dict[str, str]:
@@ -54,6 +164,39 @@ def _get_regime_palette(regimes: List[str]) -> Dict[str, str]:
     return palette
 
 
+def _fill_unknown(reg_series: pd.Series) -> pd.Series:
+    """Mark unlabelled bars "unknown" (Categorical labels need the category first)."""
+    if isinstance(reg_series.dtype, pd.CategoricalDtype):
+        if "unknown" not in reg_series.cat.categories:
+            reg_series = reg_series.cat.add_categories("unknown")
+    return reg_series.fillna("unknown")
+
+
+def _regime_runs(reg_series: pd.Series):
+    """Run-length encode a regime series.
+
+    Returns (starts, ends, labels): each run spans from its first timestamp to
+    the first timestamp of the next run (the last run ends at the last bar).
+    """
+    values = reg_series.to_numpy()
+    index = reg_series.index
+    if len(values) == 0:
+        return index[:0], index[:0], values[:0]
+    flips = np.flatnonzero(values[1:] != values[:-1]) + 1
+    start_pos = np.concatenate(([0], flips))
+    end_pos = np.concatenate((flips, [len(values) - 1]))
+    return index[start_pos], index[end_pos], values[start_pos]
+
+
+def _bar_width(x: np.ndarray, default: float) -> float:
+    """Candle width as ~70% of the median bar spacing."""
+    if len(x) > 1:
+        spacing = np.median(np.diff(x))
+        if np.isfinite(spacing) and spacing > 0:
+            return spacing * 0.7
+    return default
+
+
 def plot_regime_candles(
     symbol: str,
     start_date: Optional[str] = None,
@@ -75,13 +218,7 @@ def plot_regime_candles(
             f"Symbol {symbol} not loaded. Loaded symbols: {sorted(REGIME_DF.keys())}"
         )
 
-    df = REGIME_DF[symbol]
-
-    # Slice by date range
-    if start_date is not None:
-        df = df.loc[start_date:]
-    if end_date is not None:
-        df = df.loc[:end_date]
+    df = load_regime_frame(symbol, start_date, end_date, columns=PLOT_COLUMNS)
 
     if df.empty:
         print(f"No data for {symbol} in the given date range.")
@@ -123,46 +260,60 @@ def plot_regime_candles(
 
     # Convert dates to matplotlib's numeric format
     x = mdates.date2num(px.index.to_pydatetime())
+    o, h, l, c = (px[col].to_numpy() for col in price_cols)
+    colors = np.where(c >= o, "green", "red")
 
     fig, ax = plt.subplots(figsize=(12, 6))
 
-    # Simple candlestick drawing: wick + thick body line
-    for xi, (idx, row) in zip(x, px.iterrows()):
-        o, h, l, c = row["open"], row["high"], row["low"], row["close"]
-        color = "green" if c >= o else "red"
-        # Wick
-        ax.vlines(xi, l, h, color=color, linewidth=1)
-        # Body (thicker line between open and close)
-        ax.vlines(xi, o, c, color=color, linewidth=4)
+    # Candlesticks as two collections: one for all wicks, one for all bodies
+    wicks = np.stack([np.column_stack([x, l]), np.column_stack([x, h])], axis=1)
+    ax.add_collection(LineCollection(wicks, colors=colors, linewidths=1))
+    half = _bar_width(x, default=0.7) / 2
+    body_lo = np.minimum(o, c)
+    body_hi = np.maximum(o, c)
+    bodies = np.stack(
+        [
+            np.column_stack([x - half, body_lo]),
+            np.column_stack([x - half, body_hi]),
+            np.column_stack([x + half, body_hi]),
+            np.column_stack([x + half, body_lo]),
+        ],
+        axis=1,
+    )
+    ax.add_collection(
+        PolyCollection(bodies, facecolors=colors, edgecolors=colors, linewidths=1)
+    )
+    ax.autoscale_view()
 
-    # Regime shading based on final_regime
+    # Regime shading based on final_regime: one collection per regime
     if "final_regime" in df.columns:
-        reg_series = df["final_regime"].fillna("unknown")
+        reg_series = _fill_unknown(df["final_regime"])
         unique_regimes = sorted(reg_series.unique().tolist())
         palette = _get_regime_palette(unique_regimes)
 
-        current_reg = None
-        segment_start = None
-
-        for ts, reg in reg_series.items():
-            if current_reg is None:
-                current_reg = reg
-                segment_start = ts
-            elif reg != current_reg:
-                # Shade previous segment
-                ax.axvspan(
-                    segment_start, ts, color=palette.get(current_reg, "0.9"), alpha=0.12
+        starts, ends, labels = _regime_runs(reg_series)
+        x0 = mdates.date2num(starts.to_pydatetime())
+        x1 = mdates.date2num(ends.to_pydatetime())
+        for reg in unique_regimes:
+            sel = labels == reg
+            spans = np.stack(
+                [
+                    np.column_stack([x0[sel], np.zeros(sel.sum())]),
+                    np.column_stack([x0[sel], np.ones(sel.sum())]),
+                    np.column_stack([x1[sel], np.ones(sel.sum())]),
+                    np.column_stack([x1[sel], np.zeros(sel.sum())]),
+                ],
+                axis=1,
+            )
+            ax.add_collection(
+                PolyCollection(
+                    spans,
+                    facecolors=palette.get(reg, "0.9"),
+                    edgecolors="none",
+                    alpha=0.12,
+                    transform=ax.get_xaxis_transform(),
+                    zorder=0,
                 )
-                current_reg = reg
-                segment_start = ts
-
-        # Shade last segment
-        if current_reg is not None and segment_start is not None:
-            ax.axvspan(
-                segment_start,
-                reg_series.index[-1],
-                color=palette.get(current_reg, "0.9"),
-                alpha=0.12,
             )
 
         # Legend mapping regime label -> shading color
@@ -184,6 +335,7 @@ def plot_regime_candles(
                 borderaxespad=0.0,
             )
 
+    ax.xaxis_date()
     ax.set_title(f"{symbol} with regimes ({start_date} to {end_date})")
     ax.set_xlabel("Date")
     ax.set_ylabel("Price")
@@ -194,10 +346,196 @@ def plot_regime_candles(
     plt.show()
 
 
+def build_ohlc_pyramid(
+    px: pd.DataFrame,
+    regimes: Optional[pd.Series] = None,
+    factor: int = 4,
+    min_bars: int = 500,
+) -> List[Dict[str, np.ndarray]]:
+    """Precompute OHLC levels, each aggregating `factor` buckets of the level below.
+
+    Level 0 holds the raw bars; aggregation stops once a level has at most
+    `min_bars` buckets. Every level keeps open/high/low/close, the bucket
+    start/end timestamps and, when `regimes` is given, the dominant regime
+    label per bucket (counts are carried up so dominance is exact).
+    """
+    t = px.index.to_numpy(dtype="datetime64[ns]")
+    level = {
+        "start": t,
+        "end": t,
+        "open": px["open"].to_numpy(dtype=float),
+        "high": px["high"].to_numpy(dtype=float),
+        "low": px["low"].to_numpy(dtype=float),
+        "close": px["close"].to_numpy(dtype=float),
+    }
+    categories = None
+    counts = None
+    if regimes is not None:
+        codes, categories = pd.factorize(_fill_unknown(regimes.reindex(px.index)))
+        level["regime"] = np.asarray(categories)[codes]
+    levels = [level]
+
+    while len(levels[-1]["start"]) > max(min_bars, 1):
+        prev = levels[-1]
+        n_prev = len(prev["start"])
+        bounds = np.arange(0, n_prev, factor)
+        last = np.minimum(bounds + factor, n_prev) - 1
+        nxt = {
+            "start": prev["start"][bounds],
+            "end": prev["end"][last],
+            "open": prev["open"][bounds],
+            "high": np.maximum.reduceat(prev["high"], bounds),
+            "low": np.minimum.reduceat(prev["low"], bounds),
+            "close": prev["close"][last],
+        }
+        if categories is not None:
+            k = len(categories)
+            if counts is None:
+                # First aggregation: bincount on raw codes avoids a one-hot matrix
+                bucket = np.arange(n_prev) // factor
+                counts = (
+                    np.bincount(bucket * k + codes, minlength=len(bounds) * k)
+                    .reshape(len(bounds), k)
+                    .astype(np.int32)
+                )
+            else:
+                counts = np.add.reduceat(counts, bounds, axis=0)
+            nxt["regime"] = np.asarray(categories)[counts.argmax(axis=1)]
+        levels.append(nxt)
+    return levels
+
+
+def lod_window(
+    pyramid: List[Dict[str, np.ndarray]],
+    start=None,
+    end=None,
+    target_bars: int = 2000,
+) -> Dict[str, np.ndarray]:
+    """Slice of the finest pyramid level showing <= target_bars buckets in [start, end]."""
+    lo_t = np.datetime64(pd.Timestamp(start), "ns") if start is not None else None
+    hi_t = np.datetime64(pd.Timestamp(end), "ns") if end is not None else None
+    for level in pyramid:
+        starts = level["start"]
+        lo = 0 if lo_t is None else int(np.searchsorted(level["end"], lo_t, "left"))
+        hi = (
+            len(starts) if hi_t is None else int(np.searchsorted(starts, hi_t, "right"))
+        )
+        if hi - lo <= target_bars or level is pyramid[-1]:
+            break
+    return {key: arr[lo:hi] for key, arr in level.items()}
+
+
+def _lod_sources(window: Dict[str, np.ndarray], regimes: List[str]):
+    """Column data for the candle source and one vstrip source per regime."""
+    x = window["start"]
+    x_ms = x.astype("datetime64[ms]").astype(np.int64)
+    width_ms = _bar_width(x_ms.astype(float), default=12 * 60 * 60 * 1000)
+    candles = {
+        "datetime": x,
+        "open": window["open"],
+        "high": window["high"],
+        "low": window["low"],
+        "close": window["close"],
+        "color": np.where(window["close"] >= window["open"], "green", "red"),
+        "width": np.full(len(x), width_ms),
+    }
+    bands = {reg: {"left": x[:0], "right": x[:0]} for reg in regimes}
+    if "regime" in window and len(x):
+        starts, _, labels = _regime_runs(pd.Series(window["regime"], index=x))
+        # Each run ends where the next begins; the last ends with its bucket
+        rights = np.concatenate((starts[1:].to_numpy(), window["end"][-1:]))
+        lefts = starts.to_numpy()
+        for reg in regimes:
+            sel = labels == reg
+            bands[reg] = {"left": lefts[sel], "right": rights[sel]}
+    return candles, bands
+
+
+def _regime_lod_app(px, reg_series, title, target_bars):
+    """Bokeh app that re-aggregates candles and bands after every zoom/pan."""
+    from bokeh.events import RangesUpdate
+
+    unique_regimes = (
+        sorted(reg_series.unique().tolist()) if reg_series is not None else []
+    )
+    palette = _get_regime_palette(unique_regimes)
+    pyramid = build_ohlc_pyramid(px, reg_series, min_bars=target_bars)
+
+    def app(doc):
+        candles, bands = _lod_sources(
+            lod_window(pyramid, target_bars=target_bars), unique_regimes
+        )
+        candle_src = ColumnDataSource(candles)
+        band_srcs = {reg: ColumnDataSource(bands[reg]) for reg in unique_regimes}
+
+        p = figure(
+            x_axis_type="datetime",
+            width=950,
+            height=450,
+            title=title,
+            tools="pan,wheel_zoom,box_zoom,reset,save",
+            active_drag="pan",
+            active_scroll="wheel_zoom",
+        )
+        p.segment(
+            x0="datetime",
+            y0="high",
+            x1="datetime",
+            y1="low",
+            color="color",
+            source=candle_src,
+        )
+        p.vbar(
+            x="datetime",
+            width="width",
+            top="open",
+            bottom="close",
+            fill_color="color",
+            line_color="color",
+            source=candle_src,
+        )
+        for reg in unique_regimes:
+            p.vstrip(
+                x0="left",
+                x1="right",
+                source=band_srcs[reg],
+                fill_color=palette.get(reg, "lightgray"),
+                fill_alpha=0.12,
+                line_alpha=0.0,
+                legend_label=reg,
+                level="underlay",
+            )
+        if unique_regimes:
+            p.legend.title = "Final regimes"
+            p.legend.location = "top_left"
+            p.legend.click_policy = "hide"
+
+        def on_ranges_update(event):
+            # Range bounds arrive as epoch milliseconds
+            window = lod_window(
+                pyramid,
+                start=pd.Timestamp(event.x0, unit="ms"),
+                end=pd.Timestamp(event.x1, unit="ms"),
+                target_bars=target_bars,
+            )
+            candles, bands = _lod_sources(window, unique_regimes)
+            candle_src.data = candles
+            for reg in unique_regimes:
+                band_srcs[reg].data = bands[reg]
+
+        p.on_event(RangesUpdate, on_ranges_update)
+        p.xaxis.formatter = DatetimeTickFormatter(days="%Y-%m-%d")
+        p.xaxis.major_label_orientation = 0.8
+        doc.add_root(p)
+
+    return app
+
+
 def plot_regime_candles_bokeh(
     symbol: str,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
+    target_bars: Optional[int] = None,
 ) -> None:
     """Interactive candlestick plot with regime shading using Bokeh.
 
@@ -209,21 +547,16 @@ def plot_regime_candles_bokeh(
         Start date (inclusive), e.g. "2020-01-01".
     end_date : str, optional
         End date (inclusive), e.g. "2021-06-30".
+    target_bars : int, optional
+        If set, serve a level-of-detail chart: candles are aggregated
+        server-side to at most this many buckets for the visible range and
+        re-aggregated after each zoom/pan (requires a live kernel).
     """
 
     # Ensure Bokeh renders in the notebook
     output_notebook()
 
-    if symbol in REGIME_DF:
-        df = REGIME_DF[symbol]
-    else:
-        df = load_regime_csv(symbol)
-
-    # Slice by date range
-    if start_date is not None:
-        df = df.loc[start_date:]
-    if end_date is not None:
-        df = df.loc[:end_date]
+    df = load_regime_frame(symbol, start_date, end_date, columns=PLOT_COLUMNS)
 
     if df.empty:
         print(f"No data for {symbol} in the given date range.")
@@ -262,6 +595,14 @@ def plot_regime_candles_bokeh(
         print("No OHLC data to plot.")
         return
 
+    if target_bars is not None:
+        reg_series = (
+            _fill_unknown(df["final_regime"]) if "final_regime" in df.columns else None
+        )
+        title = f"{symbol} with regimes ({start_date} to {end_date})"
+        show(_regime_lod_app(px, reg_series, title, target_bars))
+        return
+
     # Bokeh's ColumnDataSource will reset the index, so avoid having both
     # an index named 'datetime' and a 'datetime' column at the same time.
     df_plot = px.copy().reset_index()
@@ -314,53 +655,23 @@ def plot_regime_candles_bokeh(
 
     # Regime shading based on final_regime
     if "final_regime" in df.columns:
-        reg_series = df["final_regime"].fillna("unknown")
+        reg_series = _fill_unknown(df["final_regime"])
         unique_regimes = sorted(reg_series.unique().tolist())
         palette = _get_regime_palette(unique_regimes)
 
-        current_reg = None
-        segment_start = None
-
-        for ts, reg in reg_series.items():
-            if current_reg is None:
-                current_reg = reg
-                segment_start = ts
-            elif reg != current_reg:
-                box = BoxAnnotation(
-                    left=segment_start,
-                    right=ts,
-                    fill_color=palette.get(current_reg, "lightgray"),
-                    fill_alpha=0.12,
-                    line_alpha=0.0,
-                )
-                p.add_layout(box)
-                current_reg = reg
-                segment_start = ts
-
-        if current_reg is not None and segment_start is not None:
-            box = BoxAnnotation(
-                left=segment_start,
-                right=reg_series.index[-1],
-                fill_color=palette.get(current_reg, "lightgray"),
+        # One vstrip glyph per regime covering all of its runs
+        starts, ends, labels = _regime_runs(reg_series)
+        for reg in unique_regimes:
+            sel = labels == reg
+            p.vstrip(
+                x0="left",
+                x1="right",
+                source=ColumnDataSource({"left": starts[sel], "right": ends[sel]}),
+                fill_color=palette.get(reg, "lightgray"),
                 fill_alpha=0.12,
                 line_alpha=0.0,
-            )
-            p.add_layout(box)
-
-        # Simple legend using small markers for each regime color
-        y_min = px["low"].min()
-        y_max = px["high"].max()
-        y_span = y_max - y_min if y_max > y_min else 1.0
-        x_ref = df_plot["datetime"].min()
-
-        for i, reg in enumerate(unique_regimes):
-            p.circle(
-                x=[x_ref],
-                y=[y_max + (i + 1) * 0.02 * y_span],
-                size=8,
-                color=palette.get(reg, "lightgray"),
-                alpha=0.9,
                 legend_label=reg,
+                level="underlay",
             )
 
         p.legend.title = "Final regimes"